@@ -0,0 +1,228 @@
+"""Artifacts saved between the pipeline stages
+
+Every file that goes into 'data/pre', 'data/process' or 'data/interim' is
+saved and loaded through this module. The format used is chosen by the file
+extension:
+
+    .pkl    a pickle file, good for any python object (dicts, lists, ...)
+    .cols   a directory with one NumPy .npy file per column, only for
+            DataFrames. Columns can be loaded separately and memory-mapped.
+
+Both formats are stamped with a schema version, so that a stage can refuse
+to read an artifact written by an incompatible version of the code.
+
+New formats can be plugged in with `register_format`.
+"""
+import json
+import os
+import pickle
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from src.profiling import count_rows
+
+
+SCHEMA_VERSION = 1
+
+
+# pickle
+
+class PickleFormat(object):
+    """Pickle files
+
+    The file holds two pickled objects: a small header (with the schema
+    version) followed by the artifact itself. Files written before the
+    header existed are read as schema version 0.
+    """
+    HEADER_KEY = '__artifact__'
+
+    def save(self, filepath, obj, schema_version):
+        header = {self.HEADER_KEY: 'pickle', 'schema_version': schema_version}
+        with open(filepath, mode='wb') as f:
+            pickle.dump(header, f)
+            pickle.dump(obj, f)
+
+    def load(self, filepath, columns=None, mmap=False):
+        with open(filepath, mode='rb') as f:
+            first = pickle.load(f)
+            if isinstance(first, dict) and self.HEADER_KEY in first:
+                schema_version = first['schema_version']
+                obj = pickle.load(f)
+            else:
+                # legacy file (plain pickle)
+                schema_version = 0
+                obj = first
+
+        if columns is not None:
+            if not isinstance(obj, pd.DataFrame):
+                msg = "Columns can only be selected from DataFrames ({} is {})"
+                raise TypeError(msg.format(filepath, type(obj).__name__))
+            obj = obj[list(columns)]
+
+        return obj, schema_version
+
+
+# columnar
+
+class ColumnarFormat(object):
+    """A directory with one .npy file per DataFrame column
+
+    Strings are saved as fixed width unicode arrays, so that they can be
+    memory-mapped as well. Columns holding other python objects (None mixed
+    with strings, for example) are pickled inside the .npy file and cannot
+    be memory-mapped.
+
+    The index is saved as a column of its own.
+    """
+    META_FILE = 'meta.json'
+
+    def save(self, filepath, df, schema_version):
+        if not isinstance(df, pd.DataFrame):
+            raise TypeError("Only DataFrames can be saved as columns")
+
+        # write into a temporary directory and move it
+        # into place only when everything is written
+        tmp_filepath = filepath.rstrip(os.sep) + '.tmp'
+        if os.path.exists(tmp_filepath):
+            shutil.rmtree(tmp_filepath)
+        os.makedirs(tmp_filepath)
+
+        columns = []
+        for i, name in enumerate(df.columns):
+            filename = '{}.npy'.format(i)
+            kind = self._save_array(tmp_filepath, filename, df[name])
+            columns.append({'name': name, 'file': filename, 'kind': kind})
+
+        kind = self._save_array(tmp_filepath, 'index.npy', df.index)
+        index = {'name': df.index.name, 'file': 'index.npy', 'kind': kind}
+
+        meta = {
+            'format': 'columnar',
+            'schema_version': schema_version,
+            'length': len(df),
+            'columns': columns,
+            'index': index,
+        }
+        with open(os.path.join(tmp_filepath, self.META_FILE), mode='w') as f:
+            json.dump(meta, f, indent=2)
+
+        if os.path.exists(filepath):
+            shutil.rmtree(filepath)
+        os.rename(tmp_filepath, filepath)
+
+    def load(self, filepath, columns=None, mmap=False):
+        with open(os.path.join(filepath, self.META_FILE)) as f:
+            meta = json.load(f)
+
+        entries = {c['name']: c for c in meta['columns']}
+        if columns is None:
+            columns = [c['name'] for c in meta['columns']]
+        missing = [c for c in columns if c not in entries]
+        if missing:
+            raise KeyError("Columns not in artifact: {}".format(missing))
+
+        data = {}
+        for name in columns:
+            data[name] = self._load_array(filepath, entries[name], mmap)
+
+        index = meta['index']
+        index = pd.Index(self._load_array(filepath, index, mmap),
+                         name=index['name'])
+
+        df = pd.DataFrame(data, index=index, columns=list(columns))
+        return df, meta['schema_version']
+
+    @staticmethod
+    def _save_array(dirpath, filename, values):
+        values = np.asarray(values)
+        if values.dtype == object or values.dtype.kind == 'U':
+            if all(isinstance(v, str) for v in values):
+                kind = 'str'
+                values = values.astype(str)
+            else:
+                kind = 'object'
+        else:
+            kind = 'native'
+
+        np.save(os.path.join(dirpath, filename), values,
+                allow_pickle=(kind == 'object'))
+        return kind
+
+    @staticmethod
+    def _load_array(dirpath, entry, mmap):
+        path = os.path.join(dirpath, entry['file'])
+        if entry['kind'] == 'object':
+            return np.load(path, allow_pickle=True)
+
+        values = np.load(path, mmap_mode='r' if mmap else None)
+        if entry['kind'] == 'str':
+            values = values.astype(object)
+        return values
+
+
+# registry
+
+FORMATS = {
+    '.pkl': PickleFormat(),
+    '.cols': ColumnarFormat(),
+}
+
+
+def register_format(extension, fmt):
+    """Register a new artifact format
+
+    Args:
+        extension: The file extension that selects the format (e.g. '.feather').
+        fmt: An object with `save(filepath, obj, schema_version)` and
+            `load(filepath, columns, mmap)` methods. `load` must return a
+            tuple (obj, schema_version).
+    """
+    FORMATS[extension] = fmt
+
+
+def get_format(filepath):
+    """Select the format of an artifact by its extension
+    """
+    extension = os.path.splitext(filepath.rstrip(os.sep))[1]
+    try:
+        return FORMATS[extension]
+    except KeyError:
+        msg = "No artifact format for extension '{}' ({})"
+        raise ValueError(msg.format(extension, filepath))
+
+
+# api
+
+def save_artifact(filepath, obj, schema_version=SCHEMA_VERSION):
+    """Save an artifact, choosing the format by the file extension
+    """
+    get_format(filepath).save(filepath, obj, schema_version)
+    count_rows('out', filepath, obj)
+
+
+def load_artifact(filepath, columns=None, mmap=False,
+                  schema_version=SCHEMA_VERSION):
+    """Load an artifact, choosing the format by the file extension
+
+    Args:
+        filepath: The artifact location.
+        columns: For DataFrames, the list of columns to be loaded. Columnar
+            artifacts will only read these columns from disk.
+        mmap: If True, columnar artifacts will memory-map their columns
+            instead of reading them.
+        schema_version: The newest schema version the caller understands.
+            Artifacts stamped with a newer version raise a ValueError.
+
+    Returns:
+        The object saved in the artifact.
+    """
+    obj, version = get_format(filepath).load(filepath, columns=columns,
+                                             mmap=mmap)
+    if version > schema_version:
+        msg = "Artifact {} has schema version {} (expected at most {})"
+        raise ValueError(msg.format(filepath, version, schema_version))
+
+    count_rows('in', filepath, obj)
+    return obj
@@ -0,0 +1,110 @@
+from collections import defaultdict
+import logging
+import random
+
+import click
+
+from src.bench.util import echo_results, measure
+from src.data.interim.ltb_teams import (betexp_fuzzy_key,
+                                        generate_countries_dict,
+                                        loteca_fuzzy_key)
+from src.data.interim.teams import betexplorer, loteca
+from src.data.interim.teams.fuzzy import Candidate, TrigramIndex, trigrams
+
+
+def search_all_pairs(entries, queries, k):
+    """Fuzzy search comparing each query with every name of its block
+    (the reference for `TrigramIndex`)
+    """
+    blocks = defaultdict(lambda: defaultdict(set))
+    for block, text, value in entries:
+        blocks[block][text].add(value)
+
+    results = []
+    for block, text in queries:
+        grams = trigrams(text)
+        candidates = []
+        for other, values in blocks[block].items():
+            other_grams = trigrams(other)
+            shared = len(grams & other_grams)
+            if shared:
+                score = shared / len(grams | other_grams)
+                candidates.append(Candidate(score, other, values))
+        candidates.sort(key=lambda c: (-c.score, c.text))
+        results.append(candidates[:k])
+    return results
+
+
+def search_index(entries, queries, k):
+    index = TrigramIndex(entries)
+    return [index.search(block, text, k=k) for block, text in queries]
+
+
+def misspell(text, rng):
+    """Drop, repeat or swap a character of a text
+    """
+    i = rng.randrange(len(text))
+    kind = rng.choice(['drop', 'repeat', 'swap'])
+    if kind == 'drop':
+        return text[:i] + text[i + 1:]
+    elif kind == 'repeat':
+        return text[:i] + text[i] + text[i:]
+    else:
+        return text[:i] + text[i + 1:i + 2] + text[i] + text[i + 2:]
+
+
+@click.command()
+@click.argument('in-betexp-db', type=click.Path(exists=True))
+@click.argument('in-loteca-matches', type=click.Path(exists=True))
+@click.argument('in-countries-dict', type=click.Path(exists=True))
+@click.option('--queries', type=click.INT, default=5000,
+              help='Amount of (misspelled) loteca team names to search.')
+@click.option('--k', type=click.INT, default=3)
+@click.option('--repeat', type=click.INT, default=3)
+def CLI(in_betexp_db, in_loteca_matches, in_countries_dict, queries, k,
+        repeat):
+    """Benchmark the fuzzy search of loteca teams in BetExplorer teams
+
+    The loteca team names are misspelled at random and searched for with the
+    trigram index, and by comparing them with every BetExplorer team of the
+    same block. Both must give the same candidates.
+
+    \b
+    Inputs:
+        betexp-db (sqlite3): The database containing BetExplorer matches.
+        loteca-matches (cols): A DatFrame containing processed loteca matches.
+        countries-dict (pkl): A dictionary that maps portuguese country names
+            into english country names.
+    """
+    # teams (and problems with them) are logged while loading
+    logging.disable(logging.ERROR)
+
+    loteca_teams = loteca.retrieve_teams(in_loteca_matches)
+    betexp_teams = betexplorer.retrieve_teams(in_betexp_db)
+    countries_dict = generate_countries_dict(in_countries_dict)
+
+    entries = [betexp_fuzzy_key(be) + (be.fname,) for be in betexp_teams]
+    keys = [loteca_fuzzy_key(lt, countries_dict) for lt in loteca_teams]
+
+    rng = random.Random(0)
+    keys = [(block, misspell(text, rng))
+            for block, text in (rng.choice(keys) for _ in range(queries))]
+
+    pairs_time, pairs_peak, pairs_found = measure(
+            search_all_pairs, entries, keys, k, repeat=repeat)
+    index_time, index_peak, index_found = measure(
+            search_index, entries, keys, k, repeat=repeat)
+
+    # both must give the same candidates
+    assert pairs_found == index_found
+
+    click.echo("{} BetExplorer teams, {} queries".format(
+        len(betexp_teams), len(keys)))
+    echo_results([
+        ('all pairs', pairs_time, pairs_peak),
+        ('trigram index', index_time, index_peak),
+    ])
+
+
+if __name__ == '__main__':
+    CLI()
@@ -0,0 +1,330 @@
+"""Check that the loteca rounds pipeline gives the same output as before
+
+A synthetic loteca.htm file is generated, then it goes through the previous
+implementation of the pipeline (the DOM parser, the conversion applying
+python functions and the row by row prizes, kept as references in
+`src.bench.loteca_rounds` and `src.bench.loteca_prizes`) and through the
+current one (`src.data.pre.loteca_rounds` and `src.data.process.loteca_rounds`,
+saving the artifacts in between). Both outputs are compared column by column.
+
+The file has the troubles the pipeline has to handle:
+
+    - missing values (' - ') and empty cells;
+    - winners listed in extra state rows;
+    - gaps in the round numbers and rounds without revenue, which break the
+      accumulation chains;
+    - long runs of rounds without 14 rights winners (the acc14 chain);
+    - rounds on both sides of the prize share and bet price changes.
+
+The incremental runs (`--incremental`) are checked too, splitting the file
+after each round.
+"""
+import os
+import random
+import tempfile
+
+import click
+import pandas as pd
+
+from src.artifacts import load_artifact, save_artifact
+from src.bench.loteca_prizes import calculate_prizes_loop
+from src.bench.loteca_rounds import convert_df_apply, extract_df_dom
+from src.data.pre.loteca_rounds import extract_df, extract_new_rounds
+from src.data.process.loteca_rounds import (process_loteca_rounds,
+                                            process_new_rounds)
+
+
+HEADER = (['Concurso', 'Data Sorteio'] +
+          ['Jogo_%s' % i for i in range(1, 15)] +
+          ['Ganhadores_14', 'Cidade', 'UF', 'Rateio_14', 'Acumulado',
+           'Valor_Acumulado', 'Ganhadores_13', 'Rateio_13', 'Ganhadores_12',
+           'Rateio_12', 'Arrecadacao_Total', 'Estimativa_Premio'])
+
+CITIES = [('SAO PAULO', 'SP'), ('RIO DE JANEIRO', 'RJ'), ('SALVADOR', 'BA'),
+          ('CURITIBA', 'PR'), ('PORTO ALEGRE', 'RS'), ('RECIFE', 'PE')]
+
+
+def brazilian_amount(cents):
+    """Format an amount of cents the Brazilian way
+
+    Examples:
+
+        >>> brazilian_amount(123456789)
+        '1.234.567,89'
+
+        >>> brazilian_amount(5)
+        '0,05'
+    """
+    units, cents = divmod(cents, 100)
+    return '{:,}'.format(units).replace(',', '.') + ',{:02}'.format(cents)
+
+
+def _cell(rng, text, rowspan):
+    """A td element, with the text inside a font element sometimes
+    """
+    if text is None:
+        text = ''
+    elif rng.random() < 0.5:
+        text = '<font>{}</font>'.format(text)
+    if rowspan > 1:
+        return '<td rowspan="{}">{}</td>'.format(rowspan, text)
+    return '<td>{}</td>'.format(text)
+
+
+def make_rounds(rng, n):
+    """`n` synthetic rounds, as lists with the text of the 28 cells
+
+    Returns:
+        A list of (cells, winners' cities) tuples.
+    """
+    rounds = []
+    roundno = 0
+    date = pd.Timestamp('2014-01-04')
+    chain = 0
+    for k in range(n):
+        # gaps in the round numbers
+        roundno += 1 if rng.random() > 0.03 else rng.randint(2, 4)
+        date += pd.Timedelta(days=rng.choice([3, 4, 7]))
+
+        # runs of rounds without 14 rights winners
+        if chain == 0 and rng.random() < 0.3:
+            chain = rng.randint(1, 12)
+        if chain > 0:
+            chain -= 1
+            winners14 = 0
+        else:
+            winners14 = rng.randint(1, 3)
+        cities = [rng.choice(CITIES) for _ in range(winners14)]
+
+        revenue = rng.randint(2 * 10**8, 2 * 10**9)
+        if k < 10 or rng.random() < 0.02:
+            revenue = ' - '
+        else:
+            revenue = brazilian_amount(revenue)
+
+        def amount(missing=0.02):
+            if rng.random() < missing:
+                return ' - '
+            return brazilian_amount(rng.randint(0, 5 * 10**8))
+
+        def count(empty=0.0):
+            if rng.random() < empty:
+                return None
+            return str(rng.randint(0, 3000))
+
+        cells = ([str(roundno), '{:%d/%m/%Y}'.format(date)] +
+                 ['TIME {} X TIME {}'.format(2 * i, 2 * i + 1)
+                  for i in range(14)] +
+                 [str(winners14)] +
+                 (list(cities[0]) if cities else [None, None]) +
+                 [amount() if winners14 else '0,00',
+                  'SIM' if winners14 == 0 else 'NÃO',
+                  amount(), count(0.05 if k < 20 else 0.0), amount(),
+                  count(0.2 if k < 20 else 0.0), amount(), revenue,
+                  amount(0.1)])
+        rounds.append((cells, cities[1:]))
+
+    return rounds
+
+
+def write_loteca_htm(path, rounds, rng):
+    """Write the rounds as a loteca.htm file (windows-1252, like the real one)
+    """
+    lines = ['<html><head><title>Loteca</title></head><body>',
+             '<table border="1">',
+             '<tr>{}</tr>'.format(''.join('<th><font>{}</font></th>'.format(
+                 name) for name in HEADER))]
+    for cells, cities in rounds:
+        rowspan = len(cities) + 1
+        lines.append('<tr>{}</tr>'.format(''.join(
+            _cell(rng, text, 1 if i in (17, 18) else rowspan)
+            for i, text in enumerate(cells))))
+        for city, state in cities:
+            lines.append('<tr><td>{}</td><td>{}</td></tr>'.format(city, state))
+    lines.append('</table></body></html>')
+
+    with open(path, mode='wb') as fp:
+        fp.write('\n'.join(lines).encode('windows-1252'))
+
+
+def convert_df_apply_none(df):
+    """`convert_df_apply` with the empty cells as None
+
+    The previous implementation got None for empty cells, but newer pandas
+    versions turn them into NaN when building the DataFrame.
+    """
+    df = df.astype(object)
+    return convert_df_apply(df.where(df.notnull(), None))
+
+
+def process_loteca_rounds_loop(df):
+    """The previous implementation of `process_loteca_rounds` (kept as a
+    reference)
+    """
+    df = df.copy()
+    df = df[df.total_revenue.notnull()]
+
+    df['betprice'] = 0.5
+    df.loc[df.date >= pd.to_datetime('2015-05-18'), 'betprice'] = 1.0
+    df['betcnt'] = df.total_revenue / df.betprice
+    df['betcnt'] = df.betcnt.apply(int)
+
+    df = calculate_prizes_loop(df)
+    df = df.drop(['acc13', 'acc14', 'acc05'], axis=1)
+    df = df[df.total13.notnull() & df.total14.notnull() & df.totalacc.notnull()]
+
+    return df
+
+
+def _column_difference(expected, actual):
+    """How two columns differ (None if they are the same, values and dtype)
+    """
+    try:
+        pd.testing.assert_series_equal(expected, actual, check_exact=True)
+        return None
+    except AssertionError:
+        if expected.dtype != actual.dtype:
+            return 'dtype {} != {}'.format(expected.dtype, actual.dtype)
+        if not expected.index.equals(actual.index):
+            return 'different rounds'
+
+    differ = ~((expected == actual) | (expected.isnull() & actual.isnull()))
+    first = differ.idxmax()
+    return '{} values differ (round {}: {!r} != {!r})'.format(
+        differ.sum(), first, expected[first], actual[first])
+
+
+def compare_frames(expected, actual):
+    """Compare two DataFrames column by column
+
+    Returns:
+        A list of (column, difference) tuples, the difference being None when
+        the columns are the same. The index is compared first, as '(index)'.
+    """
+    results = []
+
+    try:
+        pd.testing.assert_index_equal(expected.index, actual.index)
+        results.append(('(index)', None))
+    except AssertionError as e:
+        results.append(('(index)', str(e).strip().splitlines()[0]))
+
+    for column in expected.columns.union(actual.columns, sort=False):
+        if column not in actual:
+            results.append((column, 'missing'))
+        elif column not in expected:
+            results.append((column, 'unexpected'))
+        else:
+            results.append((column, _column_difference(expected[column],
+                                                        actual[column])))
+
+    return results
+
+
+def echo_comparison(name, results):
+    """Print the result of `compare_frames`
+
+    Returns:
+        The amount of columns that differ.
+    """
+    differ = [(column, diff) for column, diff in results if diff is not None]
+    click.echo("{}: index and {} columns, {} differ".format(
+        name, len(results) - 1, len(differ)))
+    for column, diff in differ:
+        click.echo("    {}: {}".format(column, diff))
+    return len(differ)
+
+
+def acc14_chains(df):
+    """The lengths of the runs of consecutive rounds without 14 rights winners
+    that carry over the amount accumulated (in the processed rounds)
+    """
+    lengths = []
+    length = 0
+    last = None
+    for roundno, winners14 in df.winners14.items():
+        if winners14 == 0 and last is not None and roundno == last + 1:
+            length += 1
+        elif length:
+            lengths.append(length)
+            length = 0
+        last = roundno if winners14 == 0 else None
+    if length:
+        lengths.append(length)
+    return lengths
+
+
+@click.command()
+@click.option('--rounds', type=click.IntRange(min=20), default=300,
+              help='Amount of rounds in the synthetic file.')
+@click.option('--seed', type=click.INT, default=0)
+@click.option('--out-dir', type=click.Path(file_okay=False),
+              help='Keep the synthetic file and the artifacts here.')
+def CLI(rounds, seed, out_dir):
+    """Check that the loteca rounds pipeline gives the same output as before
+
+    A synthetic loteca.htm file is preprocessed and processed by the previous
+    implementation and by the current one (in full and incrementally), and
+    the outputs are compared column by column. Fails if any column differs.
+    """
+    rng = random.Random(seed)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = out_dir or tmp
+        os.makedirs(path, exist_ok=True)
+        in_loteca_htm = os.path.join(path, 'loteca.htm')
+        pre_rounds = os.path.join(path, 'loteca_rounds_pre.cols')
+        process_rounds = os.path.join(path, 'loteca_rounds_process.cols')
+
+        write_loteca_htm(in_loteca_htm, make_rounds(rng, rounds), rng)
+
+        # previous pipeline
+        old_pre = extract_df_dom(in_loteca_htm, convert_df_apply_none)
+        old_process = process_loteca_rounds_loop(old_pre)
+
+        # current pipeline, through the artifacts
+        save_artifact(pre_rounds, extract_df(in_loteca_htm))
+        new_pre = load_artifact(pre_rounds)
+        save_artifact(process_rounds, process_loteca_rounds(new_pre))
+        new_process = load_artifact(process_rounds)
+
+        # incremental runs, with the file split after each round
+        pre_incremental = []
+        process_incremental = []
+        for last in old_pre.index[:-1]:
+            pre_df = extract_new_rounds(in_loteca_htm, new_pre.loc[:last])
+            pre_incremental.append(compare_frames(old_pre, pre_df))
+
+            processed = new_process.loc[:last]
+            if processed.empty:
+                continue
+            process_df = process_new_rounds(new_pre, processed)
+            process_incremental.append(compare_frames(old_process,
+                                                      process_df))
+
+    chains = acc14_chains(old_process)
+    click.echo("{} rounds in the file, {} processed, {} acc14 chains "
+               "(longest: {} rounds)".format(len(old_pre), len(old_process),
+                                             len(chains), max(chains,
+                                                              default=0)))
+    click.echo()
+
+    differ = echo_comparison('preprocess', compare_frames(old_pre, new_pre))
+    differ += echo_comparison('process', compare_frames(old_process,
+                                                        new_process))
+    for name, runs in [('preprocess --incremental', pre_incremental),
+                       ('process --incremental', process_incremental)]:
+        failed = [results for results in runs
+                  if any(diff is not None for _, diff in results)]
+        click.echo("{}: {} splits, {} differ".format(name, len(runs),
+                                                     len(failed)))
+        if failed:
+            differ += echo_comparison('    first split that differs',
+                                      failed[0])
+
+    if differ:
+        raise click.ClickException("The outputs are different")
+
+
+if __name__ == '__main__':
+    CLI()
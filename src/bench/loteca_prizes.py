@@ -0,0 +1,114 @@
+import click
+import numpy as np
+import pandas as pd
+
+from src.artifacts import load_artifact
+from src.bench.util import echo_results, measure
+from src.data.process.loteca_rounds import CUTOFF, add_bets, calculate_prizes
+
+
+def _prize_share(date):
+    return 0.393 if date >= CUTOFF else 0.400
+
+
+def calculate_prizes_loop(df):
+    """The previous implementation of `calculate_prizes` (kept as a reference)
+
+    It goes over the rounds one by one, reading and writing each value with
+    `df.loc`.
+    """
+    df = df.copy()
+
+    columns = ['acc13', 'acc14', 'acc05', 'total13', 'total14', 'totalacc']
+    for column in columns:
+        df[column] = np.nan
+
+    for i in df.index:
+        try:
+            lastacc13 = df.loc[i - 1, 'acc13']
+        except KeyError:
+            lastacc13 = np.nan
+
+        try:
+            lastacc14 = df.loc[i - 1, 'acc14']
+        except KeyError:
+            lastacc14 = np.nan
+
+        if i % 5 == 0:
+            values = df.loc[i - 5: i - 1, 'acc05']
+            if values.shape[0] == 5:
+                lastacc05 = values.sum()
+            else:
+                lastacc05 = np.nan
+        else:
+            lastacc05 = 0.0
+
+        totalacc = lastacc13 + lastacc14 + lastacc05
+
+        total_revenue = df.loc[i, 'total_revenue']
+        share = _prize_share(df.loc[i, 'date'])
+        total13 = total_revenue * share * 0.7 * 0.15 / 1.045
+        total14 = total_revenue * share * 0.7 * 0.70 / 1.045 + totalacc
+        acc13 = total13 if df.loc[i, 'winners13'] == 0 else 0.0
+        acc14 = total14 if df.loc[i, 'winners14'] == 0 else 0.0
+        acc05 = total_revenue * share * 0.7 * 0.15 / 1.045
+
+        df.loc[i, 'total13'] = total13
+        df.loc[i, 'total14'] = total14
+        df.loc[i, 'totalacc'] = totalacc
+        df.loc[i, 'acc13'] = acc13
+        df.loc[i, 'acc14'] = acc14
+        df.loc[i, 'acc05'] = acc05
+
+    df = df[df.totalacc.notnull()]
+
+    return df
+
+
+def scale_rounds(df, factor):
+    """Repeat the rounds `factor` times, numbering the copies after each other
+    """
+    span = df.index.max() - df.index.min() + 1
+    copies = []
+    for k in range(factor):
+        copy = df.copy()
+        copy.index = copy.index + k * span
+        copies.append(copy)
+    return pd.concat(copies)
+
+
+@click.command()
+@click.argument('in-loteca-rounds', type=click.Path(exists=True))
+@click.option('--factor', type=click.INT, default=10,
+              help='How many times the rounds are repeated.')
+@click.option('--repeat', type=click.INT, default=3)
+def CLI(in_loteca_rounds, factor, repeat):
+    """Benchmark the calculation of the loteca prizes
+
+    The array based `calculate_prizes` is compared against the previous row
+    by row implementation. Both must give the same DataFrame.
+
+    \b
+    Inputs:
+        loteca-rounds (DataFrame): The preprocessed loteca rounds.
+    """
+    df = load_artifact(in_loteca_rounds)
+    df = add_bets(df[df.total_revenue.notnull()])
+    df = scale_rounds(df, factor)
+
+    loop_time, loop_peak, loop_df = measure(
+            calculate_prizes_loop, df, repeat=repeat)
+    array_time, array_peak, array_df = measure(
+            calculate_prizes, df, repeat=repeat)
+
+    pd.testing.assert_frame_equal(loop_df, array_df)
+
+    click.echo("{} rounds".format(len(df)))
+    echo_results([
+        ('row by row (df.loc)', loop_time, loop_peak),
+        ('arrays', array_time, array_peak),
+    ])
+
+
+if __name__ == '__main__':
+    CLI()
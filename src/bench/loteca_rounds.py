@@ -0,0 +1,138 @@
+import click
+import pandas as pd
+import parsel
+
+from src.bench.util import echo_results, measure
+from src.data.pre.loteca_rounds import (COLUMNS, convert_df, extract_df,
+                                       iter_rounds)
+
+
+def _read_int(x):
+    try:
+        return int(x)
+    except TypeError:
+        return
+
+
+def _read_float(x):
+    if x == ' - ':
+        return None
+    return float(x.replace('.', '').replace(',', '.'))
+
+
+def convert_df_apply(df):
+    """The previous implementation of `convert_df` (kept as a reference)
+
+    It converts each value with a python function.
+    """
+    df.columns = COLUMNS
+
+    df['roundno'] = df.roundno.apply(_read_int)
+    df['date'] = pd.to_datetime(df.date, dayfirst=True)
+    df['winners14'] = df.winners14.apply(_read_int)
+    df['winners13'] = df.winners13.apply(_read_int)
+    df['winners12'] = df.winners12.apply(_read_int)
+    df['shared14'] = df.shared14.apply(_read_float)
+    df['shared13'] = df.shared13.apply(_read_float)
+    df['shared12'] = df.shared12.apply(_read_float)
+    df['accumulated'] = df.accumulated.apply(lambda x: x == 'SIM')
+    df['accumulated14'] = df.accumulated14.apply(_read_float)
+    df['total_revenue'] = df.total_revenue.apply(_read_float)
+    df['prize_estimative'] = df.prize_estimative.apply(_read_float)
+
+    df = df.set_index('roundno')
+
+    return df
+
+
+def read_raw_df(in_loteca_htm):
+    """The loteca file columns we keep, as text
+    """
+    rounds = iter_rounds(in_loteca_htm)
+    header = next(rounds)
+    df = pd.DataFrame.from_records(list(rounds), columns=header)
+    df = df.drop(['Cidade', 'UF'], axis=1)
+    df = df.drop(['Jogo_%s' % i for i in range(1, 15)], axis=1)
+    return df
+
+
+def extract_df_dom(in_loteca_htm, convert_fn=convert_df):
+    """The previous implementation of `extract_df` (kept as a reference)
+
+    It builds the whole DOM with parsel and runs css queries on each row.
+    """
+    with open(in_loteca_htm, mode='rb') as fp:
+        body = fp.read()
+        body = body.decode('windows-1252')
+    selector = parsel.Selector(body)
+
+    rows = selector.css('tr')
+    header = rows[0]
+    rows = rows[1:]
+    columns = header.css('font::text').extract()
+
+    rounds = []
+    for row in rows:
+        tds = row.css('td')
+        td_cnt = len(tds)
+        if td_cnt == 28:
+            data = [td.css('::text').extract_first() for td in tds]
+            rounds.append(data)
+        elif td_cnt == 2:
+            continue
+        else:
+            raise ValueError("Loteca file row with different number of cells")
+
+    df = pd.DataFrame.from_records(rounds, columns=columns)
+    df = df.drop(['Cidade', 'UF'], axis=1)
+    df = df.drop(['Jogo_%s' % i for i in range(1, 15)], axis=1)
+
+    return convert_fn(df)
+
+
+@click.command()
+@click.argument('in-loteca-htm', type=click.Path(exists=True))
+@click.option('--repeat', type=click.INT, default=3)
+def CLI(in_loteca_htm, repeat):
+    """Benchmark the loteca file parser and the type conversion
+
+    The parser is compared against the DOM based one, and the vectorized
+    type conversion against the one applying python functions to each value.
+    All of them must give the same DataFrame.
+
+    \b
+    Inputs:
+        loteca-htm (htm): The raw loteca.htm file.
+    """
+    dom_time, dom_peak, dom_df = measure(
+            extract_df_dom, in_loteca_htm, convert_df_apply, repeat=repeat)
+    stream_time, stream_peak, stream_df = measure(
+            extract_df, in_loteca_htm, repeat=repeat)
+
+    # both must give the same result
+    pd.testing.assert_frame_equal(dom_df, stream_df)
+
+    click.echo("{} rounds".format(len(stream_df)))
+    echo_results([
+        ('parsel DOM', dom_time, dom_peak),
+        ('lxml iterparse', stream_time, stream_peak),
+    ])
+
+    # type conversion only
+    raw_df = read_raw_df(in_loteca_htm)
+    apply_time, apply_peak, apply_df = measure(
+            lambda: convert_df_apply(raw_df.copy()), repeat=repeat)
+    vector_time, vector_peak, vector_df = measure(
+            lambda: convert_df(raw_df.copy()), repeat=repeat)
+
+    pd.testing.assert_frame_equal(apply_df, vector_df)
+
+    click.echo()
+    echo_results([
+        ('conversion (apply)', apply_time, apply_peak),
+        ('conversion (vectorized)', vector_time, vector_peak),
+    ])
+
+
+if __name__ == '__main__':
+    CLI()
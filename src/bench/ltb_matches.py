@@ -0,0 +1,75 @@
+from collections import defaultdict
+import logging
+import os
+
+import click
+
+from src.artifacts import load_artifact
+from src.bench.util import echo_results, measure
+from src.data.interim.ltb_matches import (generate_ltb_matches_dict,
+                                          load_betexp_matches,
+                                          load_loteca_matches)
+from src.data.interim.teams.cache import NameCache
+
+
+def link(loteca_matches, betexp_matches, ltb_teams, engine, jobs=1):
+    # the teams dictionary is updated while linking
+    teamsd = defaultdict(set, {k: set(v) for k, v in ltb_teams.items()})
+    return generate_ltb_matches_dict(loteca_matches, betexp_matches, teamsd,
+                                     engine=engine, jobs=jobs)
+
+
+@click.command()
+@click.argument('in-loteca-matches', type=click.Path(exists=True))
+@click.argument('in-betexp-db', type=click.Path(exists=True))
+@click.argument('in-ltb-teams', type=click.Path(exists=True))
+@click.option('--jobs', type=click.INT, default=os.cpu_count(),
+              help='Processes used by the parallel numpy engine.')
+@click.option('--repeat', type=click.INT, default=3)
+def CLI(in_loteca_matches, in_betexp_db, in_ltb_teams, jobs, repeat):
+    """Benchmark the engines that link loteca matches into BetExplorer ones
+
+    Both engines of `generate_ltb_matches_dict` ('python' and 'numpy', in a
+    single process and in `jobs` processes) must give the same links.
+    Loading the matches is not measured.
+
+    \b
+    Inputs:
+        loteca-matches (cols): A DataFrame containing processed loteca matches.
+        betexp-db (sqlite3): A database containing BetExplorer matches.
+        ltb-teams (pkl) A dictionary mapping Loteca teams fnames into
+            BetExplorer teams fnames.
+    """
+    # every match and team found is logged
+    logging.disable(logging.WARNING)
+
+    cache = NameCache()
+    loteca_matches = load_loteca_matches(in_loteca_matches, cache)
+    betexp_matches = load_betexp_matches(in_betexp_db, cache)
+    ltb_teams = load_artifact(in_ltb_teams)
+
+    python_time, python_peak, python_links = measure(
+            link, loteca_matches, betexp_matches, ltb_teams, 'python',
+            repeat=repeat)
+    numpy_time, numpy_peak, numpy_links = measure(
+            link, loteca_matches, betexp_matches, ltb_teams, 'numpy',
+            repeat=repeat)
+
+    parallel_time, parallel_peak, parallel_links = measure(
+            link, loteca_matches, betexp_matches, ltb_teams, 'numpy', jobs,
+            repeat=repeat)
+
+    # all must give the same links
+    assert python_links == numpy_links == parallel_links
+
+    click.echo("{} loteca matches, {} BetExplorer matches".format(
+        len(loteca_matches), len(betexp_matches)))
+    echo_results([
+        ('python', python_time, python_peak),
+        ('numpy', numpy_time, numpy_peak),
+        ('numpy, {} jobs'.format(jobs), parallel_time, parallel_peak),
+    ])
+
+
+if __name__ == '__main__':
+    CLI()
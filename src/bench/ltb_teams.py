@@ -0,0 +1,107 @@
+from collections import defaultdict
+import logging
+
+import click
+
+from src.bench.util import echo_results, measure
+from src.data.interim.ltb_teams import (generate_countries_dict,
+                                        generate_ltb_teams_dict, is_same_team)
+from src.data.interim.teams import betexplorer, loteca
+from src.data.interim.teams.commons import Team
+
+
+# extra (women_flag, under) categories, added in this order
+CATEGORIES = [(False, 17), (False, 19), (False, 21), (False, 23), (True, 20),
+              (True, None), (False, 15), (True, 17)]
+
+
+def generate_ltb_teams_dict_loop(loteca_teams, betexp_teams, countries_dict):
+    """The previous implementation of `generate_ltb_teams_dict` (kept as a
+    reference, without the logging)
+
+    It compares every loteca team with every BetExplorer team.
+    """
+    ltb_dict = defaultdict(set)
+    for loteca_team in loteca_teams:
+        matching_teams = [t
+                          for t in betexp_teams
+                          if is_same_team(loteca_team, t, countries_dict)]
+        betexp_fnames = set([t.fname for t in matching_teams])
+        ltb_dict[loteca_team.fname_with_state] |= betexp_fnames
+    return ltb_dict
+
+
+def add_categories(betexp_teams, n):
+    """Copy the BetExplorer teams into `n` extra categories
+
+    This simulates collecting more leagues (youth, women), which makes the
+    amount of BetExplorer teams grow without changing the loteca teams.
+    """
+    teams = list(betexp_teams)
+    for women_flag, under in CATEGORIES[:n]:
+        for t in betexp_teams:
+            if (t.women_flag, t.under) == (women_flag, under):
+                continue
+            string = '{} [{}{}]'.format(t.string, 'W' if women_flag else '',
+                                        under or '')
+            teams.append(Team(string, t.name, t.fname, am_flag=t.am_flag,
+                              women_flag=women_flag, country=t.country,
+                              state=t.state, under=under))
+    return teams
+
+
+@click.command()
+@click.argument('in-betexp-db', type=click.Path(exists=True))
+@click.argument('in-loteca-matches', type=click.Path(exists=True))
+@click.argument('in-countries-dict', type=click.Path(exists=True))
+@click.option('--categories', type=click.INT, default=len(CATEGORIES),
+              help='Amount of extra categories to add, one at a time.')
+@click.option('--repeat', type=click.INT, default=3)
+def CLI(in_betexp_db, in_loteca_matches, in_countries_dict, categories,
+        repeat):
+    """Benchmark the linking of loteca teams into BetExplorer teams
+
+    The indexed `generate_ltb_teams_dict` is compared against the previous
+    implementation, which compares all pairs of teams. The BetExplorer teams
+    are copied into more and more categories, to see how both grow. Both
+    must give the same dictionary.
+
+    \b
+    Inputs:
+        betexp-db (sqlite3): The database containing BetExplorer matches.
+        loteca-matches (cols): A DatFrame containing processed loteca matches.
+        countries-dict (pkl): A dictionary that maps portuguese country names
+            into english country names.
+    """
+    # teams (and problems with them) are logged while loading and linking
+    logging.disable(logging.ERROR)
+
+    loteca_teams = loteca.retrieve_teams(in_loteca_matches)
+    betexp_teams = betexplorer.retrieve_teams(in_betexp_db)
+    countries_dict = generate_countries_dict(in_countries_dict)
+
+    click.echo("{} loteca teams".format(len(loteca_teams)))
+    for n in range(categories + 1):
+        teams = add_categories(betexp_teams, n)
+
+        loop_time, loop_peak, loop_dict = measure(
+                generate_ltb_teams_dict_loop, loteca_teams, teams,
+                countries_dict, repeat=repeat)
+        index_time, index_peak, index_dict = measure(
+                generate_ltb_teams_dict, loteca_teams, teams,
+                countries_dict, repeat=repeat)
+
+        # both must give the same result
+        assert loop_dict == index_dict
+
+        click.echo()
+        click.echo("{} BetExplorer teams ({} extra categories)".format(
+            len(teams), n))
+        echo_results([
+            ('all pairs', loop_time, loop_peak),
+            ('index', index_time, index_peak),
+        ])
+
+
+if __name__ == '__main__':
+    CLI()
@@ -0,0 +1,437 @@
+"""Benchmark of the linking of teams and matches on synthetic datasets
+
+A dataset is made of a BetExplorer database (the 'betexp_matches' table),
+loteca matches and a countries dictionary, like the real ones, plus the
+truth: the BetExplorer match each loteca match was copied from. Every rate
+of trouble is controlled:
+
+    - wrong dates (1 day off, or 2 to 5 days off) and wrong scores (a goal
+      more for the home team);
+    - name variants: loteca names with an extra word (found by the flexible
+      pass) or a typo (only found through the other team);
+    - youth (U20) and women versions of the teams;
+    - state suffixes in BetExplorer names (e.g. 'Santos-SP');
+    - loteca matches whose BetExplorer match is missing (any link is wrong).
+
+Teams play in leagues like the real ones, so that BetExplorer teams get
+their states from the state leagues.
+"""
+from collections import defaultdict, namedtuple
+from datetime import date
+import logging
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+import click
+import numpy as np
+import pandas as pd
+
+from src.artifacts import load_artifact, save_artifact
+from src.bench.util import echo_results, measure
+from src.data.interim.link_audit import LinkAudit
+from src.data.interim.ltb_matches import (generate_ltb_matches_dict,
+                                          load_betexp_matches,
+                                          load_loteca_matches)
+from src.data.interim.ltb_teams import (generate_countries_dict,
+                                        generate_ltb_teams_dict)
+from src.data.interim.teams import betexplorer, loteca
+from src.data.interim.teams.betexplorer import LEAGUE_DICT
+from src.data.interim.teams.cache import NameCache
+from src.data.raw.betexplorer.collect_matches import create_table
+
+
+# betexp: the BetExplorer string
+# loteca: the loteca string
+SynthTeam = namedtuple('SynthTeam', 'betexp loteca')
+
+# teams: indexes of the teams playing in the league
+League = namedtuple('League', 'category name teams')
+
+WORDS = ['america', 'atletico', 'bahia', 'bento', 'botafogo', 'branco',
+         'ceara', 'clube', 'coritiba', 'cruzeiro', 'esporte', 'ferroviario',
+         'fortaleza', 'gama', 'goias', 'gremio', 'guarani', 'jose',
+         'juventude', 'nacional', 'nova', 'operario', 'palmeiras', 'parana',
+         'paulo', 'ponte', 'preta', 'real', 'rio', 'santos', 'sao', 'sport',
+         'uniao', 'vasco', 'vila', 'vitoria']
+
+# portuguese name -> BetExplorer name (and 3 letters code)
+COUNTRIES = {
+    'ALEMANHA': ('Germany', 'GER'),
+    'ARGENTINA': ('Argentina', 'ARG'),
+    'BRASIL': ('Brazil', 'BRA'),
+    'CHILE': ('Chile', 'CHI'),
+    'ESPANHA': ('Spain', 'ESP'),
+    'FRANCA': ('France', 'FRA'),
+    'ITALIA': ('Italy', 'ITA'),
+    'URUGUAI': ('Uruguay', 'URU'),
+}
+
+EXTRA_WORDS = ['CLUBE', 'ESPORTE', 'FC', 'EC']
+
+# (kind, suffix of BetExplorer names, format of loteca names)
+KINDS = [('senior', '', '{}'), ('U20', ' U20', '{} SUB-20'),
+         ('women', ' W', 'F {}')]
+
+
+def club_names(rng, n):
+    """`n` distinct club names, made of one or two words
+    """
+    names = set()
+    while len(names) < n:
+        names.add(' '.join(rng.sample(WORDS, rng.choice([1, 2]))))
+    return sorted(names)
+
+
+def name_variant(rng, name):
+    """A loteca name variant: an extra word or a typo
+
+    Examples:
+
+        >>> name_variant(random.Random(1), 'SANTOS')
+        'SANTOS CLUBE'
+    """
+    if rng.random() < 0.5:
+        return '{} {}'.format(name, rng.choice(EXTRA_WORDS))
+    return name[:-1]
+
+
+def make_teams(rng, clubs, foreign, youth_women, state_suffix,
+               name_variants):
+    """Generate the teams and the leagues they play in
+
+    Youth and women teams play in their own leagues.
+
+    Returns:
+        A tuple (list of SynthTeam, list of League).
+    """
+    teams = []
+    leagues = defaultdict(list)
+
+    def kinds():
+        if rng.random() < youth_women:
+            return KINDS
+        return KINDS[:1]
+
+    def add(betexp, betexp_country, name, other, keys, variant=True):
+        if variant and rng.random() < name_variants:
+            name = name_variant(rng, name)
+        for kind, betexp_suffix, loteca_format in kinds():
+            loteca = loteca_format.format(name)
+            if other is not None:
+                loteca = '{}/{}'.format(loteca, other)
+            teams.append(SynthTeam(betexp + betexp_suffix + betexp_country,
+                                   loteca))
+            for category, league in keys:
+                leagues[(category, league, kind)].append(len(teams) - 1)
+
+    # brazilian clubs, in the state leagues and in a national league
+    states = {state: league for league, state in LEAGUE_DICT.items()}
+    for name in club_names(rng, clubs):
+        state = rng.choice(sorted(states))
+        betexp = name.title()
+        if rng.random() < state_suffix:
+            betexp = '{}-{}'.format(betexp, state)
+        add(betexp, '', name.upper(), state,
+            [('brazil', states[state]), ('brazil', 'Serie A')])
+
+    # clubs from other countries
+    for name in club_names(rng, foreign):
+        code = COUNTRIES[rng.choice(sorted(COUNTRIES))][1]
+        add(name.title(), ' ({})'.format(code.title()), name.upper(), code,
+            [('world', 'Copa')])
+
+    # national teams (their names have no variants)
+    for portuguese, (english, _) in sorted(COUNTRIES.items()):
+        add(english, '', portuguese, None, [('world', 'Friendly')],
+            variant=False)
+
+    leagues = [League(category, name, league_teams)
+               for (category, name, _), league_teams in leagues.items()
+               if len(league_teams) > 1]
+    return teams, leagues
+
+
+def make_betexp_matches(rng, teams, leagues, n, start, days):
+    """Generate BetExplorer matches (as arrays)
+
+    Each league plays a share of the matches proportional to its teams.
+
+    Returns:
+        A dict of arrays: 'home' and 'away' (team indexes), 'league' (league
+        index), 'day' (days after `start`), 'goals_h', 'goals_a' and
+        'scored' (False for matches without score).
+    """
+    sizes = np.array([len(league.teams) for league in leagues])
+    counts = rng.multinomial(n, sizes / sizes.sum())
+
+    home, away, league_ids = [], [], []
+    for i, (league, count) in enumerate(zip(leagues, counts)):
+        members = np.array(league.teams)
+        h = rng.integers(len(members), size=count)
+        a = (h + rng.integers(1, len(members), size=count)) % len(members)
+        home.append(members[h])
+        away.append(members[a])
+        league_ids.append(np.full(count, i))
+
+    order = rng.permutation(n)
+    return {
+        'home': np.concatenate(home)[order],
+        'away': np.concatenate(away)[order],
+        'league': np.concatenate(league_ids)[order],
+        'day': rng.integers(days, size=n),
+        'goals_h': np.minimum(rng.poisson(1.4, size=n), 9),
+        'goals_a': np.minimum(rng.poisson(1.1, size=n), 9),
+        'scored': rng.random(n) >= 0.02,
+    }
+
+
+def make_loteca_matches(rng, teams, matches, n, start, wrong_dates,
+                        wrong_scores, missing):
+    """Pick loteca matches among the BetExplorer matches with score
+
+    Returns:
+        A tuple (DataFrame of loteca matches, array of the BetExplorer
+        matches picked, mask of the ones that must be missing).
+    """
+    picks = rng.choice(np.flatnonzero(matches['scored']), size=n,
+                       replace=False)
+    picks = picks[np.argsort(matches['day'][picks], kind='stable')]
+
+    # wrong dates and scores
+    day = matches['day'][picks].copy()
+    goals_h = matches['goals_h'][picks].copy()
+    trouble = rng.random(n)
+    one_day = trouble < wrong_dates * 2 / 3
+    some_days = (trouble >= wrong_dates * 2 / 3) & (trouble < wrong_dates)
+    score = (trouble >= wrong_dates) & (trouble < wrong_dates + wrong_scores)
+    sign = rng.choice([-1, 1], size=n)
+    day[one_day] += sign[one_day]
+    day[some_days] += sign[some_days] * rng.integers(2, 6, size=n)[some_days]
+    goals_h[score] += 1
+
+    strings = np.array([t.loteca for t in teams], dtype=object)
+    df = pd.DataFrame({
+        'roundno': 400 + np.arange(n) // 14,
+        'gameno': np.arange(n) % 14 + 1,
+        'date': pd.Timestamp(start) + pd.to_timedelta(day, unit='D'),
+        'team_h': strings[matches['home'][picks]],
+        'goals_h': goals_h,
+        'team_a': strings[matches['away'][picks]],
+        'goals_a': matches['goals_a'][picks],
+        'happened': True,
+    })
+    return df, picks, rng.random(n) < missing
+
+
+def save_betexp_matches(db, teams, leagues, matches, keep, start, days):
+    """Save the BetExplorer matches (only the ones in `keep`)
+    """
+    n = len(keep)
+    dates = pd.date_range(start, periods=days)
+    date_strings = np.array(dates.strftime('%d.%m.%Y'), dtype=object)
+    years = np.array(dates.year.astype(str), dtype=object)
+    scores = np.array([['{}:{}'.format(h, a) for a in range(10)]
+                       for h in range(10)], dtype=object)
+    score = scores[matches['goals_h'], matches['goals_a']]
+    score[~matches['scored']] = ''
+    strings = np.array([t.betexp for t in teams], dtype=object)
+    categories = np.array([l.category for l in leagues], dtype=object)
+    names = np.array([l.name for l in leagues], dtype=object)
+
+    ids = np.array(['m{:08d}'.format(i) for i in range(n)], dtype=object)
+    columns = [
+        ids[keep],
+        np.array(['https://www.betexplorer.com/match/' + i for i in ids[keep]],
+                 dtype=object),
+        categories[matches['league'][keep]],
+        names[matches['league'][keep]],
+        years[matches['day'][keep]],
+        strings[matches['home'][keep]],
+        strings[matches['away'][keep]],
+        date_strings[matches['day'][keep]],
+        score[keep],
+        np.full(keep.sum(), '', dtype=object),
+    ]
+
+    if os.path.exists(db):
+        os.remove(db)
+    conn = sqlite3.connect(db)
+    create_table(conn)
+    q = "INSERT INTO betexp_matches VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+    conn.executemany(q, zip(*[c.tolist() for c in columns]))
+    conn.commit()
+    conn.close()
+    return ids
+
+
+def generate(path, betexp_matches, loteca_matches, clubs=400, foreign=200,
+             wrong_dates=0.05, wrong_scores=0.03, name_variants=0.05,
+             youth_women=0.1, state_suffix=0.1, missing=0.02, seed=0,
+             years=(2005, 2018)):
+    """Generate a synthetic dataset into the directory `path`
+
+    Files: 'db.sqlite3', 'loteca_matches.cols', 'countries.pkl' and
+    'truth.pkl' (loteca match id -> BetExplorer match id, for the loteca
+    matches whose BetExplorer match is there).
+    """
+    py_rng = random.Random(seed)
+    rng = np.random.default_rng(seed)
+    start = date(years[0], 1, 1)
+    days = (date(years[1], 12, 31) - start).days + 1
+
+    teams, leagues = make_teams(py_rng, clubs, foreign, youth_women,
+                                state_suffix, name_variants)
+    matches = make_betexp_matches(rng, teams, leagues, betexp_matches, start,
+                                  days)
+    df, picks, lost = make_loteca_matches(
+            rng, teams, matches, loteca_matches, start, wrong_dates,
+            wrong_scores, missing)
+
+    keep = np.ones(betexp_matches, dtype=bool)
+    keep[picks[lost]] = False
+
+    os.makedirs(path, exist_ok=True)
+    ids = save_betexp_matches(os.path.join(path, 'db.sqlite3'), teams,
+                              leagues, matches, keep, start, days)
+    save_artifact(os.path.join(path, 'loteca_matches.cols'), df)
+    save_artifact(os.path.join(path, 'countries.pkl'),
+                  {pt: en for pt, (en, _) in COUNTRIES.items()})
+    save_artifact(os.path.join(path, 'truth.pkl'), dict(zip(
+        df.index[~lost].tolist(), ids[picks[~lost]].tolist())))
+
+
+def load_matches(in_loteca_matches, in_betexp_db):
+    cache = NameCache()
+    return (load_loteca_matches(in_loteca_matches, cache),
+            load_betexp_matches(in_betexp_db, cache))
+
+
+def link(loteca_matches, betexp_matches, ltb_teams, engine):
+    # the teams dictionary is updated while linking
+    teamsd = defaultdict(set, {k: set(v) for k, v in ltb_teams.items()})
+    audit = LinkAudit()
+    links = generate_ltb_matches_dict(loteca_matches, betexp_matches, teamsd,
+                                      engine=engine, audit=audit)
+    return links, audit
+
+
+def pass_quality(audit, truth):
+    """Precision and recall of each pass
+
+    Returns:
+        A list of (pass name, links, right links, precision, recall) tuples,
+        where recall counts the right links of all passes so far.
+    """
+    names = {}
+    linked = defaultdict(list)
+    for pass_no, pass_name, loteca_id, _, matching, _ in audit.rows:
+        names[pass_no] = pass_name
+        if len(matching) == 1:
+            linked[pass_no].append(truth.get(loteca_id) == matching[0])
+
+    quality = []
+    right_so_far = 0
+    for pass_no in sorted(names):
+        right = sum(linked[pass_no])
+        right_so_far += right
+        n_links = len(linked[pass_no])
+        quality.append((names[pass_no], n_links, right,
+                        right / n_links if n_links else float('nan'),
+                        right_so_far / max(len(truth), 1)))
+    return quality
+
+
+@click.command()
+@click.option('--betexp-matches', type=click.IntRange(min=1000),
+              default=100000, help='Amount of BetExplorer matches.')
+@click.option('--loteca-matches', type=click.IntRange(min=1), default=5000,
+              help='Amount of loteca matches.')
+@click.option('--wrong-dates', type=click.FloatRange(0, 1), default=0.05)
+@click.option('--wrong-scores', type=click.FloatRange(0, 1), default=0.03)
+@click.option('--name-variants', type=click.FloatRange(0, 1), default=0.05,
+              help='Share of the loteca team names with a variant.')
+@click.option('--youth-women', type=click.FloatRange(0, 1), default=0.1,
+              help='Share of the teams with U20 and women versions.')
+@click.option('--state-suffix', type=click.FloatRange(0, 1), default=0.1,
+              help='Share of the BetExplorer club names with a state suffix.')
+@click.option('--missing', type=click.FloatRange(0, 1), default=0.02,
+              help='Share of the loteca matches missing from BetExplorer.')
+@click.option('--seed', type=click.INT, default=0)
+@click.option('--engine', type=click.Choice(['python', 'numpy']),
+              default='python')
+@click.option('--out-dir', type=click.Path(file_okay=False),
+              help='Keep the dataset in this directory.')
+@click.option('--repeat', type=click.INT, default=1)
+def CLI(betexp_matches, loteca_matches, wrong_dates, wrong_scores,
+        name_variants, youth_women, state_suffix, missing, seed, engine,
+        out_dir, repeat):
+    """Benchmark the linking of teams and matches on a synthetic dataset
+
+    The dataset is generated (see the options for the rates of trouble in
+    it), then the loteca teams are linked (`ltb_teams`) and the loteca
+    matches are linked (`ltb_matches`). Wall time and peak memory are shown
+    for each step, and the precision and recall of each pass of
+    `ltb_matches`, against the BetExplorer matches the loteca matches were
+    copied from.
+    """
+    # every match and team found is logged
+    logging.disable(logging.ERROR)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = out_dir or tmp
+
+        start = time.perf_counter()
+        generate(path, betexp_matches, loteca_matches, wrong_dates=wrong_dates,
+                 wrong_scores=wrong_scores, name_variants=name_variants,
+                 youth_women=youth_women, state_suffix=state_suffix,
+                 missing=missing, seed=seed)
+        click.echo("Generated {} BetExplorer matches and {} loteca matches "
+                   "in {:.1f}s".format(betexp_matches, loteca_matches,
+                                       time.perf_counter() - start))
+
+        in_betexp_db = os.path.join(path, 'db.sqlite3')
+        in_loteca_matches = os.path.join(path, 'loteca_matches.cols')
+        truth = load_artifact(os.path.join(path, 'truth.pkl'))
+
+        loteca_teams = loteca.retrieve_teams(in_loteca_matches)
+        betexp_teams = betexplorer.retrieve_teams(in_betexp_db)
+        countries_dict = generate_countries_dict(
+                os.path.join(path, 'countries.pkl'))
+        teams_time, teams_peak, ltb_teams = measure(
+                generate_ltb_teams_dict, loteca_teams, betexp_teams,
+                countries_dict, repeat=repeat)
+
+        load_time, load_peak, (lt_matches, be_matches) = measure(
+                load_matches, in_loteca_matches, in_betexp_db, repeat=repeat)
+        click.echo("BetExplorer matches take {:.2f} MB ({:.1f} bytes per "
+                   "match)".format(be_matches.nbytes / 2**20,
+                                   be_matches.nbytes / len(be_matches)))
+
+    link_time, link_peak, (links, audit) = measure(
+            link, lt_matches, be_matches, ltb_teams, engine, repeat=repeat)
+
+    click.echo()
+    echo_results([
+        ('ltb_teams', teams_time, teams_peak),
+        ('load matches', load_time, load_peak),
+        ('ltb_matches ({})'.format(engine), link_time, link_peak),
+    ], speedup=False)
+
+    click.echo()
+    click.echo("{:<40} {:>7} {:>7} {:>10} {:>7}".format(
+        'pass', 'links', 'right', 'precision', 'recall'))
+    for name, n_links, right, precision, recall in pass_quality(audit,
+                                                                truth):
+        click.echo("{:<40} {:>7} {:>7} {:>10.4f} {:>7.4f}".format(
+            name, n_links, right, precision, recall))
+    right = sum(truth.get(lt) == be for lt, be in links.items())
+    click.echo("{:<40} {:>7} {:>7} {:>10.4f} {:>7.4f}".format(
+        'all', len(links), right, right / max(len(links), 1),
+        right / max(len(truth), 1)))
+
+
+if __name__ == '__main__':
+    CLI()
@@ -0,0 +1,140 @@
+import re
+
+import click
+import pandas as pd
+
+from src.bench.util import echo_results, measure
+from src.data.interim.teams import betexplorer
+from src.data.interim.teams.commons import Team, teams_from_frame
+from src.util import re_strip
+
+
+class DictTeam(object):
+    """The previous implementation of `Team` (kept as a reference)
+
+    A regular class (with a `__dict__`), checked on every construction and
+    with `fname_without_state` calculated on first use.
+    """
+    def __init__(self, string, name, fname,
+                 am_flag=False, women_flag=False,
+                 country=None, state=None, under=None):
+        assert isinstance(string, str)
+        assert isinstance(name, str)
+        assert isinstance(fname, str)
+
+        assert isinstance(am_flag, bool)
+        assert isinstance(women_flag, bool)
+
+        if country is not None:
+            assert isinstance(country, str)
+            assert len(country) == 3
+            country = country.upper()
+
+        if state is not None:
+            assert isinstance(state, str)
+            assert len(state) == 2
+            state = state.upper()
+
+        if under is not None:
+            assert isinstance(under, int)
+            assert 0 <= under <= 25
+
+        self.string = string
+        self.name = name
+        self.fname = fname
+        self.am_flag = am_flag
+        self.women_flag = women_flag
+        self.country = country
+        self.state = state
+        self.under = under
+
+        self._fname_without_state = None
+
+    @property
+    def fname_without_state(self):
+        if self.state is None:
+            return self.fname
+
+        if self._fname_without_state is None:
+            pattern = r'\b{}\b'
+            pattern = pattern.format(re.escape(self.state))
+            fname_without_state = re.sub(pattern, '', self.fname)
+            fname_without_state = re_strip(fname_without_state)
+            self._fname_without_state = fname_without_state
+            return fname_without_state
+
+        return self._fname_without_state
+
+
+def create_dict_teams(df):
+    teams = [DictTeam(string, name, fname, am_flag=am_flag,
+                      women_flag=women_flag, country=country, state=state,
+                      under=under)
+             for string, name, fname, am_flag, women_flag, country, state,
+                 under in zip(df.string, df.name, df.fname, df.am_flag,
+                              df.women_flag, df.country, df.state, df.under)]
+    # the linking needs all of them
+    for team in teams:
+        team.fname_without_state
+    return teams
+
+
+def create_validated_teams(df):
+    return [Team(string, name, fname, am_flag=am_flag,
+                 women_flag=women_flag, country=country, state=state,
+                 under=under)
+            for string, name, fname, am_flag, women_flag, country, state,
+                under in zip(df.string, df.name, df.fname, df.am_flag,
+                             df.women_flag, df.country, df.state, df.under)]
+
+
+def team_values(team):
+    return (team.string, team.name, team.fname, team.am_flag,
+            team.women_flag, team.country, team.state, team.under,
+            team.fname_without_state)
+
+
+@click.command()
+@click.argument('in-betexp-db', type=click.Path(exists=True))
+@click.option('--factor', type=click.INT, default=50,
+              help='How many times the teams are repeated.')
+@click.option('--repeat', type=click.INT, default=3)
+def CLI(in_betexp_db, factor, repeat):
+    """Benchmark the creation of Team objects
+
+    The BetExplorer teams (repeated `factor` times) are created with the
+    previous Team class, with the current one (validated, one by one) and
+    in bulk with `teams_from_frame`. All of them must have the same values.
+
+    \b
+    Inputs:
+        betexp-db (sqlite3): The database containing BetExplorer matches.
+    """
+    teams = betexplorer.retrieve_teams(in_betexp_db)
+    df = pd.DataFrame([team_values(t)[:-1] for t in teams] * factor,
+                      columns=['string', 'name', 'fname', 'am_flag',
+                               'women_flag', 'country', 'state', 'under'],
+                      dtype=object)
+
+    dict_time, dict_peak, dict_teams = measure(
+            create_dict_teams, df, repeat=repeat)
+    slots_time, slots_peak, slots_teams = measure(
+            create_validated_teams, df, repeat=repeat)
+    bulk_time, bulk_peak, bulk_teams = measure(
+            teams_from_frame, df, repeat=repeat)
+
+    # all must give the same teams
+    expected = [team_values(t) for t in dict_teams]
+    assert expected == [team_values(t) for t in slots_teams]
+    assert expected == [team_values(t) for t in bulk_teams]
+
+    click.echo("{} teams".format(len(df)))
+    echo_results([
+        ('__dict__, lazy', dict_time, dict_peak),
+        ('__slots__, validated', slots_time, slots_peak),
+        ('__slots__, bulk', bulk_time, bulk_peak),
+    ])
+
+
+if __name__ == '__main__':
+    CLI()
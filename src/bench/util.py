@@ -0,0 +1,47 @@
+import time
+import tracemalloc
+
+import click
+
+
+def measure(fn, *args, repeat=3, **kwargs):
+    """Measure the time and the memory used by a function call
+
+    The function is called `repeat` times and the best time is kept. Memory
+    is measured (with tracemalloc) on an extra call, so it doesn't slow down
+    the timed ones.
+
+    Returns:
+        A tuple (best time in seconds, peak memory in bytes, result).
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(*args, **kwargs)
+        best = min(best, time.perf_counter() - start)
+
+    tracemalloc.start()
+    fn(*args, **kwargs)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return best, peak, result
+
+
+def echo_results(results, speedup=True):
+    """Print a table of benchmark results
+
+    Args:
+        results: A list of (name, time, peak memory) tuples. The first one is
+            used as the base for the speedup column.
+        speedup: If False, the speedup column is not shown (for results that
+            are different steps instead of different implementations).
+    """
+    base_time = results[0][1]
+    header = "{:<28} {:>12} {:>14}".format('', 'time (s)', 'peak mem (MB)')
+    click.echo(header + (" {:>9}".format('speedup') if speedup else ''))
+    for name, seconds, peak in results:
+        line = "{:<28} {:>12.4f} {:>14.2f}".format(name, seconds, peak / 2**20)
+        if speedup:
+            line += " {:>8.1f}x".format(base_time / seconds)
+        click.echo(line)
@@ -0,0 +1,174 @@
+"""Audit of the decisions taken while linking matches
+
+Every time a pass of `ltb_matches` looks for a loteca match, the decision is
+recorded: the BetExplorer matches with date and score within tolerance and
+the same women flags and unders (candidates), the ones with the same teams
+as well (matching), whether the match was linked and the teams learned from
+the link. Records are kept as ids and only turned into text when saved into
+the 'link_audit' table, so recording costs little, and nothing at all when
+there is no audit.
+
+Decisions:
+
+    linked      exactly one matching BetExplorer match
+    ambiguous   more than one (nothing is linked)
+    none        no matching BetExplorer match
+
+Records can be queried afterwards, with the CLI below or with SQL, e.g.
+`SELECT * FROM link_audit WHERE decision == 'ambiguous'`.
+"""
+import json
+import sqlite3
+from collections import namedtuple
+
+import click
+
+from src.profiling import count_rows
+
+
+TABLE = 'link_audit'
+
+# pass_no: the number of the pass (from 0)
+# pass_name: the description of the pass
+# loteca_id, candidates, matching: ids of the loteca match and of the
+#     BetExplorer matches (lists)
+# decision: see above
+# learned: the (loteca team, BetExplorer team) pairs added to the teams
+#     dictionary by the link
+Record = namedtuple('Record', 'pass_no pass_name loteca_id candidates '
+                              'matching decision learned')
+
+
+def create_table(conn):
+    """Create the table where the records are saved
+    """
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS {} (
+          pass_no     INTEGER  NOT NULL,
+          pass_name   TEXT     NOT NULL,
+          loteca_id   INTEGER  NOT NULL,
+          candidates  TEXT     NOT NULL,
+          matching    TEXT     NOT NULL,
+          decision    TEXT     NOT NULL,
+          learned     TEXT     NOT NULL,
+
+          PRIMARY KEY (loteca_id, pass_no)
+        )""".format(TABLE))
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS {0}_decision ON {0} (decision)
+        """.format(TABLE))
+    conn.commit()
+
+
+def decide(matching):
+    """The decision taken for a list of matching matches
+    """
+    if len(matching) == 1:
+        return 'linked'
+    return 'ambiguous' if matching else 'none'
+
+
+class LinkAudit(object):
+    """Records of linking decisions, in memory until saved
+    """
+    def __init__(self):
+        self.rows = []
+
+    def record(self, pass_no, pass_name, loteca_match, candidates, matching,
+               learned):
+        """Record the decision about a loteca match
+
+        Args:
+            candidates, matching: Lists of BetExplorer `match_store.Match`.
+            learned: A list of (loteca team, BetExplorer team) pairs.
+        """
+        self.rows.append((pass_no, pass_name, loteca_match.id,
+                          [m.id for m in candidates],
+                          [m.id for m in matching], learned))
+
+    def save(self, db, replace=True):
+        """Save the records into the database
+
+        Args:
+            replace: If True, the records already saved are removed first
+                (otherwise, only the ones of the same loteca matches and
+                passes are replaced).
+        """
+        rows = [(pass_no, pass_name, loteca_id, json.dumps(candidates),
+                 json.dumps(matching), decide(matching), json.dumps(learned))
+                for pass_no, pass_name, loteca_id, candidates, matching,
+                learned in self.rows]
+
+        conn = sqlite3.connect(db)
+        create_table(conn)
+        if replace:
+            conn.execute("DELETE FROM {}".format(TABLE))
+        q = "INSERT OR REPLACE INTO {} VALUES (?, ?, ?, ?, ?, ?, ?)"
+        conn.executemany(q.format(TABLE), rows)
+        conn.commit()
+        conn.close()
+        count_rows('out', TABLE, rows)
+
+
+def load_records(db, decision=None, loteca_id=None):
+    """Load the records saved, sorted by loteca match and pass
+
+    Args:
+        decision: If given, only the records with this decision.
+        loteca_id: If given, only the records of this loteca match.
+
+    Returns:
+        A list of Record.
+    """
+    conditions = []
+    params = []
+    if decision is not None:
+        conditions.append('decision == ?')
+        params.append(decision)
+    if loteca_id is not None:
+        conditions.append('loteca_id == ?')
+        params.append(loteca_id)
+
+    q = "SELECT {} FROM {}".format(', '.join(Record._fields), TABLE)
+    if conditions:
+        q += " WHERE " + " AND ".join(conditions)
+    q += " ORDER BY loteca_id, pass_no"
+
+    conn = sqlite3.connect(db)
+    create_table(conn)
+    rows = conn.execute(q, params).fetchall()
+    conn.close()
+    count_rows('in', TABLE, rows)
+
+    return [Record(pass_no, pass_name, loteca_id, json.loads(candidates),
+                   json.loads(matching), decision,
+                   [tuple(pair) for pair in json.loads(learned)])
+            for pass_no, pass_name, loteca_id, candidates, matching,
+            decision, learned in rows]
+
+
+@click.command()
+@click.argument('in-betexp-db', type=click.Path(exists=True))
+@click.option('--decision', type=click.Choice(['linked', 'ambiguous', 'none']),
+              help='Only show the records with this decision.')
+@click.option('--loteca-id', type=click.INT,
+              help='Only show the records of this loteca match.')
+def CLI(in_betexp_db, decision, loteca_id):
+    """Show the decisions recorded by `ltb_matches --audit`
+
+    Each line shows the pass, the loteca match id, the decision, the matching
+    BetExplorer match ids (out of how many candidates) and the teams learned.
+
+    \b
+    Inputs:
+        betexp-db (sqlite3): The database with the 'link_audit' table.
+    """
+    for r in load_records(in_betexp_db, decision, loteca_id):
+        click.echo("{} {:>8} {:<9} {} ({} candidates) {}".format(
+            r.pass_no, r.loteca_id, r.decision, r.matching,
+            len(r.candidates),
+            ' '.join('{} -> {}'.format(lt, be) for lt, be in r.learned)))
+
+
+if __name__ == '__main__':
+    CLI()
@@ -1,37 +1,31 @@
 import logging
+import os
 import sqlite3
-from collections import defaultdict, namedtuple
-from datetime import date, timedelta
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from datetime import timedelta
+from itertools import product
 from operator import itemgetter
 
 import click
+import numpy as np
 import pandas as pd
 
+from src.artifacts import load_artifact, save_artifact
+from src.data.interim.link_audit import LinkAudit
+from src.data.interim.match_arrays import MatchArrays
+from src.data.interim.match_store import (Match, MatchStore, TeamName,
+                                          encode_ids)
 from src.data.interim.teams import betexplorer, loteca
-from src.util import load_pickle, re_split, save_pickle
+from src.data.interim.teams.aliases import (Alias, aliases_dict,
+                                            load_aliases, save_aliases)
+from src.data.interim.teams.cache import NameCache
+from src.data.interim.teams.tokens import TokenIndex
+from src.profiling import count_rows, profile_option
 
 
-# Match object
-
-# this is tailored specifically for this file
-# and won't be good anywhere else
-
-# id = (DataFrame index - Loteca) | (identifier from site - BetExplorer)
-# date = python date object
-# h = Home
-# a = Away
-# th = Team Home
-# ta = Team Away
-fields = ('id '
-          'date '
-          'score_h score_a '
-          'th_string ta_string '
-          'th_fname ta_fname '
-          'th_under ta_under '
-          'th_women_flag ta_women_flag')
-
-Match = namedtuple('Match', fields)
-
+# Match objects (loteca matches are a list of them, BetExplorer matches are a
+# MatchStore, which builds them when asked for): see `match_store`
 
 # comparison
 def identity(t1, t2):
@@ -39,68 +33,115 @@ def identity(t1, t2):
     return t1 == t2
 
 
-def is_same_match(lt_match, be_match,
+def is_same_teams(lt_match, be_th, be_ta,
                   teams_fn=identity,
                   needed_teams=2,
                   **kwargs):
-    """Determine if two matches are the same
+    """Determine if a loteca match is the same as a BetExplorer match
 
-    We assume the date and score have already been checked.
+    The BetExplorer match is given by its home and away teams (TeamName, as
+    kept by the MatchStore), so the match itself isn't built. We assume the
+    date and score have already been checked.
 
     **kwargs are here as a placeholder (we will pass date and score tolerance
     into this function, for convenience).
     """
     lt = lt_match
-    be = be_match
 
     # basic team
-    if (lt.th_women_flag != be.th_women_flag or
-          lt.ta_women_flag != be.ta_women_flag or
-          lt.th_under != be.th_under or
-          lt.ta_under != be.ta_under):
+    if (lt.th_women_flag != be_th.women_flag or
+          lt.ta_women_flag != be_ta.women_flag or
+          lt.th_under != be_th.under or
+          lt.ta_under != be_ta.under):
         return False
 
     # teams
     if needed_teams == 2:
-        return (teams_fn(lt.th_fname, be.th_fname) and
-                teams_fn(lt.ta_fname, be.ta_fname))
+        return (teams_fn(lt.th_fname, be_th.fname) and
+                teams_fn(lt.ta_fname, be_ta.fname))
     elif needed_teams == 1:
-        return (teams_fn(lt.th_fname, be.th_fname) or
-                teams_fn(lt.ta_fname, be.ta_fname))
+        return (teams_fn(lt.th_fname, be_th.fname) or
+                teams_fn(lt.ta_fname, be_ta.fname))
     else:
         return True
 
 
+def same_positions(lt_match, positions, be_th, be_ta, **kwargs):
+    """The positions of the BetExplorer matches that are the same as a
+    loteca match (see `is_same_teams`)
+
+    Args:
+        positions: A list of positions of BetExplorer matches.
+        be_th, be_ta: Their home and away teams (see
+            `MatchStore.team_names`).
+    """
+    return [i for i, th, ta in zip(positions, be_th, be_ta)
+            if is_same_teams(lt_match, th, ta, **kwargs)]
+
+
 # performant comparison
 def generate_reverse(matches):
-    """Generate a dictionary that maps scores/dates into matches
+    """Generate an index of matches (a MatchStore) by day and score
 
     The resulting dictionary will be of the following form:
-        'scores':
-            (0,0): set(index of matches with (0,0) score)
-            (0,1): set(index of matches with (0,1) score)
-            ...
-        'dates':
-            date(2009-12-31): set(index of matches in the given date)
+        'days':
+            [733771, 733772, ...] (day numbers, sorted, no repetitions)
+        'buckets':
+            (733772, (0,0)): [indexes of matches in the given day
+                              with (0,0) score, sorted (an array)]
             ...
+
+    The matches are sorted by (day, score) once, and each bucket is a slice
+    of that order (no copies).
     """
-    dates = defaultdict(set)
-    scores = defaultdict(set)
-    for i, m in enumerate(matches):
-        dates[m.date].add(i)
-        scores[(m.score_h, m.score_a)].add(i)
+    day = matches.day
+    score_h = matches.score_h
+    score_a = matches.score_a
+    order = np.lexsort((score_a, score_h, day))
 
-    return {'scores': scores, 'dates': dates}
+    keys = np.stack([day[order], score_h[order], score_a[order]])
+    starts = np.flatnonzero(np.any(np.diff(keys, axis=1, prepend=-1) != 0,
+                                   axis=0))
+    ends = np.append(starts[1:], len(order))
 
+    buckets = {}
+    for (d, h, a), start, end in zip(keys[:, starts].T.tolist(),
+                                     starts.tolist(), ends.tolist()):
+        buckets[(d, (h, a))] = order[start:end]
 
-def filter_matches(loteca_match, betexp_matches, kwargs, reverse_dict):
+    days = sorted(set(day for day, score in buckets))
+    return {'days': days, 'buckets': buckets}
+
+
+def near_scores(score_h, score_a, tolerance):
+    """The scores whose difference in goals to a score is within tolerance
+
+    Examples:
+
+        >>> near_scores(0, 1, 1)
+        [(0, 0), (0, 1), (0, 2), (1, 1)]
+    """
+    scores = []
+    for diff_h in range(-tolerance, tolerance + 1):
+        left = tolerance - abs(diff_h)
+        for diff_a in range(-left, left + 1):
+            h, a = score_h + diff_h, score_a + diff_a
+            if h >= 0 and a >= 0:
+                scores.append((h, a))
+    return scores
+
+
+def filter_matches(loteca_match, kwargs, reverse_dict):
     """Filter BetExplorer matches
 
     This will reduce the search area for each match in the algorithm.
 
+    The days within tolerance are found by bisecting the sorted days, and
+    the scores within tolerance are enumerated, so only the buckets of
+    matches that can be the same are looked at.
+
     Args:
         loteca_match: A Match object that came from Loteca
-        betexp_matches: A list of Match objects from BetExplorer (all of them)
         kwargs: A dictionary. Keys:
 
             score_tolerance: Maximum difference in goals between 2 matches so that
@@ -113,31 +154,40 @@ def filter_matches(loteca_match, betexp_matches, kwargs, reverse_dict):
         reverse_dict: A dictionary mapping characteristics into indexes of
             matches (BetExplorer). Should be generated by the generate_reverse
             function
+
+    Returns:
+        The positions of the BetExplorer matches (in the MatchStore the
+        reverse dictionary was generated from), an array, sorted.
     """
-    score_indexes = set()
     score_tolerance = kwargs.get('score_tolerance', 0)
-    for score, indexes in reverse_dict['scores'].items():
-        score_diff = (abs(loteca_match.score_h - score[0]) +
-                        abs(loteca_match.score_a - score[1]))
-        if score_diff <= score_tolerance:
-            score_indexes |= indexes
-
-    date_indexes = set()
-    date_tolerance = kwargs.get('date_tolerance', timedelta())
-    for date, indexes in reverse_dict['dates'].items():
-        date_diff = abs(loteca_match.date - date)
-        if date_diff <= date_tolerance:
-            date_indexes |= indexes
-
-    intersect_indexes = score_indexes & date_indexes
-    filtered = [m for i, m in enumerate(betexp_matches)
-                if i in intersect_indexes]
+    scores = near_scores(loteca_match.score_h, loteca_match.score_a,
+                         score_tolerance)
+
+    date_tolerance = kwargs.get('date_tolerance', timedelta()).days
+    day = loteca_match.date.toordinal()
+    all_days = reverse_dict['days']
+    start = bisect_left(all_days, day - date_tolerance)
+    end = bisect_right(all_days, day + date_tolerance)
+
+    buckets = reverse_dict['buckets']
+    found = [buckets[key]
+             for key in product(all_days[start:end], scores)
+             if key in buckets]
+
+    if len(found) == 1:
+        indexes = found[0]
+    elif found:
+        indexes = np.sort(np.concatenate(found))
+    else:
+        indexes = np.empty(0, dtype=np.int64)
 
-    return filtered
+    return indexes
 
 
 # core
-def generate_ltb_matches_dict(loteca_matches, betexp_matches, teamsd):
+def generate_ltb_matches_dict(loteca_matches, betexp_matches, teamsd,
+                              aliases=None, engine='python', jobs=1,
+                              audit=None):
     """Generates a match to match dictionary
 
     Look at the CLI docstring for more information.
@@ -162,19 +212,38 @@ def generate_ltb_matches_dict(loteca_matches, betexp_matches, teamsd):
     match numbers are already precomputed for us.
 
     This is implemented by the `generate_reverse` and `filter_matches`
-    functions.
+    functions. The matches found are kept for the following passes with the
+    same tolerances, and a pass repeated right after itself only looks again
+    for the Loteca matches whose teams got new teams.
+
+    With engine='numpy', the matches are encoded as arrays instead, and the
+    BetExplorer matches of all Loteca matches are found at once in each pass
+    (see `match_arrays.MatchArrays`). Only the teams of Loteca matches whose
+    teams were found earlier in the same pass are compared again, one match
+    at a time. The result is the same.
 
     And... The logging. This was pretty hard, because it is way verbose. We log
     here all matches found, all outer iterations of the algorithm and all teams
     found. Also, in the end, we log teams that had duplicate entries in our
     teams dictionary. These are teams we are uncertain about and that should be
-    checked in the end of the algorithm.
+    checked in the end of the algorithm. Matches are only formatted when the
+    log level lets them through, so a quiet run doesn't pay for it. Instead
+    of logging the matches, their decisions can be recorded into an audit,
+    which is easier to query (see `link_audit`).
 
     Args:
         loteca_matches: A list of Match objects that should be found.
-        betexp_matches: A list of Match objects to search in.
+        betexp_matches: A MatchStore of the matches to search in.
         teamsd: A pregenerated dictionary that maps (Loteca team fname (+state)
         into a set of BetExplorer team fnames).
+        aliases: If a list, an `aliases.Alias` is appended to it for each new
+            team found (with the confidence of the pass that found it).
+        engine: Either 'python' or 'numpy' (see above).
+        jobs: With the numpy engine, how many processes look for the
+            BetExplorer matches of each pass (see
+            `MatchArrays.link_pass_parallel`). The result is the same.
+        audit: If given, a `link_audit.LinkAudit` where the decision about
+            each Loteca match, in each pass, is recorded (instead of logged).
 
     Returns:
         A dictionary that links Loteca match ids into betExplorer match ids.
@@ -203,18 +272,24 @@ def generate_ltb_matches_dict(loteca_matches, betexp_matches, teamsd):
         logging.info(msg)
 
     def log_match(lt_match, be_matches):
+        log_level = logging.INFO if len(be_matches) <= 1 else logging.WARNING
+        if not logging.getLogger().isEnabledFor(log_level):
+            return
+
         msg = "MATCH {lt_match:>{lt_max_match}} -> {be_matches}"
         msg = msg.format(lt_match=format_match(lt_match),
                          be_matches=[format_match(m) for m in be_matches],
-                         lt_max_match=LOTECA_MAX_MATCH)
-        log_level = logging.INFO if len(be_matches) <= 1 else logging.WARNING
+                         lt_max_match=loteca_max_match())
         logging.log(log_level, msg)
 
     def log_uncertain_match(match1, match2):
+        if not logging.getLogger().isEnabledFor(logging.INFO):
+            return
+
         msg = "{match1:>{max_match}} -> {match2}"
         msg = msg.format(match1=format_match(match1),
                          match2=format_match(match2),
-                         max_match=LOTECA_MAX_MATCH)
+                         max_match=loteca_max_match())
         logging.info(msg)
 
     def log_uncertain():
@@ -260,17 +335,31 @@ def generate_ltb_matches_dict(loteca_matches, betexp_matches, teamsd):
     def compare_teams_rigid(lt_team, be_team):
         return be_team in teamsd[lt_team]
 
-    def compare_teams_flex(team1, team2):
-        pieces1 = set([p for p in re_split(team1) if len(p) > 2])
-        pieces2 = set([p for p in re_split(team2) if len(p) > 2])
-        return (pieces1 == pieces2 or
-                  pieces1 < pieces2 or
-                  pieces2 < pieces1)
+    # the pieces (words) of one team must all be in the other team, the
+    # BetExplorer teams related to each loteca team are found once, through
+    # an index of their pieces (see `teams.tokens`)
+    betexp_tokens = TokenIndex(betexp_matches.fnames())
+    flex_teams = {}
+
+    def compare_teams_flex(lt_team, be_team):
+        if lt_team not in flex_teams:
+            flex_teams[lt_team] = betexp_tokens.related(lt_team)
+        return be_team in flex_teams[lt_team]
 
     # constants
     LOTECA_MATCH_COUNT = len(loteca_matches)
     LOTECA_MAX_TEAM = max(len(n) for n in teamsd)
-    LOTECA_MAX_MATCH = max(len(format_match(m)) for m in loteca_matches)
+
+    # the width of the loteca matches in the log, only computed (over all of
+    # them) when a match is logged
+    all_loteca_matches = loteca_matches
+    widths = {}
+
+    def loteca_max_match():
+        if 'match' not in widths:
+            widths['match'] = max(len(format_match(m))
+                                  for m in all_loteca_matches)
+        return widths['match']
 
     # core
     param1 = { 'teams_fn': compare_teams_rigid }
@@ -292,40 +381,144 @@ def generate_ltb_matches_dict(loteca_matches, betexp_matches, teamsd):
         'date_tolerance': timedelta(5),
     }
 
+    # the last value is how confident we are
+    # about the teams found in each pass
     param_set = [
-        ('Link matches we are certain about', param1),
-        ('Link matches using flexible team names', param2),
-        ('Link matches by one team', param3),
-        ('Link matches by one team', param3),
-        ('Link matches by one team', param3),
-        ('Link matches with wrong scores', param4),
-        ('Link matches with wrong dates', param5),
-        ('Link matches with quite wrong dates', param6),
+        ('Link matches we are certain about', param1, 1.0),
+        ('Link matches using flexible team names', param2, 0.8),
+        ('Link matches by one team', param3, 0.6),
+        ('Link matches by one team', param3, 0.6),
+        ('Link matches by one team', param3, 0.6),
+        ('Link matches with wrong scores', param4, 0.7),
+        ('Link matches with wrong dates', param5, 0.7),
+        ('Link matches with quite wrong dates', param6, 0.5),
     ]
 
     # generate loteca to BetExplorer dict
     # the dict maps Matches into Matches
     ltb_dict = {}
-    reverse_dict = generate_reverse(betexp_matches)
-    for msg, kwargs in param_set:
+    if engine == 'numpy':
+        arrays = MatchArrays(loteca_matches, betexp_matches)
+        positions = {m.id: i for i, m in enumerate(loteca_matches)}
+    else:
+        reverse_dict = generate_reverse(betexp_matches)
+
+    def tolerances(kwargs):
+        return (kwargs.get('score_tolerance', 0),
+                kwargs.get('date_tolerance', timedelta()))
+
+    def team_sizes(loteca_match):
+        return (len(teamsd.get(loteca_match.th_fname, ())),
+                len(teamsd.get(loteca_match.ta_fname, ())))
+
+    # the BetExplorer matches with date and score within tolerance of each
+    # loteca match (not linked yet), as positions and teams, kept while later
+    # passes use the same tolerances (most passes use exact dates and scores)
+    candidates_cache = defaultdict(dict)
+
+    # what each loteca match found in the previous pass, kept when the next
+    # pass is the same: (amount of teams of its teams, candidates, matching)
+    last_found = {}
+
+    for n, (msg, kwargs, confidence) in enumerate(param_set):
         left = len(loteca_matches)
 
         logging.info(msg)
         logging.info("There are {} loteca matches left".format(left))
 
+        later = [kw for _, kw, _ in param_set[n + 1:]]
+        keep_candidates = tolerances(kwargs) in map(tolerances, later)
+        keep_found = bool(later) and later[0] is kwargs
+
+        cache = candidates_cache[tolerances(kwargs)]
+        if not keep_candidates:
+            del candidates_cache[tolerances(kwargs)]
+
+        # passes are repeated to use the teams found in the previous ones,
+        # matches whose teams didn't get new teams find the same as before
+        previous_found, last_found = last_found, {}
+
+        def found_before(loteca_match):
+            previous = previous_found.get(loteca_match.id)
+            if previous is not None and previous[0] == team_sizes(
+                    loteca_match):
+                return previous[1:]
+            return None
+
+        # loteca matches linked and loteca teams
+        # that got new BetExplorer teams in this pass
+        linked = []
+        changed = set()
+        if engine == 'numpy':
+            rigid = kwargs['teams_fn'] is compare_teams_rigid
+            looked_up = [positions[m.id] for m in loteca_matches
+                         if found_before(m) is None]
+            if jobs > 1:
+                found = arrays.link_pass_parallel(
+                        looked_up, jobs, teamsd=teamsd if rigid else None,
+                        **kwargs)
+            else:
+                found = arrays.link_pass(looked_up,
+                                         teamsd=teamsd if rigid else None,
+                                         **kwargs)
+            looked_up = set(looked_up)
+
         for loteca_match in loteca_matches:
 
-            filtered_matches = filter_matches(
-                    loteca_match, betexp_matches, kwargs, reverse_dict)
-            matching = [m for m in filtered_matches if is_same_match(loteca_match, m, **kwargs)]
-            log_match(loteca_match, matching)
+            before = found_before(loteca_match)
+            if before is not None:
+                candidates, matching = before
+            elif engine == 'numpy':
+                position = positions[loteca_match.id]
+                if position not in looked_up:
+                    # its teams changed after the pass started
+                    found.update(arrays.link_pass(
+                        [position], teamsd=teamsd if rigid else None,
+                        **kwargs))
+                    looked_up.add(position)
+                candidates, matching = found.get(position, ([], []))
+                # the teams were compared before the pass started,
+                # compare them again if they have changed since then
+                if rigid and (loteca_match.th_fname in changed or
+                              loteca_match.ta_fname in changed):
+                    matching = same_positions(
+                        loteca_match, candidates,
+                        *betexp_matches.team_names(candidates), **kwargs)
+                matching = betexp_matches.rows(matching)
+                if audit is not None:
+                    candidates = betexp_matches.rows(candidates)
+            else:
+                # the positions of the candidates and their teams
+                near = cache.get(loteca_match.id)
+                if near is None:
+                    indexes = filter_matches(loteca_match, kwargs,
+                                             reverse_dict)
+                    near = ((indexes.tolist(),) +
+                            betexp_matches.team_names(indexes))
+                    if keep_candidates:
+                        cache[loteca_match.id] = near
+                # only the matches reported are built
+                matching = betexp_matches.rows(
+                    same_positions(loteca_match, *near, **kwargs))
+                candidates = near[0]
+                if audit is not None:
+                    # same candidates as the numpy engine
+                    candidates = betexp_matches.rows(same_positions(
+                        loteca_match, *near, needed_teams=0))
+            if keep_found:
+                last_found[loteca_match.id] = (team_sizes(loteca_match),
+                                               candidates, matching)
+            if audit is None:
+                log_match(loteca_match, matching)
 
             # we only save results when there
             # is exactly one matching
+            learned = []
             if len(matching) == 1:
                 # update matches dict
-                betexp_match = matching.pop()
+                betexp_match = matching[0]
                 ltb_dict[loteca_match] = betexp_match
+                linked.append(loteca_match)
 
                 # update teams dict
                 lt_th = loteca_match.th_fname
@@ -333,15 +526,27 @@ def generate_ltb_matches_dict(loteca_matches, betexp_matches, teamsd):
                 be_th = betexp_match.th_fname
                 be_ta = betexp_match.ta_fname
 
-                if be_th not in teamsd[lt_th]:
-                    teamsd[lt_th].add(be_th)
-                    log_team(lt_th, be_th)
-
-                if be_ta not in teamsd[lt_ta]:
-                    teamsd[lt_ta].add(be_ta)
-                    log_team(lt_ta, be_ta)
+                for lt_team, be_team in [(lt_th, be_th), (lt_ta, be_ta)]:
+                    if be_team not in teamsd[lt_team]:
+                        teamsd[lt_team].add(be_team)
+                        changed.add(lt_team)
+                        log_team(lt_team, be_team)
+                        learned.append((lt_team, be_team))
+                        if aliases is not None:
+                            aliases.append(Alias(lt_team, be_team,
+                                                 'ltb_matches', msg,
+                                                 confidence))
+
+            if audit is not None:
+                audit.record(n, msg, loteca_match, candidates, matching,
+                             learned)
         else:
             loteca_matches = [m for m in loteca_matches if m not in ltb_dict]
+
+            # forget the matches linked
+            for kept in candidates_cache.values():
+                for loteca_match in linked:
+                    kept.pop(loteca_match.id, None)
     log_uncertain()
 
     # log results
@@ -353,106 +558,193 @@ def generate_ltb_matches_dict(loteca_matches, betexp_matches, teamsd):
     return {lm.id: bm.id for lm, bm in ltb_dict.items()}
 
 
-# loading and preparing
-def get_loteca_match(row):
-    """Generate a loteca Match from a row
+# incremental
+def learn_teams(loteca_matches, betexp_matches, ltb_matches, teamsd):
+    """Add the teams of already linked matches into the teams dictionary
+
+    This recovers what the algorithm learned in previous runs (the teams it
+    found while linking matches).
+
+    Returns:
+        The set of (loteca team, BetExplorer team) pairs of the links.
     """
-    # parse home team name
-    th_parsed = loteca.parse_string(row.team_h)
-    th_name, th_under, th_women_flag, th_state, _ = th_parsed
-    th_fname = loteca.format_name(th_name)
+    pairs = set()
+    linked = [m for m in loteca_matches if m.id in ltb_matches]
+    found = betexp_matches.positions(ltb_matches[m.id] for m in linked)
+    for loteca_match, position in zip(linked, found):
+        if position < 0:
+            continue
+        betexp_match = betexp_matches[position]
+        for lt_team, be_team in [
+                (loteca_match.th_fname, betexp_match.th_fname),
+                (loteca_match.ta_fname, betexp_match.ta_fname)]:
+            teamsd[lt_team].add(be_team)
+            pairs.add((lt_team, be_team))
+    return pairs
+
+
+def select_unlinked_matches(loteca_matches, ltb_matches):
+    """Select the loteca matches not linked yet
+
+    These are the matches from new rounds and the ones that could not be
+    linked before (new BetExplorer matches, or teams, may link them now).
+    """
+    return [m for m in loteca_matches if m.id not in ltb_matches]
 
-    # parse away team name
-    ta_parsed = loteca.parse_string(row.team_a)
-    ta_name, ta_under, ta_women_flag, ta_state, _ = ta_parsed
-    ta_fname = loteca.format_name(ta_name)
 
-    # add states so our algorithm doesn't
-    # work with duplicates
-    if th_state is not None:
-        th_fname = '{} ({})'.format(th_fname, th_state)
-    if ta_state is not None:
-        ta_fname = '{} ({})'.format(ta_fname, ta_state)
+def invalidate_links(loteca_matches, betexp_matches, ltb_matches):
+    """Keep only the links whose matches are still there
+
+    Links are dropped when the loteca match is gone (or didn't happen
+    anymore) or when the BetExplorer match is gone (or lost its score).
+
+    Returns:
+        The links kept (a new dictionary).
+    """
+    loteca_ids = set(m.id for m in loteca_matches)
+    found = betexp_matches.positions(ltb_matches.values())
+    return {lt_id: be_id
+            for (lt_id, be_id), position in zip(ltb_matches.items(), found)
+            if lt_id in loteca_ids and position >= 0}
+
+
+def invalidate_aliases(aliases, pairs):
+    """Keep only the aliases found by this script that links still support
+
+    Aliases from other sources are kept as they are.
+
+    Args:
+        aliases: A list of `aliases.Alias`.
+        pairs: The (loteca team, BetExplorer team) pairs of the links kept
+            (see `learn_teams`).
+
+    Returns:
+        The aliases kept (a new list).
+    """
+    return [a for a in aliases
+            if a.source != 'ltb_matches' or
+            (a.loteca_team, a.betexp_team) in pairs]
+
 
-    return Match(row.name,
-                 row.date.to_pydatetime().date(),
-                 row.goals_h, row.goals_a,
-                 row.team_h, row.team_a,
-                 th_fname, ta_fname,
-                 th_under, ta_under,
-                 th_women_flag, ta_women_flag)
+# loading and preparing
+def add_states(parsed):
+    """The loteca team fnames with their states (e.g. 'atletico (MG)')
+
+    Args:
+        parsed: The loteca team strings parsed (see `NameCache.parse_many`).
+    """
+    return [fname if state is None else '{} ({})'.format(fname, state)
+            for fname, state in zip(parsed.fname, parsed.state)]
 
 
-def load_loteca_matches(in_loteca_matches):
+def load_loteca_matches(in_loteca_matches, cache):
     """Load and prepare loteca matches
 
     Only matches that happened will be retrieved.
 
     Output format is a list of Match objects.
     """
-    df = load_pickle(in_loteca_matches)
-    matches = [get_loteca_match(row)
-               for id, row in df.iterrows()
-               if row.happened]
+    columns = ['date', 'team_h', 'goals_h', 'team_a', 'goals_a', 'happened']
+    df = load_artifact(in_loteca_matches, columns=columns)
+    df = df[df.happened]
+
+    # parse team names
+    th = cache.parse_many(loteca.PARSER, df.team_h)
+    ta = cache.parse_many(loteca.PARSER, df.team_a)
+
+    # add states so our algorithm doesn't
+    # work with duplicates
+    th_fnames = add_states(th)
+    ta_fnames = add_states(ta)
+
+    matches = [Match(*values) for values in zip(
+        df.index.tolist(),
+        df.date.dt.date,
+        df.goals_h.tolist(), df.goals_a.tolist(),
+        df.team_h, df.team_a,
+        th_fnames, ta_fnames,
+        th.under, ta.under,
+        th.women_flag, ta.women_flag)]
     return matches
 
 
-def load_betexp_matches(in_betexp_db):
+def by_unique(series, fn):
+    """Apply `fn` (which converts a whole Series) to the distinct values of a
+    Series only
+
+    Examples:
+
+        >>> by_unique(pd.Series(['1', '2', '1']), lambda s: s.astype(int)
+        ...           ).tolist()
+        [1, 2, 1]
+    """
+    codes, uniques = pd.factorize(series)
+    converted = fn(pd.Series(uniques))
+    return converted.iloc[codes].reset_index(drop=True)
+
+
+def load_betexp_matches(in_betexp_db, cache, chunksize=250000):
     """Load and prepare BetExplorer matches
 
-    Output format is a list of Match objects.
+    Output format is a MatchStore. Team strings are parsed once for each
+    distinct string (home and away together) and kept in its teams table.
 
-    Matches without score are ignored.
+    Matches without score are ignored (in the query). Rows are read
+    `chunksize` at a time, and only kept once converted into columns, so the
+    whole table is never in memory as python objects.
     """
-    # load database rows into DataFrame
     conn = sqlite3.connect(in_betexp_db)
-    q = "SELECT id, date, team_h, team_a, score FROM betexp_matches"
-    df = pd.read_sql_query(q, conn)
+    q = """
+        SELECT id, date, team_h, team_a, score
+        FROM betexp_matches
+        WHERE score != ''
+        """
+    chunks = []
+    team_codes = {}
+    for df in pd.read_sql_query(q, conn, chunksize=chunksize):
+        count_rows('in', 'betexp_matches', df)
+        if df.empty:
+            continue
+
+        # prepare data
+        # (there are a few thousand distinct dates and a few dozen distinct
+        # scores, so each one is only converted once)
+        days = by_unique(df.date, lambda s: pd.to_datetime(
+            s, format='%d.%m.%Y').map(lambda d: d.toordinal()))
+        scores = by_unique(df.score, lambda s: s.str.strip().str.split(
+            ':', n=1, expand=True).astype(np.int64))
+
+        # team strings are coded by their first appearance
+        codes, strings = pd.factorize(pd.concat([df.team_h, df.team_a]))
+        codes = np.array([team_codes.setdefault(string, len(team_codes))
+                          for string in strings], dtype=np.int32)[codes]
+
+        chunks.append((encode_ids(df.id), days.to_numpy(np.int32),
+                       scores[0].to_numpy(np.int8),
+                       scores[1].to_numpy(np.int8),
+                       codes[:len(df)], codes[len(df):]))
     conn.close()
 
-    # remove duplicates
+    if chunks:
+        columns = [np.concatenate(column) for column in zip(*chunks)]
+    else:
+        columns = [np.array([], dtype='S')] + [np.array([], dtype=np.int64)
+                                               for _ in range(5)]
+
+    # remove duplicates (keeping the first one)
     # these are real duplicates that were caused
     # by the way BetExplorer organize its matches
-    df = df.drop_duplicates(subset='id')
+    _, first = np.unique(columns[0], return_index=True)
+    first.sort()
+    columns = [column[first] for column in columns]
 
-    # prepare data
-    def get_date(s):
-        d, m, y = [int(v) for v in s.split('.')]
-        global date
-        return date(y, m, d)
+    strings = list(team_codes)
+    parsed = cache.parse_many(betexplorer.PARSER, strings)
+    teams = [TeamName(*values) for values in zip(
+        strings, parsed.fname.tolist(), parsed.under.tolist(),
+        parsed.women_flag.tolist())]
 
-    def get_score(s):
-        if s == '':
-            return None
-
-        s = s.strip()
-        return [int(v) for v in s.split(':')]
-
-    def process_name(s):
-        name, _, women_flag, under, _ = betexplorer.parse_string(s)
-        fname = betexplorer.format_name(name)
-        return (s, fname, under, women_flag)
-
-    dates = [get_date(s) for s in df.date]
-    scores = [get_score(s) for s in df.score]
-    h_names = [process_name(s) for s in df.team_h]  # about 10us per entry
-    a_names = [process_name(s) for s in df.team_a]
-
-    # create Match objects
-    matches = []
-    for idd, date, score, h_name, a_name in zip(
-            df.id, dates, scores, h_names, a_names):
-        if score:
-            match = Match(
-                idd,
-                date,
-                score[0], score[1],
-                h_name[0], a_name[0],
-                h_name[1], a_name[1],
-                h_name[2], a_name[2],
-                h_name[3], a_name[3])
-            matches.append(match)
-    return matches
+    return MatchStore(*columns, teams=teams)
 
 
 # cli
@@ -461,12 +753,55 @@ def load_betexp_matches(in_betexp_db):
 @click.argument('in-betexp-db', type=click.Path(exists=True))
 @click.argument('in-ltb-teams', type=click.Path(exists=True))
 @click.argument('out-ltb-matches', type=click.Path(writable=True))
-def CLI(in_loteca_matches, in_betexp_db, in_ltb_teams, out_ltb_matches):
+@click.option('--incremental', is_flag=True,
+              help='Keep the links in the output and only link the matches '
+                   'not linked yet (new rounds and earlier misses).')
+@click.option('--engine', type=click.Choice(['python', 'numpy']),
+              default='python',
+              help='How the matches are compared (both give the same links).')
+@click.option('--jobs', type=click.IntRange(min=1), default=1,
+              help='Processes used by the numpy engine (same links).')
+@click.option('--invalidate', is_flag=True,
+              help='With --incremental, drop the links to matches that are '
+                   'gone.')
+@click.option('--audit', is_flag=True,
+              help='Record the decisions instead of logging every match.')
+@profile_option
+def CLI(in_loteca_matches, in_betexp_db, in_ltb_teams, out_ltb_matches,
+        incremental, engine, jobs, invalidate, audit):
     """Links Loteca matches into betExplorer matches
 
+    With --incremental, the links already saved in 'out-ltb-matches' are
+    kept, and only the matches not linked yet are linked (the ones from new
+    rounds, and the ones that could not be linked before, which new
+    BetExplorer matches may link now). They are searched among all the
+    BetExplorer matches. The teams found through the saved links are used as
+    well, and so are the ones in the aliases registry.
+
+    The saved links are kept as they are, unless --invalidate is given: then,
+    the links whose loteca match or BetExplorer match is gone (or has no
+    score anymore) are dropped, and these loteca matches are linked again.
+    The aliases found by this script that no kept link supports are dropped
+    as well (from the registry, too), so the matches are not linked again
+    through teams learned from the links dropped.
+
+    The teams found while linking matches are saved into the aliases
+    registry (the 'team_aliases' table of 'betexp-db', see `teams.aliases`),
+    so they are not lost between runs (--incremental starts from them). A
+    full run replaces the aliases found by previous runs of this script.
+
+    The team strings parsed are cached in the 'team_names' table of
+    'betexp-db', so each string is only parsed once (across runs).
+
+    With --audit, the decision about each loteca match in each pass (the
+    candidates, the matching BetExplorer matches and the teams learned) is
+    saved into the 'link_audit' table of 'betexp-db' instead of being logged
+    (see `link_audit`, which also shows them). The records of earlier runs
+    are removed, except with --incremental.
+
     \b
     Inputs:
-        loteca-matches (pkl): A DataFrame containing processed loteca matches.
+        loteca-matches (cols): A DataFrame containing processed loteca matches.
         betexp-db (sqlite3): A database containing BetExplorer matches.
         ltb-teams (pkl) A dictionary mapping Loteca teams fnames into
             BetExplorer teams fnames.
@@ -476,6 +811,12 @@ def CLI(in_loteca_matches, in_betexp_db, in_ltb_teams, out_ltb_matches):
         ltb-matches (pkl): A dicionary mapping Loteca matches ids into
             BetExplorer matches ids.
     """
+    if jobs > 1 and engine != 'numpy':
+        raise click.UsageError("--jobs can only be used with --engine numpy")
+    if invalidate and not incremental:
+        raise click.UsageError("--invalidate can only be used with "
+                               "--incremental")
+
     # we want to see all the matches and teams
     # that are being related
     logging.getLogger().setLevel(logging.INFO)
@@ -483,17 +824,60 @@ def CLI(in_loteca_matches, in_betexp_db, in_ltb_teams, out_ltb_matches):
     # most of the code below is preprocessing
     # over the matches
     logging.info("Loading data...")
-    loteca_matches = load_loteca_matches(in_loteca_matches)
-    betexp_matches = load_betexp_matches(in_betexp_db)
-    ltb_teams = load_pickle(in_ltb_teams)
+    cache = NameCache(in_betexp_db)
+    loteca_matches = load_loteca_matches(in_loteca_matches, cache)
+    betexp_matches = load_betexp_matches(in_betexp_db, cache)
+    cache.save()
+    ltb_teams = load_artifact(in_ltb_teams)
+
+    registry = load_aliases(in_betexp_db) if incremental else []
+
+    previous = {}
+    supported = set()
+    if incremental and os.path.exists(out_ltb_matches):
+        previous = load_artifact(out_ltb_matches)
+        if invalidate:
+            kept = invalidate_links(loteca_matches, betexp_matches, previous)
+            logging.info("Dropped {} links to matches that are gone".format(
+                len(previous) - len(kept)))
+            previous = kept
+        supported = learn_teams(loteca_matches, betexp_matches, previous,
+                                ltb_teams)
+        loteca_matches = select_unlinked_matches(loteca_matches, previous)
+        logging.info("There are {} loteca matches not linked yet".format(
+            len(loteca_matches)))
+
+    if invalidate:
+        # the teams learned through the links dropped are dropped as well
+        kept = invalidate_aliases(registry, supported)
+        logging.info("Dropped {} team aliases of links that are gone".format(
+            len(registry) - len(kept)))
+        registry = kept
+
+    for team, teams in aliases_dict(registry).items():
+        ltb_teams[team] |= teams
 
     # the core
     logging.info("Matching loteca matches into BetExplorer ones...")
-    ltb_matches = generate_ltb_matches_dict(loteca_matches, betexp_matches, ltb_teams)
+    ltb_matches = dict(previous)
+    aliases = []
+    link_audit = LinkAudit() if audit else None
+    if loteca_matches:
+        ltb_matches.update(generate_ltb_matches_dict(
+            loteca_matches, betexp_matches, ltb_teams, aliases, engine,
+            jobs, link_audit))
 
     # saving
     logging.info("Saving...")
-    save_pickle(out_ltb_matches, ltb_matches)
+    if invalidate:
+        # the aliases kept are saved again, so the dropped ones are removed
+        aliases = [a for a in registry if a.source == 'ltb_matches'] + aliases
+    save_aliases(in_betexp_db, aliases,
+                 replace_source=(None if incremental and not invalidate
+                                 else 'ltb_matches'))
+    if link_audit is not None:
+        link_audit.save(in_betexp_db, replace=not incremental)
+    save_artifact(out_ltb_matches, ltb_matches)
 
 
 if __name__ == '__main__':
@@ -4,8 +4,13 @@ import logging
 import click
 from unidecode import unidecode
 
+from src.artifacts import load_artifact, save_artifact
 from src.data.interim.teams import betexplorer, loteca
-from src.util import load_pickle, save_pickle
+from src.data.interim.teams.aliases import (Alias, aliases_dict,
+                                            load_aliases, save_aliases)
+from src.data.interim.teams.cache import NameCache
+from src.data.interim.teams.fuzzy import TrigramIndex
+from src.profiling import profile_option
 
 
 def standardize_country(name):
@@ -28,7 +33,7 @@ def generate_countries_dict(in_countries_dict):
         'brazil'
     """
     # load countries
-    countries = load_pickle(in_countries_dict)
+    countries = load_artifact(in_countries_dict)
 
     # standardize country names
     _sc = standardize_country
@@ -85,22 +90,163 @@ def is_same_team(loteca_team, betexp_team, countries_dict):
                   lt.fname_without_state == be.fname_without_state)
 
 
-def generate_ltb_teams_dict(loteca_teams, betexp_teams, countries_dict):
+class BetexpTeamsIndex(object):
+    """BetExplorer teams indexed by the keys `is_same_team` compares
+
+    Finding the BetExplorer teams that match a loteca team takes a few dict
+    lookups instead of calling `is_same_team` on every BetExplorer team. The
+    teams found are the same.
+    """
+    def __init__(self, betexp_teams):
+        # (women_flag, under) blocks that have teams
+        self.blocks = set()
+        # country teams: (women_flag, under, fname)
+        self.by_fname = defaultdict(list)
+        # teams outside of brazil: (women_flag, under, fname), no state
+        self.by_fname_stateless = defaultdict(list)
+        # teams from brazil: (women_flag, under, state, fname_without_state)
+        self.by_state = defaultdict(list)
+
+        for be in betexp_teams:
+            block = (be.women_flag, be.under)
+            self.blocks.add(block)
+            self.by_fname[block + (be.fname,)].append(be)
+            if be.state is None:
+                self.by_fname_stateless[block + (be.fname,)].append(be)
+            else:
+                key = block + (be.state, be.fname_without_state)
+                self.by_state[key].append(be)
+
+    def find(self, loteca_team, countries_dict):
+        """The BetExplorer teams that are the same as the loteca team
+        """
+        lt = loteca_team
+        block = (lt.women_flag, lt.under)
+        if block not in self.blocks:
+            return []
+
+        if not lt.state and not lt.country:
+            # country team
+            return self.by_fname.get(block + (countries_dict[lt.fname],), [])
+        elif lt.country:
+            # teams outside of brazil
+            return self.by_fname_stateless.get(block + (lt.fname,), [])
+        else:
+            # teams from brazil
+            key = block + (lt.state, lt.fname_without_state)
+            return self.by_state.get(key, [])
+
+
+def betexp_fuzzy_key(betexp_team):
+    """The (block, text) a BetExplorer team is indexed by for fuzzy search
+
+    The blocks are the restrictions of `is_same_team`: the women flag, the
+    under and the state (teams with a state only match teams from the same
+    state).
+    """
+    be = betexp_team
+    block = (be.women_flag, be.under, be.state)
+    return block, be.fname_without_state
+
+
+def loteca_fuzzy_key(loteca_team, countries_dict):
+    """The (block, text) a loteca team is searched with (see above)
+    """
+    lt = loteca_team
+    if not lt.state and not lt.country:
+        # country team
+        text = countries_dict.get(lt.fname, lt.fname)
+    else:
+        text = lt.fname_without_state
+    return (lt.women_flag, lt.under, lt.state), text
+
+
+def find_fuzzy_teams(loteca_teams, betexp_teams, countries_dict, k=3):
+    """Look for the most similar BetExplorer teams of each loteca team
+
+    Returns:
+        A dict (loteca fname with state -> list of `fuzzy.Candidate`), whose
+        values are sets of BetExplorer fnames.
+    """
+    index = TrigramIndex(betexp_fuzzy_key(be) + (be.fname,)
+                         for be in betexp_teams)
+
+    candidates = {}
+    for lt in loteca_teams:
+        if lt.fname_with_state not in candidates:
+            block, text = loteca_fuzzy_key(lt, countries_dict)
+            candidates[lt.fname_with_state] = index.search(block, text, k=k)
+    return candidates
+
+
+def accept_fuzzy_candidates(candidates, threshold):
+    """The BetExplorer fnames of the best candidate, if it is good enough
+
+    The best candidate is only accepted when its score is at least
+    `threshold` and no other candidate has the same score.
+    """
+    if not candidates or candidates[0].score < threshold:
+        return set()
+    if len(candidates) > 1 and candidates[1].score == candidates[0].score:
+        return set()
+    return set(candidates[0].values)
+
+
+def generate_ltb_teams_dict(loteca_teams, betexp_teams, countries_dict,
+                            fuzzy_threshold=None, aliases=None):
     """Generate the dict itself
 
+    Loteca teams that are not found are searched for by similarity of names
+    (see `find_fuzzy_teams`). The candidates are logged, to be reviewed, and
+    the best one is accepted when its score is at least `fuzzy_threshold`.
+
+    If `aliases` is a list, an `aliases.Alias` is appended to it for each
+    team found.
+
     Read the CLI docstring for more information.
     """
     LOTECA_MAX_SIZE = max(len(t.fname) for t in loteca_teams)
 
     # generate dict
+    index = BetexpTeamsIndex(betexp_teams)
     ltb_dict = defaultdict(set)
     for loteca_team in loteca_teams:
-        matching_teams = [t
-                          for t in betexp_teams
-                          if is_same_team(loteca_team, t, countries_dict)]
+        matching_teams = index.find(loteca_team, countries_dict)
         betexp_fnames = set([t.fname for t in matching_teams])
         ltb_dict[loteca_team.fname_with_state] |= betexp_fnames
 
+    if aliases is not None:
+        for loteca_fname, betexp_fnames in sorted(ltb_dict.items()):
+            aliases.extend(Alias(loteca_fname, betexp_fname, 'ltb_teams',
+                                 'exact', 1.0)
+                           for betexp_fname in sorted(betexp_fnames))
+
+    # search for the teams not found
+    not_found = [t for t in loteca_teams if not ltb_dict[t.fname_with_state]]
+    if not_found:
+        fuzzy = find_fuzzy_teams(not_found, betexp_teams, countries_dict)
+
+        logging.info("Fuzzy candidates:")
+        for loteca_fname, candidates in sorted(fuzzy.items()):
+            accepted = set()
+            if fuzzy_threshold is not None:
+                accepted = accept_fuzzy_candidates(candidates,
+                                                   fuzzy_threshold)
+                ltb_dict[loteca_fname] |= accepted
+            if accepted and aliases is not None:
+                aliases.extend(Alias(loteca_fname, betexp_fname, 'ltb_teams',
+                                     'fuzzy', candidates[0].score)
+                               for betexp_fname in sorted(accepted))
+
+            msg = "{loteca_fname!s:>{loteca_max_size}} ~> {found}{accepted}"
+            msg = msg.format(
+                    loteca_fname=loteca_fname,
+                    loteca_max_size=LOTECA_MAX_SIZE,
+                    found=', '.join('{:.2f} {}'.format(c.score, c.text)
+                                    for c in candidates) or "{}",
+                    accepted=' (accepted)' if accepted else '')
+            logging.info(msg)
+
     # log founds
     logging.info("Found teams:")
     for loteca_fname, betexp_fnames in sorted(ltb_dict.items()):
@@ -119,9 +265,26 @@ def generate_ltb_teams_dict(loteca_teams, betexp_teams, countries_dict):
 @click.argument('in-loteca-matches', type=click.Path(exists=True))
 @click.argument('in-countries-dict', type=click.Path(exists=True))
 @click.argument('out-ltb-teams', type=click.Path(writable=True))
-def CLI(in_betexp_db, in_loteca_matches, in_countries_dict, out_ltb_teams):
+@click.option('--incremental', is_flag=True,
+              help='Only look for loteca teams not yet in the aliases '
+                   'registry.')
+@click.option('--fuzzy-threshold', type=click.FloatRange(0, 1), default=None,
+              help='Accept the most similar BetExplorer team of loteca '
+                   'teams not found, if its similarity is at least this.')
+@profile_option
+def CLI(in_betexp_db, in_loteca_matches, in_countries_dict, out_ltb_teams,
+        incremental, fuzzy_threshold):
     """Creates a dictionary that maps loteca teams into betexplorer teams
 
+    Every team found is saved into the aliases registry (the 'team_aliases'
+    table of 'betexp-db', see `teams.aliases`), which also keeps the teams
+    found by `ltb_matches` while linking matches. A full run replaces the
+    aliases found by previous runs of this script. With --incremental, the
+    output starts from the aliases this script found before (the ones found
+    by `ltb_matches` are left to `ltb_matches --incremental`), and only the
+    loteca teams that are not there yet (the ones that showed up in new
+    rounds, or were never found) are searched for.
+
     \b
     Note:
         There was some changes in what this script was actually outputting.
@@ -147,10 +310,22 @@ def CLI(in_betexp_db, in_loteca_matches, in_countries_dict, out_ltb_teams):
         specific enough for BetExplorer). Both problems above were solved,
         except for few specific teams, but these will be logged.
 
+    Loteca teams that are not found are searched for by the similarity of
+    their names (Jaccard index of the character trigrams), among the
+    BetExplorer teams with the same women flag, under and state. The most
+    similar ones are logged, to be reviewed (and added to
+    `teams.loteca.REPLACEMENTS`, for example). With --fuzzy-threshold, the
+    most similar team is used when its similarity is at least the threshold.
+
+    The team strings parsed are cached in the 'team_names' table of
+    'betexp-db', so each string is only parsed once (across runs). The cache
+    follows the parsers' source, so strings are parsed again after
+    REPLACEMENTS (or anything else in the parsers) changes.
+
     \b
     Inputs:
         betexp-db (sqlite3): The database containing BetExplorer matches.
-        loteca-matches (pkl): A DatFrame containing processed loteca matches.
+        loteca-matches (cols): A DatFrame containing processed loteca matches.
         countries-dict (pkl): A dictionary that maps portuguese country names
             into english country names.
 
@@ -165,18 +340,36 @@ def CLI(in_betexp_db, in_loteca_matches, in_countries_dict, out_ltb_teams):
             See note for more information on the dictionary keys.
     """
     click.echo("Preparing teams...")
-    loteca_teams = loteca.retrieve_teams(in_loteca_matches)
-    betexp_teams = betexplorer.retrieve_teams(in_betexp_db)
+    cache = NameCache(in_betexp_db)
+    loteca_teams = loteca.retrieve_teams(in_loteca_matches, cache)
+    betexp_teams = betexplorer.retrieve_teams(in_betexp_db, cache)
+    cache.save()
+
+    previous = {}
+    if incremental:
+        # the teams learned by linking matches are left to
+        # `ltb_matches --incremental`
+        previous = aliases_dict(a for a in load_aliases(in_betexp_db)
+                                if a.source == 'ltb_teams')
+        loteca_teams = [t for t in loteca_teams
+                        if t.fname_with_state not in previous]
+        click.echo("There are {} new teams".format(len(loteca_teams)))
 
     click.echo("Generating countries dictionary...")
     countries_dict = generate_countries_dict(in_countries_dict)
 
     click.echo("Generating Loteca to BetExplorer teams dictionary...")
-    ltb_teams = generate_ltb_teams_dict(
-            loteca_teams, betexp_teams, countries_dict)
+    ltb_teams = defaultdict(set, previous)
+    aliases = []
+    if loteca_teams:
+        ltb_teams.update(generate_ltb_teams_dict(
+            loteca_teams, betexp_teams, countries_dict, fuzzy_threshold,
+            aliases))
 
     click.echo("Saving...")
-    save_pickle(out_ltb_teams, ltb_teams)
+    save_aliases(in_betexp_db, aliases,
+                 replace_source=None if incremental else 'ltb_teams')
+    save_artifact(out_ltb_teams, ltb_teams)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,318 @@
+"""Matches encoded as NumPy arrays, for linking them in bulk
+
+`ltb_matches` compares a loteca match with the BetExplorer matches close to
+it, one at a time, in python. Here, both sides are encoded as integer arrays
+(day number, goals, team ids, under and women flag) and all the candidate
+pairs of a pass are found at once:
+
+    1. BetExplorer matches are sorted by (score, day), so the matches with a
+       given score and a date within tolerance are a contiguous range, found
+       with `searchsorted` (once for each score within tolerance).
+    2. Pairs with different women flags or unders are dropped.
+    3. Team names are compared on all the pairs at once: pairs of team ids
+       are looked up in the teams dictionary (with `isin`), and other
+       comparison functions are called once for each distinct pair of names.
+
+See `ltb_matches.generate_ltb_matches_dict` for how the passes use it.
+"""
+import multiprocessing
+from datetime import timedelta
+from operator import attrgetter
+
+import numpy as np
+import pandas as pd
+
+
+# what the worker processes of `link_pass_parallel` work on: the MatchArrays
+# and the arguments of the pass (set before the processes are forked)
+_shared = None
+
+
+def _link_window(positions):
+    arrays, kwargs = _shared
+    return arrays.link_pass(positions, **kwargs)
+
+
+def score_offsets(tolerance):
+    """The (home, away) differences in goals within tolerance
+
+    Examples:
+
+        >>> score_offsets(1)
+        [(-1, 0), (0, -1), (0, 0), (0, 1), (1, 0)]
+    """
+    offsets = []
+    for diff_h in range(-tolerance, tolerance + 1):
+        left = tolerance - abs(diff_h)
+        for diff_a in range(-left, left + 1):
+            offsets.append((diff_h, diff_a))
+    return offsets
+
+
+def _column(matches, name):
+    """The values of a field of a list of namedtuples
+    """
+    return list(map(attrgetter(name), matches))
+
+
+def _team_ids(matches):
+    """Ids of the home and away team fnames, and the fname of each id
+    """
+    codes, names = pd.factorize(np.array(_column(matches, 'th_fname') +
+                                         _column(matches, 'ta_fname'),
+                                         dtype=object))
+    codes = codes.astype(np.int64)
+    n = len(matches)
+    return codes[:n], codes[n:], list(names)
+
+
+def _ranges(starts, counts):
+    """Concatenate the ranges [start, start + count)
+
+    Examples:
+
+        >>> _ranges(np.array([10, 20]), np.array([2, 3])).tolist()
+        [10, 11, 20, 21, 22]
+    """
+    total = counts.sum()
+    offsets = np.repeat(starts - (np.cumsum(counts) - counts), counts)
+    return offsets + np.arange(total)
+
+
+class MatchArrays(object):
+    """Loteca matches (a list of `match_store.Match`) and BetExplorer
+    matches (a `match_store.MatchStore`) encoded as arrays
+
+    Loteca matches are referred to by their position in `loteca_matches`, and
+    BetExplorer matches by their position in `betexp_matches`.
+    """
+    def __init__(self, loteca_matches, betexp_matches):
+        self.lt = self._encode(loteca_matches)
+        self.be, self.be_names = self._encode_store(betexp_matches)
+
+        # team ids (each side has its own)
+        self.lt['th'], self.lt['ta'], self.lt_names = _team_ids(
+                loteca_matches)
+        self.lt_ids = {name: i for i, name in enumerate(self.lt_names)}
+        self.be_ids = {name: i for i, name in enumerate(self.be_names)}
+
+        # sort BetExplorer matches by (score, day)
+        be = self.be
+        self.max_goals = int(max(be['score_h'].max(initial=0),
+                                 be['score_a'].max(initial=0)))
+        self.min_day = int(be['day'].min(initial=0))
+        self.max_day = int(be['day'].max(initial=0))
+        codes = self._code(be['score_h'].astype(np.int64),
+                           be['score_a'].astype(np.int64),
+                           be['day'].astype(np.int64))
+        self.order = np.argsort(codes, kind='stable')
+        self.codes = codes[self.order]
+
+    @staticmethod
+    def _encode(matches):
+        def column(name, dtype=np.int64):
+            return np.array(_column(matches, name), dtype=dtype)
+
+        def under(name):
+            return np.array([-1 if u is None else u
+                             for u in _column(matches, name)],
+                            dtype=np.int64)
+
+        return {
+            'day': np.array([d.toordinal() for d in _column(matches, 'date')],
+                            dtype=np.int64),
+            'score_h': column('score_h'),
+            'score_a': column('score_a'),
+            'th_under': under('th_under'),
+            'ta_under': under('ta_under'),
+            'th_women_flag': column('th_women_flag', bool),
+            'ta_women_flag': column('ta_women_flag', bool),
+        }
+
+    @staticmethod
+    def _encode_store(store):
+        """The columns of a MatchStore, with team ids of fnames (instead of
+        team strings), and the fname of each id
+
+        The columns keep the small types of the store, what is known about
+        the teams is looked up from the teams table by team code.
+        """
+        teams = store.teams
+        fname_ids, names = pd.factorize(
+                np.array([t.fname for t in teams], dtype=object))
+        fname_ids = fname_ids.astype(np.int32)
+        unders = np.array([-1 if t.under is None else t.under
+                           for t in teams], dtype=np.int16)
+        women_flags = np.array([t.women_flag for t in teams], dtype=bool)
+
+        be = {'day': store.day,
+              'score_h': store.score_h,
+              'score_a': store.score_a}
+        for side in ['th', 'ta']:
+            codes = getattr(store, side)
+            be[side] = fname_ids[codes]
+            be[side + '_under'] = unders[codes]
+            be[side + '_women_flag'] = women_flags[codes]
+        return be, list(names)
+
+    def _code(self, score_h, score_a, day):
+        """A single integer that sorts by (score, day)
+
+        Days outside the BetExplorer dates are clipped to the day just before
+        (or just after) them.
+        """
+        day = np.clip(day, self.min_day - 1, self.max_day + 1)
+        days = self.max_day - self.min_day + 3
+        goals = self.max_goals + 1
+        return (score_h * goals + score_a) * days + (day - self.min_day + 1)
+
+    def candidates(self, positions, score_tolerance=0,
+                   date_tolerance=timedelta()):
+        """Pairs of matches with date and score within tolerance, and the
+        same women flags and unders
+
+        Returns:
+            Two arrays, the loteca positions and the BetExplorer positions of
+            each pair. Pairs are sorted by loteca position and then by
+            BetExplorer position.
+        """
+        positions = np.asarray(positions, dtype=np.int64)
+        lt, be = self.lt, self.be
+        day = lt['day'][positions]
+        days = date_tolerance.days
+
+        lt_found = []
+        be_found = []
+        for diff_h, diff_a in score_offsets(score_tolerance):
+            score_h = lt['score_h'][positions] + diff_h
+            score_a = lt['score_a'][positions] + diff_a
+            valid = ((score_h >= 0) & (score_h <= self.max_goals) &
+                     (score_a >= 0) & (score_a <= self.max_goals))
+            score_h = np.where(valid, score_h, 0)
+            score_a = np.where(valid, score_a, 0)
+
+            start = np.searchsorted(
+                    self.codes, self._code(score_h, score_a, day - days),
+                    side='left')
+            end = np.searchsorted(
+                    self.codes, self._code(score_h, score_a, day + days),
+                    side='right')
+            counts = np.where(valid, end - start, 0)
+
+            lt_found.append(np.repeat(positions, counts))
+            be_found.append(self.order[_ranges(start, counts)])
+
+        lt_pos = np.concatenate(lt_found)
+        be_pos = np.concatenate(be_found)
+
+        # basic team
+        keep = np.ones(len(lt_pos), dtype=bool)
+        for name in ['th_women_flag', 'ta_women_flag', 'th_under',
+                     'ta_under']:
+            keep &= lt[name][lt_pos] == be[name][be_pos]
+        lt_pos, be_pos = lt_pos[keep], be_pos[keep]
+
+        order = np.lexsort((be_pos, lt_pos))
+        return lt_pos[order], be_pos[order]
+
+    def same_teams(self, lt_pos, be_pos, side, teams_fn, teamsd=None):
+        """Compare the teams of pairs of matches
+
+        Args:
+            lt_pos, be_pos: The pairs (see `candidates`).
+            side: Either 'th' (home teams) or 'ta' (away teams).
+            teams_fn: The comparison function, called once for each distinct
+                pair of names.
+            teamsd: If given, `teams_fn` is taken to be (loteca fname ->
+                BetExplorer fname in `teamsd[loteca fname]`), and the pairs
+                are looked up in `teamsd` directly.
+
+        Returns:
+            A boolean array.
+        """
+        n_be = len(self.be_names)
+        pairs = self.lt[side][lt_pos] * n_be + self.be[side][be_pos]
+
+        if teamsd is not None:
+            allowed = [self.lt_ids[lt_name] * n_be + self.be_ids[be_name]
+                       for lt_name, be_names in teamsd.items()
+                       if lt_name in self.lt_ids
+                       for be_name in be_names
+                       if be_name in self.be_ids]
+            return np.isin(pairs, np.array(allowed, dtype=np.int64))
+
+        unique, inverse = np.unique(pairs, return_inverse=True)
+        same = [teams_fn(self.lt_names[p // n_be], self.be_names[p % n_be])
+                for p in unique.tolist()]
+        return np.array(same, dtype=bool)[inverse.reshape(-1)]
+
+    def link_pass(self, positions, teams_fn, needed_teams=2, teamsd=None,
+                  **kwargs):
+        """Find the BetExplorer matches of loteca matches, for a pass
+
+        The arguments are the ones of `ltb_matches.is_same_teams` and
+        `ltb_matches.filter_matches` (see `same_teams` for `teamsd`).
+
+        Returns:
+            A dict (loteca position -> (candidates, matching)), where
+            `candidates` are the BetExplorer positions with date, score and
+            basic team within tolerance, and `matching` the ones whose teams
+            are the same as well (both sorted).
+        """
+        lt_pos, be_pos = self.candidates(positions, **kwargs)
+
+        if needed_teams in [1, 2]:
+            same = self.same_teams(lt_pos, be_pos, 'th', teams_fn, teamsd)
+            # away teams are only compared when they decide
+            if needed_teams == 2:
+                rest = np.flatnonzero(same)
+            else:
+                rest = np.flatnonzero(~same)
+            same[rest] = self.same_teams(lt_pos[rest], be_pos[rest], 'ta',
+                                         teams_fn, teamsd)
+        else:
+            same = np.ones(len(lt_pos), dtype=bool)
+
+        # group the pairs by loteca match
+        starts = np.flatnonzero(np.diff(lt_pos, prepend=-1))
+        ends = np.append(starts[1:], len(lt_pos))
+        be_pos = be_pos.tolist()
+        same = same.tolist()
+
+        found = {}
+        for lt, start, end in zip(lt_pos[starts].tolist(), starts.tolist(),
+                                  ends.tolist()):
+            candidates = be_pos[start:end]
+            found[lt] = (candidates, [be for be, s in zip(
+                candidates, same[start:end]) if s])
+        return found
+
+    def link_pass_parallel(self, positions, jobs, **kwargs):
+        """Same as `link_pass`, with the work split among `jobs` processes
+
+        The loteca matches are sorted by date and split into windows of
+        consecutive dates, one task each. The processes are forked, so they
+        share the arrays (and the teams dictionary, as it is now) with this
+        one, and only the positions and the results are sent between them.
+        Each loteca match is looked for on its own, so the result is the
+        same for any split.
+        """
+        global _shared
+
+        positions = np.asarray(positions, dtype=np.int64)
+        days = self.lt['day'][positions]
+        positions = positions[np.argsort(days, kind='stable')]
+        windows = [w for w in np.array_split(positions, jobs * 4) if len(w)]
+
+        _shared = (self, kwargs)
+        try:
+            context = multiprocessing.get_context('fork')
+            with context.Pool(jobs) as pool:
+                results = pool.map(_link_window, windows)
+        finally:
+            _shared = None
+
+        found = {}
+        for result in results:
+            found.update(result)
+        return found
@@ -0,0 +1,137 @@
+"""Matches, one at a time (`Match`) or column by column (`MatchStore`)
+
+There are a few hundred BetExplorer matches for each loteca match, and only
+the ones close to a loteca match are ever looked at one at a time. So the
+BetExplorer matches are kept as compact columns, one row per match:
+
+    id      fixed width bytes (utf-8)
+    day     day number (`date.toordinal`), int32
+    score   goals of each team, int8
+    team    codes (int32) into a table of the distinct team strings, which
+            holds what is known about each string (fname, under, women flag)
+
+which is about 20 bytes per match (with 8 character ids) instead of a
+namedtuple of python objects (a few hundred). A `Match` is only built when a
+row is asked for.
+"""
+from collections import namedtuple
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+
+# Match object
+
+# id = (DataFrame index - Loteca) | (identifier from site - BetExplorer)
+# date = python date object
+# h = Home
+# a = Away
+# th = Team Home
+# ta = Team Away
+fields = ('id '
+          'date '
+          'score_h score_a '
+          'th_string ta_string '
+          'th_fname ta_fname '
+          'th_under ta_under '
+          'th_women_flag ta_women_flag')
+
+Match = namedtuple('Match', fields)
+
+# what is known about a team string
+TeamName = namedtuple('TeamName', 'string fname under women_flag')
+
+
+def encode_ids(ids):
+    """Match ids as an array of UTF-8 bytes (what MatchStore keeps)
+
+    Examples:
+
+        >>> encode_ids(['a1', 'b22'])
+        array([b'a1', b'b22'], dtype='|S3')
+    """
+    ids = np.asarray(ids)
+    if ids.dtype.kind == 'S':
+        return ids
+    return np.array([i.encode('utf-8') for i in ids.tolist()], dtype='S')
+
+
+class MatchStore(object):
+    """Matches stored column by column
+
+    Args:
+        ids: The match ids (strings, or already encoded by `encode_ids`).
+        days: The day number of each match (see `date.toordinal`).
+        score_h, score_a: The goals of each team.
+        th, ta: The code of each team, a position in `teams`.
+        teams: A list of TeamName.
+
+    Rows are `Match` objects, built when asked for:
+
+        >>> store = MatchStore(['a1', 'b2'], [733772, 733773], [2, 0],
+        ...                    [1, 0], [0, 1], [1, 0],
+        ...                    [TeamName('Gremio', 'gremio', None, False),
+        ...                     TeamName('Santos', 'santos', None, False)])
+        >>> len(store), store[1].date, store[1].th_fname
+        (2, datetime.date(2010, 1, 1), 'santos')
+        >>> store.positions(['b2', 'c3']).tolist()
+        [1, -1]
+    """
+    def __init__(self, ids, days, score_h, score_a, th, ta, teams):
+        self.ids = encode_ids(ids)
+        self.day = np.asarray(days, dtype=np.int32)
+        self.score_h = np.asarray(score_h, dtype=np.int8)
+        self.score_a = np.asarray(score_a, dtype=np.int8)
+        self.th = np.asarray(th, dtype=np.int32)
+        self.ta = np.asarray(ta, dtype=np.int32)
+        self.teams = list(teams)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, i):
+        return self.rows([i])[0]
+
+    def __iter__(self):
+        return iter(self.rows(range(len(self))))
+
+    @property
+    def nbytes(self):
+        """Bytes taken by the columns (the teams table is not counted)"""
+        return sum(column.nbytes for column in (
+            self.ids, self.day, self.score_h, self.score_a, self.th, self.ta))
+
+    def rows(self, positions):
+        """The matches in some positions, as a list of Match"""
+        if not len(positions):
+            return []
+        positions = np.asarray(positions, dtype=np.int64)
+        home, away = self.team_names(positions)
+        return [Match(i, date.fromordinal(d), sh, sa,
+                      h.string, a.string, h.fname, a.fname,
+                      h.under, a.under, h.women_flag, a.women_flag)
+                for i, d, sh, sa, h, a in zip(
+                    [i.decode('utf-8') for i in self.ids[positions].tolist()],
+                    self.day[positions].tolist(),
+                    self.score_h[positions].tolist(),
+                    self.score_a[positions].tolist(),
+                    home, away)]
+
+    def team_names(self, positions):
+        """The home and away teams (TeamName) of the matches in some
+        positions, as two lists
+        """
+        positions = np.asarray(positions, dtype=np.int64)
+        teams = self.teams
+        return ([teams[c] for c in self.th[positions].tolist()],
+                [teams[c] for c in self.ta[positions].tolist()])
+
+    def fnames(self):
+        """The distinct team fnames"""
+        return set(team.fname for team in self.teams)
+
+    def positions(self, ids):
+        """The position of each match id (-1 for the ones not here)"""
+        return pd.Index(self.ids).get_indexer(
+            [i.encode('utf-8') for i in ids])
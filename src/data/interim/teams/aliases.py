@@ -0,0 +1,88 @@
+"""Registry of team aliases
+
+An alias links a loteca team (fname with state, e.g. 'atletico (MG)') into
+a BetExplorer team fname. Aliases are found by `ltb_teams` (comparing the
+team names) and by `ltb_matches` (teams of linked matches), and saved into
+the 'team_aliases' table, so that later runs can start from what was found
+before instead of looking for every team again.
+
+Each alias records where it came from:
+
+    source      the script that found it ('ltb_teams' or 'ltb_matches')
+    found_by    the rule or pass that found it ('exact', 'fuzzy' or the
+                description of the `ltb_matches` pass)
+    confidence  how sure we are about it, from 0 to 1 (1 for exact names,
+                the similarity for fuzzy names, a fixed value for each
+                `ltb_matches` pass)
+"""
+import sqlite3
+from collections import defaultdict, namedtuple
+
+from src.profiling import count_rows
+
+
+TABLE = 'team_aliases'
+
+Alias = namedtuple('Alias',
+                   'loteca_team betexp_team source found_by confidence')
+
+
+def create_table(conn):
+    """Create the table where the aliases are saved
+    """
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS {} (
+          loteca_team  TEXT  NOT NULL,
+          betexp_team  TEXT  NOT NULL,
+          source       TEXT  NOT NULL,
+          found_by     TEXT  NOT NULL,
+          confidence   REAL  NOT NULL,
+
+          PRIMARY KEY (loteca_team, betexp_team)
+        )""".format(TABLE))
+    conn.commit()
+
+
+def load_aliases(db):
+    """Load all the aliases saved
+
+    Returns:
+        A list of Alias.
+    """
+    conn = sqlite3.connect(db)
+    create_table(conn)
+    q = "SELECT {} FROM {}".format(', '.join(Alias._fields), TABLE)
+    aliases = [Alias(*row) for row in conn.execute(q)]
+    conn.close()
+    count_rows('in', TABLE, aliases)
+    return aliases
+
+
+def save_aliases(db, aliases, replace_source=None):
+    """Save aliases, replacing the ones already saved for the same teams
+
+    Args:
+        db: The SQLite file.
+        aliases: A list of Alias.
+        replace_source: If given, the aliases saved from this source are
+            removed first (for sources that found all of them again).
+    """
+    conn = sqlite3.connect(db)
+    create_table(conn)
+    if replace_source is not None:
+        q = "DELETE FROM {} WHERE source == ?".format(TABLE)
+        conn.execute(q, (replace_source,))
+    q = "INSERT OR REPLACE INTO {} VALUES (?, ?, ?, ?, ?)".format(TABLE)
+    conn.executemany(q, aliases)
+    conn.commit()
+    conn.close()
+    count_rows('out', TABLE, aliases)
+
+
+def aliases_dict(aliases):
+    """A teams dictionary (loteca team -> set of BetExplorer teams)
+    """
+    teams = defaultdict(set)
+    for alias in aliases:
+        teams[alias.loteca_team].add(alias.betexp_team)
+    return teams
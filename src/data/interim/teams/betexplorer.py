@@ -4,8 +4,12 @@ import sqlite3
 
 import pandas as pd
 
-from src.util import re_strip
-from src.data.interim.teams.commons import Team
+from src import util
+from src.data.interim.teams.cache import (NameCache, Parser,
+                                          source_version, to_objects)
+from src.data.interim.teams.commons import teams_from_frame
+from src.profiling import count_rows
+from src.util import STRIP_RE, re_strip
 
 
 LEAGUE_DICT = {
@@ -32,6 +36,12 @@ LEAGUE_DICT = {
 }
 
 
+AM_RE = re.compile(r'\(Am\)')
+WOMEN_RE = re.compile(r'\bW\b')
+UNDER_RE = re.compile(r'\bU(\d{2})\b')
+COUNTRY_RE = re.compile(r'\(([a-zA-Z]{3})\)')
+
+
 def parse_string(betexplorer_string):
     """Parse a BetExplorer team string
 
@@ -40,24 +50,24 @@ def parse_string(betexplorer_string):
     str = betexplorer_string
 
     # flags
-    str, am = re.subn(r'\(Am\)', '', str)
-    str, women = re.subn(r'\bW\b', '', str)
+    str, am = AM_RE.subn('', str)
+    str, women = WOMEN_RE.subn('', str)
     am_flag = am > 0
     women_flag = women > 0
 
     # under XX
-    under = re.search(r'\bU(\d{2})\b', str)
+    under = UNDER_RE.search(str)
     if under:
         under = int(under.group(1))
-        str = re.sub(r'\bU\d{2}\b', '', str)
+        str = UNDER_RE.sub('', str)
     else:
         under = None
 
     # country
-    country = re.search(r'\(([a-zA-Z]{3})\)', str)
+    country = COUNTRY_RE.search(str)
     if country:
         country = country.group(1)
-        str = re.sub(r'\(([a-zA-Z]{3})\)', '', str)
+        str = COUNTRY_RE.sub('', str)
     else:
         country = None
 
@@ -71,122 +81,162 @@ def format_name(name):
     return name.lower()
 
 
-def generate_states_dict(conn):
-    """Generates a dict that maps (BE fname -> BE state)
+def parse_team(betexplorer_string):
+    """Parse a BetExplorer team string and format its name
 
-    If we could not guess the state, it won't be present in the dictionary.
+    Returns:
+        A tuple (name, am_flag, women_flag, under, country, fname).
+    """
+    parsed = parse_string(betexplorer_string)
+    return parsed + (format_name(parsed[0]),)
 
-    In case there are more than one possible states for a given fname, the
-    function will log an error and set the state to UN.
+
+def parse_teams(betexplorer_strings):
+    """Parse many BetExplorer team strings at once
+
+    The same as calling `parse_team` on each string, but done with the
+    pandas string methods over the whole array.
+
+    Returns:
+        A DataFrame with the columns of `parse_team` (one row per string).
+        Values are python objects (missing values are None).
+    """
+    strings = pd.Series(betexplorer_strings, dtype=object)
+    df = pd.DataFrame(index=strings.index)
+
+    # flags
+    df['am_flag'] = strings.str.contains(AM_RE)
+    strings = strings.str.replace(AM_RE, '', regex=True)
+    df['women_flag'] = strings.str.contains(WOMEN_RE)
+    strings = strings.str.replace(WOMEN_RE, '', regex=True)
+
+    # under XX
+    df['under'] = strings.str.extract(UNDER_RE, expand=False)
+    strings = strings.str.replace(UNDER_RE, '', regex=True)
+
+    # country
+    df['country'] = strings.str.extract(COUNTRY_RE, expand=False)
+    strings = strings.str.replace(COUNTRY_RE, '', regex=True)
+
+    # the rest is the name of the team
+    df['name'] = strings.str.extract(STRIP_RE, expand=False)
+    df['fname'] = df.name.str.lower()
+
+    df['under'] = pd.to_numeric(df.under)
+    return to_objects(df[list(PARSED_COLUMNS)])
+
+
+PARSED_COLUMNS = ('name', 'am_flag', 'women_flag', 'under', 'country', 'fname')
+
+# the version changes with this file and the helpers in `src.util`
+PARSER = Parser('betexplorer', source_version(__file__, util.__file__),
+                PARSED_COLUMNS, parse_team, parse_teams)
+
+
+def retrieve_team_strings(conn):
+    """Retrieve the distinct team strings, in a single query
+
+    Returns:
+        A DataFrame with the columns 'string', 'brazil' (if the team played
+        in a brazilian league) and 'league_name' (only for brazilian
+        leagues, None otherwise). A string shows up once for each of these
+        combinations.
     """
-    # load data
     q = """
-        SELECT team_h, team_a, league_name
-        FROM betexp_matches
-        WHERE league_category == 'brazil'
+        SELECT DISTINCT
+            string,
+            league_category == 'brazil' AS brazil,
+            CASE WHEN league_category == 'brazil' THEN league_name END
+                AS league_name
+        FROM (
+            SELECT team_h AS string, league_category, league_name
+            FROM betexp_matches
+            UNION ALL
+            SELECT team_a AS string, league_category, league_name
+            FROM betexp_matches
+        )
         """
     df = pd.read_sql_query(q, conn)
+    df['brazil'] = df.brazil.astype(bool)
+    return df
 
-    # preprocess dataframe
-    # here we are creating a dataframe with the
-    # following columns: 'fname', 'string' 'league_state'
-    df['league_state'] = df.league_name.apply(lambda x: LEAGUE_DICT.get(x))
 
-    df = pd.concat([
-        df[['team_h', 'league_state']].rename(columns={'team_h': 'string'}),
-        df[['team_a', 'league_state']].rename(columns={'team_a': 'string'})
-    ], axis=0)
+def generate_states_dict(strings, cache):
+    """Generates a dict that maps (BE fname -> BE state)
 
-    df['fname'] = df.string.apply(lambda x: format_name(parse_string(x)[0]))
+    If we could not guess the state, it won't be present in the dictionary.
+
+    In case there are more than one possible states for a given fname, the
+    function will log an error and set the state to UN.
+
+    Args:
+        strings: The brazilian team strings (see `retrieve_team_strings`).
+        cache: The `NameCache` used to parse the strings.
+    """
+    df = strings[['string', 'league_name']].copy()
+    df['league_state'] = df.league_name.map(LEAGUE_DICT)
+    df = df[df.league_state.notnull()]
+
+    df['fname'] = cache.parse_many(PARSER, df.string).fname.values
 
-    # generate dict
     # we want each fname to correspond to exactly one state
-    dict = {}
-    for fname, _df in df.groupby('fname'):
-        states = set(_df.league_state) - {None}
-
-        if len(states) == 0:
-            continue
-        elif len(states) == 1:
-            dict[fname] = states.pop()
-        else:
-            msg = "Found multiple states for fname '{}'"
-            msg = msg.format(fname)
-            logging.error(msg)
-            dict[fname] = 'UN'
-
-    return dict
-
-
-def retrieve_out_teams(conn):
-    # retrieve team strings
-    c = conn.cursor()
-
-    c.execute("SELECT team_h FROM betexp_matches WHERE league_category != 'brazil'")
-    teams_h = set([r[0] for r in c.fetchall()])
-
-    c.execute("SELECT team_a FROM betexp_matches WHERE league_category != 'brazil'")
-    teams_a = set([r[0] for r in c.fetchall()])
-
-    c.close()
-    conn.commit()
-
-    strings = teams_h | teams_a
-
-    # generate Team objects
-    teams = []
-    for string in strings:
-        name, am_flag, women_flag, under, country = parse_string(string)
-        fname = format_name(name)
-        team = Team(string, name, fname,
-                    am_flag=am_flag, women_flag=women_flag,
-                    country=country, under=under)
-        teams.append(team)
-
-    return teams
-
-
-def retrieve_brazilian_teams(conn):
-    # retrieve team strings
-    c = conn.cursor()
-    c.execute("SELECT team_h FROM betexp_matches WHERE league_category == 'brazil'")
-    teams_h = set([r[0] for r in c.fetchall()])
-    c.execute("SELECT team_a FROM betexp_matches WHERE league_category == 'brazil'")
-    teams_a = set([r[0] for r in c.fetchall()])
-    c.close()
-    conn.commit()
-
-    strings = teams_h | teams_a
-
-    # generate Team objects
-    teams = []
-    state_dict = generate_states_dict(conn)
-    for string in strings:
-        name, am_flag, women_flag, under, country = parse_string(string)
-        fname = format_name(name)
-        state = state_dict.get(fname)
-        team = Team(string, name, fname, am_flag=am_flag,
-                    women_flag=women_flag, country=country,
-                    state=state, under=under)
-        teams.append(team)
-
-    return teams
-
-
-def retrieve_teams(in_betexp_db):
+    df = df.drop_duplicates(['fname', 'league_state'])
+    states = df.groupby('fname').league_state.agg(['first', 'count'])
+
+    for fname in states.index[states['count'] > 1]:
+        msg = "Found multiple states for fname '{}'"
+        msg = msg.format(fname)
+        logging.error(msg)
+
+    states = states['first'].where(states['count'] == 1, 'UN')
+    return states.to_dict()
+
+
+def _generate_teams(strings, cache, states_dict=None):
+    df = cache.parse_many(PARSER, strings)
+    df['string'] = strings
+    if states_dict is not None:
+        df['state'] = [states_dict.get(fname) for fname in df.fname]
+    return teams_from_frame(df)
+
+
+def retrieve_out_teams(strings, cache):
+    """Team objects for the teams playing outside of brazilian leagues
+    """
+    strings = strings[~strings.brazil]
+    return _generate_teams(strings.string.unique(), cache)
+
+
+def retrieve_brazilian_teams(strings, cache):
+    """Team objects for the teams playing in brazilian leagues
+    """
+    strings = strings[strings.brazil]
+    states_dict = generate_states_dict(strings, cache)
+    return _generate_teams(strings.string.unique(), cache, states_dict)
+
+
+def retrieve_teams(in_betexp_db, cache=None):
     """Retrieve teams from BetExplorer
 
     Args:
         in_betexp_db: The SQLite file where the BetExplorer matches are saved.
+        cache: The `NameCache` used to parse the team strings (by default, a
+            new one that lives only in memory).
 
     Returns:
         A list of Team objects (commons). Teams are unique.
     """
     conn = sqlite3.connect(in_betexp_db)
-    out_teams = retrieve_out_teams(conn)
-    brazilian_teams = retrieve_brazilian_teams(conn)
+    strings = retrieve_team_strings(conn)
     conn.close()
 
+    if cache is None:
+        cache = NameCache()
+    out_teams = retrieve_out_teams(strings, cache)
+    brazilian_teams = retrieve_brazilian_teams(strings, cache)
+    count_rows('in', 'betexp_teams', out_teams)
+    count_rows('in', 'betexp_teams', brazilian_teams)
+
     return out_teams + brazilian_teams
 
 
@@ -0,0 +1,195 @@
+"""Cache of parsed team names
+
+Parsing a team string (regular expressions, unidecode) is slow compared to
+how many times the same strings show up: there are a few thousand distinct
+team strings for hundreds of thousands of matches. The cache keeps every
+string parsed in memory and, when given a database, saves them in the
+'team_names' table so that the next runs don't parse them again.
+
+Entries are keyed by the parser name and version. The version is derived
+from the source files of the parser (see `source_version`), so whenever a
+parser changes (its code, regular expressions or replacements), the old
+entries are not used anymore, and they are removed on the next save.
+"""
+import hashlib
+import json
+import sqlite3
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from src.profiling import count_rows
+
+
+# name: unique name of the parser
+# version: changes whenever the output of `fn` may change (see
+#     `source_version`)
+# columns: names of the values returned by the parser
+# fn: a function that parses a string into a tuple of values (which must be
+#     serializable as JSON)
+# batch_fn: a function that parses a list of strings into a DataFrame with
+#     `columns` (the same values `fn` would give, see `to_objects`)
+Parser = namedtuple('Parser', 'name version columns fn batch_fn')
+
+
+def source_version(*paths):
+    """A version number derived from the contents of some source files
+
+    Any change to the files gives another number (changes that don't change
+    the output, like comments, only cost parsing the strings again).
+    """
+    digest = hashlib.sha1()
+    for path in paths:
+        with open(path, mode='rb') as f:
+            digest.update(f.read())
+    # fits an SQLite INTEGER
+    return int(digest.hexdigest()[:15], 16)
+
+
+def to_objects(df):
+    """Convert a DataFrame into python objects
+
+    Integers and booleans become python ints and bools (instead of NumPy
+    scalars) and missing values become None, the same values the single
+    string parsers return. Float columns holding integers and NaN become
+    ints and None.
+    """
+    columns = {}
+    for name in df.columns:
+        values = df[name]
+        missing = values.isnull().values
+        if values.dtype.kind == 'f':
+            values = values.fillna(0).astype(np.int64)
+        values = np.array(values.astype(object))
+        values[missing] = None
+        columns[name] = values
+    return pd.DataFrame(columns, index=df.index, columns=df.columns,
+                        dtype=object)
+
+
+class NameCache(object):
+    """Parsed team names, in memory and (optionally) in a database
+
+    Args:
+        db: The SQLite file where the cache is persisted. If None, the cache
+            only lives in memory.
+    """
+    TABLE = 'team_names'
+
+    def __init__(self, db=None):
+        self.db = db
+        self.entries = {}
+        self.loaded = set()
+        self.new = []
+
+    def _load(self, parser):
+        key = (parser.name, parser.version)
+        self.loaded.add(key)
+        if self.db is None:
+            return
+
+        conn = sqlite3.connect(self.db)
+        create_table(conn)
+        q = "SELECT string, parsed FROM {} WHERE parser == ? AND version == ?"
+        rows = conn.execute(q.format(self.TABLE), key).fetchall()
+        conn.close()
+        count_rows('in', self.TABLE, rows)
+
+        for string, parsed in rows:
+            self.entries[key + (string,)] = tuple(json.loads(parsed))
+
+    def parse(self, parser, string):
+        """Parse a string, only calling the parser if it was never parsed
+        """
+        key = (parser.name, parser.version, string)
+        try:
+            return self.entries[key]
+        except KeyError:
+            pass
+
+        if key[:2] not in self.loaded:
+            self._load(parser)
+            if key in self.entries:
+                return self.entries[key]
+
+        parsed = tuple(parser.fn(string))
+        self.entries[key] = parsed
+        self.new.append(key)
+        return parsed
+
+    def parse_many(self, parser, strings):
+        """Parse a list of strings, only calling the parser for the distinct
+        strings that were never parsed (all of them at once)
+
+        Missing strings (None or NaN) are not parsed, their values are all
+        None.
+
+        Returns:
+            A DataFrame with the parser columns, one row per string.
+
+        Examples:
+
+            >>> parser = Parser('upper', 1, ('upper',),
+            ...                 lambda s: (s.upper(),),
+            ...                 lambda ss: pd.DataFrame({'upper': [
+            ...                     s.upper() for s in ss]}))
+            >>> NameCache().parse_many(parser, ['a', None, 'b']).upper.tolist()
+            ['A', None, 'B']
+        """
+        codes, uniques = pd.factorize(np.asarray(strings, dtype=object))
+        uniques = list(uniques)
+
+        if (parser.name, parser.version) not in self.loaded:
+            self._load(parser)
+
+        prefix = (parser.name, parser.version)
+        missing = [s for s in uniques if prefix + (s,) not in self.entries]
+        if missing:
+            parsed = parser.batch_fn(missing)
+            for string, values in zip(missing, parsed.itertuples(
+                    index=False, name=None)):
+                self.entries[prefix + (string,)] = values
+                self.new.append(prefix + (string,))
+
+        rows = [self.entries[prefix + (s,)] for s in uniques]
+        # missing strings have code -1, which picks this last row
+        rows.append((None,) * len(parser.columns))
+        df = pd.DataFrame(rows, columns=list(parser.columns), dtype=object)
+        return df.iloc[codes].reset_index(drop=True)
+
+    def save(self):
+        """Save the strings parsed since the last save into the database
+        """
+        if self.db is None or not self.new:
+            return
+
+        rows = [key + (json.dumps(self.entries[key]),) for key in self.new]
+        conn = sqlite3.connect(self.db)
+        create_table(conn)
+        # entries of other versions of the same parsers are stale
+        q = "DELETE FROM {} WHERE parser == ? AND version != ?"
+        conn.executemany(q.format(self.TABLE),
+                         set(key[:2] for key in self.new))
+        q = "INSERT OR REPLACE INTO {} VALUES (?, ?, ?, ?)"
+        conn.executemany(q.format(self.TABLE), rows)
+        conn.commit()
+        conn.close()
+        count_rows('out', self.TABLE, rows)
+
+        self.new = []
+
+
+def create_table(conn):
+    """Create the table where the cache is persisted
+    """
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS {} (
+          parser   TEXT     NOT NULL,
+          version  INTEGER  NOT NULL,
+          string   TEXT     NOT NULL,
+          parsed   TEXT     NOT NULL,
+
+          PRIMARY KEY (parser, version, string)
+        )""".format(NameCache.TABLE))
+    conn.commit()
@@ -1,37 +1,75 @@
 import re
 
-from src.util import re_strip
+import pandas as pd
+
+from src.util import STRIP_RE, re_strip
+
+
+# compiled patterns used to remove states from fnames (one for each state)
+_STATE_PATTERNS = {}
+
+
+def _state_pattern(state):
+    try:
+        return _STATE_PATTERNS[state]
+    except KeyError:
+        pattern = r'\b{}\b'
+        pattern = re.compile(pattern.format(re.escape(state)))
+        _STATE_PATTERNS[state] = pattern
+        return pattern
+
+
+def remove_state(fname, state):
+    """Try to remove state from fname
+    """
+    if state is None:
+        return fname
+
+    fname_without_state = _state_pattern(state).sub('', fname)
+    return re_strip(fname_without_state)
 
 
 class Team(object):
     """A Team object
 
     Represents a team either from loteca or from BetExplorer.
+
+    The arguments are checked unless `validate` is False (for teams created
+    in bulk from data that has already been parsed, see `teams_from_frame`).
+    `fname_without_state` is calculated when not given.
     """
-    def __init__(self, string, name, fname, 
+    __slots__ = ('string', 'name', 'fname', 'am_flag', 'women_flag',
+                 'country', 'state', 'under', 'fname_without_state')
+
+    def __init__(self, string, name, fname,
                  am_flag=False, women_flag=False,
-                 country=None, state=None, under=None):
-        assert isinstance(string, str)
-        assert isinstance(name, str)
-        assert isinstance(fname, str)
+                 country=None, state=None, under=None,
+                 validate=True, fname_without_state=None):
+        if validate:
+            assert isinstance(string, str)
+            assert isinstance(name, str)
+            assert isinstance(fname, str)
+
+            assert isinstance(am_flag, bool)
+            assert isinstance(women_flag, bool)
+
+            if country is not None:
+                assert isinstance(country, str)
+                assert len(country) == 3
+
+            if state is not None:
+                assert isinstance(state, str)
+                assert len(state) == 2
 
-        assert isinstance(am_flag, bool)
-        assert isinstance(women_flag, bool)
+            if under is not None:
+                assert isinstance(under, int)
+                assert 0 <= under <= 25
 
         if country is not None:
-            assert isinstance(country, str)
-            assert len(country) == 3
             country = country.upper()
-
         if state is not None:
-            assert isinstance(state, str)
-            assert len(state) == 2
             state = state.upper()
 
-        if under is not None:
-            assert isinstance(under, int)
-            assert 0 <= under <= 25
-
         # set values
         self.string = string
         self.name = name
@@ -42,25 +80,9 @@ class Team(object):
         self.state = state
         self.under = under
 
-        # cache placeholder
-        self._fname_without_state = None
-
-    @property
-    def fname_without_state(self):
-        """Try to remove state from fname
-        """
-        if self.state is None:
-            return self.fname
-
-        if self._fname_without_state is None:
-            pattern = r'\b{}\b'
-            pattern = pattern.format(re.escape(self.state))
-            fname_without_state = re.sub(pattern, '', self.fname)
-            fname_without_state = re_strip(fname_without_state)
-            self._fname_without_state = fname_without_state
-            return fname_without_state
-
-        return self._fname_without_state
+        if fname_without_state is None:
+            fname_without_state = remove_state(fname, state)
+        self.fname_without_state = fname_without_state
 
     @property
     def fname_with_state(self):
@@ -76,3 +98,49 @@ class Team(object):
 
     def __repr__(self):
         return 'Team ("{}")'.format(self.string)
+
+
+def teams_from_frame(df, validate=False):
+    """Create Team objects from a DataFrame of parsed teams
+
+    The columns are the arguments of `Team` ('string', 'name', 'fname',
+    'am_flag', 'women_flag', 'country', 'state' and 'under'), with python
+    objects as values (see `cache.to_objects`). Only the first three are
+    required. `fname_without_state` is calculated for all the teams at once.
+    """
+    defaults = {'am_flag': False, 'women_flag': False, 'country': None,
+                'state': None, 'under': None}
+
+    columns = {}
+    for name in ['string', 'name', 'fname']:
+        columns[name] = df[name].values
+    for name, default in defaults.items():
+        if name in df:
+            columns[name] = df[name].values
+        else:
+            columns[name] = [default] * len(df)
+
+    # upper case states and countries
+    for name in ['country', 'state']:
+        values = pd.Series(columns[name], dtype=object)
+        values = values.where(values.isnull(), values.str.upper())
+        columns[name] = values.where(values.notnull(), None).values
+
+    # remove the states from the fnames
+    fnames = pd.Series(columns['fname'], dtype=object)
+    states = pd.Series(columns['state'], dtype=object)
+    without_state = fnames.copy()
+    for state, indexes in states.groupby(states).groups.items():
+        removed = fnames[indexes].str.replace(_state_pattern(state), '',
+                                              regex=True)
+        without_state[indexes] = removed.str.extract(STRIP_RE, expand=False)
+
+    return [Team(string, name, fname, am_flag=am_flag, women_flag=women_flag,
+                 country=country, state=state, under=under,
+                 validate=validate, fname_without_state=fname_ws)
+            for string, name, fname, am_flag, women_flag, country, state,
+                under, fname_ws in zip(
+                    columns['string'], columns['name'], columns['fname'],
+                    columns['am_flag'], columns['women_flag'],
+                    columns['country'], columns['state'], columns['under'],
+                    without_state.values)]
@@ -0,0 +1,109 @@
+"""Fuzzy search of team names
+
+Names are compared by their character trigrams: the similarity of two names
+is the Jaccard index of their trigram sets (shared trigrams / all trigrams).
+An inverted index (trigram -> names with it) makes a query only look at the
+names that share at least one trigram with it.
+
+Names are split in blocks (for example, by women flag, under and state) and
+a query only looks inside its own block, the same way exact comparisons
+never match teams from different blocks.
+"""
+from collections import defaultdict, namedtuple
+
+import numpy as np
+
+
+# score: Jaccard index between the query and the text (0 to 1]
+# text: the name found
+# values: the values added with the name (see `TrigramIndex`)
+Candidate = namedtuple('Candidate', 'score text values')
+
+
+def trigrams(text):
+    """The set of character trigrams of a text
+
+    The text is padded with spaces, so its beginning and its end count as
+    well.
+
+    Examples:
+
+        >>> sorted(trigrams('abc'))
+        ['  a', ' ab', 'abc', 'bc ']
+    """
+    text = '  {} '.format(text)
+    return set(text[i:i + 3] for i in range(len(text) - 2))
+
+
+class _Block(object):
+    """The inverted index of the names of a single block
+    """
+    def __init__(self, texts):
+        self.texts = sorted(texts)
+        self.values = [texts[t] for t in self.texts]
+
+        postings = defaultdict(list)
+        sizes = []
+        for i, text in enumerate(self.texts):
+            grams = trigrams(text)
+            sizes.append(len(grams))
+            for gram in grams:
+                postings[gram].append(i)
+
+        self.sizes = np.array(sizes, dtype=np.int64)
+        self.postings = {g: np.array(ids, dtype=np.int64)
+                         for g, ids in postings.items()}
+
+    def scores(self, grams):
+        """The Jaccard index of every text, and how many trigrams they share
+        """
+        ids = [self.postings[g] for g in grams if g in self.postings]
+        if not ids:
+            return None, None
+
+        shared = np.bincount(np.concatenate(ids), minlength=len(self.texts))
+        return shared / (len(grams) + self.sizes - shared), shared
+
+
+class TrigramIndex(object):
+    """Trigram inverted index over names, split in blocks
+
+    Args:
+        entries: An iterable of (block, text, value) tuples. `block` is any
+            hashable key. The values of repeated (block, text) pairs are
+            grouped into a set.
+    """
+    def __init__(self, entries):
+        texts = defaultdict(lambda: defaultdict(set))
+        for block, text, value in entries:
+            texts[block][text].add(value)
+
+        self.blocks = {block: _Block(block_texts)
+                       for block, block_texts in texts.items()}
+
+    def search(self, block, text, k=5, min_score=0.0):
+        """The `k` most similar names to `text` inside `block`
+
+        Returns:
+            A list of `Candidate`, the most similar first (ties are sorted by
+            text). Only names sharing a trigram with `text` and with a score
+            of at least `min_score` are returned.
+        """
+        b = self.blocks.get(block)
+        if b is None:
+            return []
+
+        scores, shared = b.scores(trigrams(text))
+        if scores is None:
+            return []
+
+        found = np.flatnonzero((shared > 0) & (scores >= min_score))
+        if len(found) > k:
+            # keep every name tied with the k-th best, then sort them
+            kth = np.partition(scores[found], len(found) - k)[len(found) - k]
+            found = found[scores[found] >= kth]
+
+        # `found` is sorted by text, and the sort is stable
+        found = found[np.argsort(-scores[found], kind='stable')][:k]
+        return [Candidate(float(scores[i]), b.texts[i], b.values[i])
+                for i in found]
@@ -1,9 +1,15 @@
 import re
 
+import numpy as np
+import pandas as pd
 from unidecode import unidecode
 
-from src.data.interim.teams.commons import Team
-from src.util import load_pickle, re_strip
+from src.artifacts import load_artifact
+from src import util
+from src.data.interim.teams.cache import (NameCache, Parser,
+                                          source_version, to_objects)
+from src.data.interim.teams.commons import teams_from_frame
+from src.util import STRIP_RE, re_strip
 
 
 REPLACEMENTS = {
@@ -26,6 +32,11 @@ REPLACEMENTS = {
 }
 
 
+SUB20_RE = re.compile(r'\bSUB[ \-]?20\b', flags=re.I)
+JUNIOR_RE = re.compile(r'\bJ[ÚU]NIOR\b', flags=re.I)
+WOMEN_RE = re.compile(r'^F\b', flags=re.I)
+
+
 def parse_string(loteca_string):
     """Parse a loteca string, extracting its token info
 
@@ -38,9 +49,9 @@ def parse_string(loteca_string):
     # re.subn will substitute the string and also return the
     # number of substitutions made (we are using it as a
     # flag)
-    str, u20 = re.subn(r'\bSUB[ \-]?20\b', '', str, flags=re.I)
-    str, junior = re.subn(r'\bJ[ÚU]NIOR\b', '', str, flags=re.I)
-    str, women = re.subn(r'^F\b', '', str, flags=re.I)
+    str, u20 = SUB20_RE.subn('', str)
+    str, junior = JUNIOR_RE.subn('', str)
+    str, women = WOMEN_RE.subn('', str)
     under = 20 if (u20 or junior) else None
     women_flag = women > 0
 
@@ -85,25 +96,91 @@ def format_name(loteca_name):
     return name
 
 
-def retrieve_teams(in_loteca_matches):
+def parse_team(loteca_string):
+    """Parse a loteca team string and format its name
+
+    Returns:
+        A tuple (name, under, women_flag, state, country, fname).
+    """
+    parsed = parse_string(loteca_string)
+    return parsed + (format_name(parsed[0]),)
+
+
+def parse_teams(loteca_strings):
+    """Parse many loteca team strings at once
+
+    The same as calling `parse_team` on each string, but done with the
+    pandas string methods over the whole array (unidecode is called once for
+    each distinct name).
+
+    Returns:
+        A DataFrame with the columns of `parse_team` (one row per string).
+        Values are python objects (missing values are None).
+    """
+    strings = pd.Series(loteca_strings, dtype=object)
+    df = pd.DataFrame(index=strings.index)
+
+    # simple tokens
+    u20 = strings.str.contains(SUB20_RE)
+    strings = strings.str.replace(SUB20_RE, '', regex=True)
+    junior = strings.str.contains(JUNIOR_RE)
+    strings = strings.str.replace(JUNIOR_RE, '', regex=True)
+    df['women_flag'] = strings.str.contains(WOMEN_RE)
+    strings = strings.str.replace(WOMEN_RE, '', regex=True)
+    df['under'] = np.where(u20 | junior, 20, np.nan)
+
+    strings = strings.str.extract(STRIP_RE, expand=False)
+
+    # complex tokens (state, country and name)
+    has_other = strings.str.contains('/', regex=False)
+    parts = strings.str.rpartition('/')
+    name = parts[0].str.extract(STRIP_RE, expand=False)
+    other = parts[2].str.extract(STRIP_RE, expand=False)
+
+    bad = has_other & ~other.str.len().isin([2, 3])
+    if bad.any():
+        raise ValueError("Bad loteca string: {}".format(strings[bad].iloc[0]))
+
+    df['name'] = name.where(has_other, strings)
+    df['state'] = other.str.upper().where(has_other & (other.str.len() == 2))
+    df['country'] = other.str.upper().where(has_other & (other.str.len() == 3))
+
+    # format the names (see `format_name`)
+    names = df.name.unique()
+    fnames = pd.Series([unidecode(n) for n in names], index=names)
+    fnames = fnames.str.lower().str.extract(STRIP_RE, expand=False)
+    fnames = fnames.replace(REPLACEMENTS)
+    df['fname'] = df.name.map(fnames)
+
+    return to_objects(df[list(PARSED_COLUMNS)])
+
+
+PARSED_COLUMNS = ('name', 'under', 'women_flag', 'state', 'country', 'fname')
+
+# the version changes with this file (REPLACEMENTS included) and the
+# helpers in `src.util`
+PARSER = Parser('loteca', source_version(__file__, util.__file__),
+                PARSED_COLUMNS, parse_team, parse_teams)
+
+
+def retrieve_teams(in_loteca_matches, cache=None):
     """Load teams from loteca
 
     Args:
-        - in_loteca_matches: Location of a .pkl file that contains the
+        - in_loteca_matches: Location of the artifact that contains the
               processed loteca matches.
+        - cache: The `NameCache` used to parse the team strings (by default,
+              a new one that lives only in memory).
 
     Returns:
         A list of Team objects (`commons`). Teams are unique.
     """
-    matches = load_pickle(in_loteca_matches)
-    strings = set(matches.team_h) | set(matches.team_a)
-
-    teams = []
-    for string in strings:
-        name, under, women_flag, state, country = parse_string(string)
-        fname = format_name(name)
-        team = Team(string, name, fname, women_flag=women_flag,
-                    country=country, state=state, under=under)
-        teams.append(team)
-
-    return teams
+    matches = load_artifact(in_loteca_matches, columns=['team_h', 'team_a'])
+    strings = list(set(matches.team_h) | set(matches.team_a))
+
+    if cache is None:
+        cache = NameCache()
+    df = cache.parse_many(PARSER, strings)
+    df['string'] = strings
+
+    return teams_from_frame(df)
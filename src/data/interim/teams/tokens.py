@@ -0,0 +1,81 @@
+"""Team names as sets of tokens
+
+Two names are taken to be the same team, flexibly, when the words (longer
+than 2 characters) of one are all in the other, e.g. 'gremio' and 'gremio
+porto alegrense'. Instead of comparing every pair of names, the names are
+indexed by their tokens:
+
+    - the names whose tokens contain the tokens of a query are the ones in
+      the postings of all its tokens;
+    - the names whose tokens are contained in the tokens of a query are the
+      ones whose token set is a subset of the query's (there are few subsets,
+      names have a handful of tokens).
+"""
+from collections import defaultdict
+from itertools import combinations
+
+from src.util import re_split
+
+
+def tokens(name):
+    """The words of a name longer than 2 characters
+
+    Examples:
+
+        >>> sorted(tokens('sao paulo (SP)'))
+        ['paulo', 'sao']
+    """
+    return frozenset(p for p in re_split(name) if len(p) > 2)
+
+
+def subsets(items):
+    """All the subsets of a set (including the empty one and itself)
+
+    Examples:
+
+        >>> sorted(sorted(s) for s in subsets({'a', 'b'}))
+        [[], ['a'], ['a', 'b'], ['b']]
+    """
+    items = sorted(items)
+    for size in range(len(items) + 1):
+        for subset in combinations(items, size):
+            yield frozenset(subset)
+
+
+class TokenIndex(object):
+    """Names indexed by their tokens
+
+    Args:
+        names: An iterable of names (repetitions are ignored).
+    """
+    def __init__(self, names):
+        self.by_tokens = defaultdict(set)
+        self.postings = defaultdict(set)
+        for name in set(names):
+            name_tokens = tokens(name)
+            self.by_tokens[name_tokens].add(name)
+            for token in name_tokens:
+                self.postings[token].add(name)
+        self.names = set().union(*self.by_tokens.values())
+
+    def related(self, name):
+        """The names whose tokens contain, or are contained in, the tokens
+        of `name`
+
+        Examples:
+
+            >>> index = TokenIndex(['gremio', 'gremio porto alegrense',
+            ...                     'porto', 'sao paulo'])
+            >>> sorted(index.related('gremio porto'))
+            ['gremio', 'gremio porto alegrense', 'porto']
+        """
+        name_tokens = tokens(name)
+        if not name_tokens:
+            return set(self.names)
+
+        postings = sorted((self.postings.get(t, set()) for t in name_tokens),
+                          key=len)
+        related = set(postings[0]).intersection(*postings[1:])
+        for subset in subsets(name_tokens):
+            related |= self.by_tokens.get(subset, set())
+        return related
@@ -0,0 +1,97 @@
+"""Conversion of Brazilian formatted text columns
+
+Numbers written the Brazilian way use '.' as the thousands separator and ','
+as the decimal separator (e.g. '1.234.567,89'). Missing values show up as
+' - '. The functions below convert whole Series at once.
+"""
+import numpy as np
+import pandas as pd
+
+
+MISSING_VALUES = [' - ', '-', '']
+
+
+def _missing(series):
+    """Mask of values that are missing
+    """
+    return (series.isnull() | series.isin(MISSING_VALUES)).values
+
+
+def _parse(series):
+    """Parse Brazilian formatted numbers into a float array
+
+    All values are joined into a single string, the separators are swapped
+    there, and numpy parses it in one go.
+    """
+    values = np.array(series, dtype=object)
+    values[_missing(series)] = 'nan'
+
+    text = ' '.join(values)
+    text = text.replace('.', '').replace(',', '.')
+
+    result = np.fromstring(text, dtype=float, sep=' ')
+    if len(result) != len(series):
+        raise ValueError("Could not convert all values into numbers")
+
+    return result
+
+
+def to_float(series):
+    """Convert Brazilian formatted numbers into floats
+
+    Missing values become NaN.
+
+    Examples:
+
+        >>> to_float(pd.Series(['1.234,56', ' - ', '0,5'])).tolist()
+        [1234.56, nan, 0.5]
+
+    Note:
+        Numbers are parsed by numpy, which rounds exactly like python's
+        `float` (`pd.to_numeric` may be off by the last bit).
+    """
+    return pd.Series(_parse(series), index=series.index)
+
+
+def to_int(series, nullable=False):
+    """Convert Brazilian formatted integers (e.g. '1.234') into integers
+
+    Args:
+        series: The text Series (missing values can be None or NaN).
+        nullable: If True, the result has the nullable 'Int64' dtype.
+            Otherwise, the result is int64 when there are no missing values
+            and float64 (with NaN) when there are.
+
+    Examples:
+
+        >>> to_int(pd.Series(['1', '20'])).tolist()
+        [1, 20]
+
+        >>> to_int(pd.Series(['1', None])).tolist()
+        [1.0, nan]
+
+        >>> to_int(pd.Series(['1', None]), nullable=True).tolist()
+        [1, <NA>]
+    """
+    result = pd.Series(_parse(series), index=series.index)
+
+    missing = result.isnull()
+    if (result[~missing] % 1 != 0).any():
+        raise ValueError("Could not convert all values into integers")
+
+    if nullable:
+        return result.astype('Int64')
+    if not missing.any():
+        return result.astype(np.int64)
+    return result
+
+
+def to_bool(series, true='SIM'):
+    """Convert yes/no text into booleans
+
+    Examples:
+
+        >>> to_bool(pd.Series(['SIM', 'NÃO', None])).tolist()
+        [True, False, False]
+    """
+    return series == true
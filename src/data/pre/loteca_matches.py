@@ -1,12 +1,31 @@
-import pickle
+import os
 
 import click
+import numpy as np
 import pandas as pd
 
+from src.artifacts import load_artifact, save_artifact
+from src.profiling import profile_option
+from src.util import iter_pickles
+
+
+# raw match fields and the columns they go into
+FIELDS = [
+    ('icJogo', 'gameno'),
+    ('noTime1', 'team_h'),
+    ('qt_gol_time1', 'goals_h'),
+    ('noTime2', 'team_a'),
+    ('qt_gol_time2', 'goals_a'),
+    ('dt_jogo', 'date'),
+]
+
 
 def extract_matches(rounds):
     """Extract matches for a given list of raw rounds
 
+    The rounds are read only once (they can be any iterable, e.g. a stream
+    of rounds being read from disk) and are not modified.
+
     Args:
         rounds: a list of rounds as retrieved directly from the loteca site
 
@@ -14,29 +33,26 @@ def extract_matches(rounds):
         A DataFrame containing the matches played in the rounds. The DataFrame
         has already been preprocessed, and can be used for further analysis.
     """
-    # retrieve matches (while setting the 'concurso' value)
-    matches = []
+    # retrieve matches, one list per column
+    data = {column: [] for _, column in FIELDS}
+    data['roundno'] = []
     for r in rounds:
-        for m in r['jogos']:
-            m['concurso'] = r['concurso']
-            matches.append(m)
+        matches = r['jogos']
+        data['roundno'].extend([r['concurso']] * len(matches))
+        for field, column in FIELDS:
+            data[column].extend([m[field] for m in matches])
 
-    # create DataFrame
+    # set columns type
     df = pd.DataFrame({
-        'roundno': [m['concurso'] for m in matches],
-        'gameno': [m['icJogo'] for m in matches],
-        'team_h': [m['noTime1'] for m in matches],
-        'team_a': [m['noTime2'] for m in matches],
-        'goals_h': [m['qt_gol_time1'] for m in matches],
-        'goals_a': [m['qt_gol_time2'] for m in matches],
-        'date': [m['dt_jogo'] for m in matches]
+        'roundno': np.array(data['roundno'], dtype=np.int64),
+        'gameno': np.array(data['gameno'], dtype=str).astype(np.int64),
+        'date': pd.to_datetime(np.array(data['date'], dtype=float), unit='ms'),
+        'team_h': np.array(data['team_h'], dtype=object),
+        'goals_h': np.array(data['goals_h'], dtype=str).astype(np.int64),
+        'team_a': np.array(data['team_a'], dtype=object),
+        'goals_a': np.array(data['goals_a'], dtype=str).astype(np.int64),
     })
-
-    # set columns type
-    df['date'] = pd.to_datetime(df.date, unit='ms').dt.normalize()
-    df['gameno'] = df.gameno.apply(int)
-    df['goals_h'] = df.goals_h.apply(int)
-    df['goals_a'] = df.goals_a.apply(int)
+    df['date'] = df.date.dt.normalize()
 
     # create 'happened' column
     df['happened'] = df.date.notnull()
@@ -52,14 +68,61 @@ def extract_matches(rounds):
     return df
 
 
-def _save_matches(in_loteca_site, out_lotecas_matches):
-    with open(in_loteca_site, mode='rb') as fp:
-        rounds = pickle.load(fp)
+def extract_new_matches(rounds, df):
+    """Extract matches only from the rounds that are not in the DataFrame yet
+
+    The new matches are appended to the given DataFrame, continuing its
+    index (the index is used as the match id by the following stages).
+    `rounds` can be a stream: the rounds already extracted are skipped as
+    they are read.
 
-    matches = extract_matches(rounds)
+    A round is new when its number is not in the DataFrame, so rounds
+    collected late (with a number lower than the last one) are extracted
+    too. The match ids are the ones a full extraction gives as long as the
+    new rounds come after all the rounds already extracted (the loteca site
+    collector only appends rounds). Otherwise (or if rounds already extracted
+    are gone), the ids can't be kept and None is returned.
 
-    with open(out_lotecas_matches, mode='wb') as fp:
-        pickle.dump(matches, fp)
+    Returns:
+        The DataFrame with the new matches, or None if all the matches must be
+        extracted again.
+    """
+    extracted = set(df.roundno.unique().tolist())
+    seen = set()
+    new_rounds = []
+    for r in rounds:
+        if r['concurso'] not in extracted:
+            new_rounds.append(r)
+        elif new_rounds:
+            # a new round before one already extracted
+            return None
+        else:
+            seen.add(r['concurso'])
+
+    if seen != extracted:
+        return None
+
+    new_df = extract_matches(new_rounds)
+    if new_df.empty:
+        return df
+
+    new_df.index = new_df.index + (df.index.max() + 1)
+    return pd.concat([df, new_df])
+
+
+def _save_matches(in_loteca_site, out_lotecas_matches, incremental=False):
+    matches = None
+    if incremental and os.path.exists(out_lotecas_matches):
+        matches = load_artifact(out_lotecas_matches)
+        matches = extract_new_matches(iter_pickles(in_loteca_site), matches)
+        if matches is None:
+            click.echo("The rounds are not in the order they were extracted, "
+                       "extracting all the matches again (the match ids may "
+                       "change, run the following stages without "
+                       "--incremental)")
+    if matches is None:
+        matches = extract_matches(iter_pickles(in_loteca_site))
+    save_artifact(out_lotecas_matches, matches)
 
 
 # CLI
@@ -67,23 +130,31 @@ def _save_matches(in_loteca_site, out_lotecas_matches):
 @click.command()
 @click.argument('in-loteca-site', type=click.Path(exists=True))
 @click.argument('out-lotecas-matches', type=click.Path(writable=True))
-def save_matches(in_loteca_site, out_lotecas_matches):
+@click.option('--incremental', is_flag=True,
+              help='Only extract matches from rounds not yet in the output.')
+@profile_option
+def save_matches(in_loteca_site, out_lotecas_matches, incremental):
     """Extract and save matches present in the raw data retrieved from the
     Loteca site. There's more info present in the said data, but, all that we
     care for now is this.
 
+    With --incremental, the matches already saved in 'out-lotecas-matches'
+    are kept, and only the matches from new rounds (the ones not in the
+    output, whatever their number) are extracted. If the rounds are not in
+    the order they were extracted, all the matches are extracted again.
+
     \b
     Inputs:
         in-loteca-site (pkl): a file containing raw rounds extracted from the
-            Loteca site
+            Loteca site (read as a stream, one round at a time)
 
     \b
     Outputs:
-        out-lotecas-matches (pkl): a DataFrame that contains all the matches
+        out-lotecas-matches (cols): a DataFrame that contains all the matches
             played in the rounds from 'in-loteca-site'. The DataFrame has
             already been formatted and can be used without further processing.
     """
-    _save_matches(in_loteca_site, out_lotecas_matches)
+    _save_matches(in_loteca_site, out_lotecas_matches, incremental)
 
 
 if __name__ == '__main__':
@@ -1,8 +1,12 @@
-import pickle
+import os
 
 import click
 import pandas as pd
-import parsel
+from lxml import etree
+
+from src.artifacts import load_artifact, save_artifact
+from src.data.pre import brazilian
+from src.profiling import count_rows, profile_option
 
 
 def _read_int(x):
@@ -12,70 +16,106 @@ def _read_int(x):
         return
 
 
-def _read_float(x):
-        if x == ' - ':
-            return None
-        return float(x.replace('.', '').replace(',', '.'))
+# columns we keep from the file (renamed, in the file order)
+COLUMNS = ['roundno', 'date', 'winners14', 'shared14', 'accumulated',
+           'accumulated14', 'winners13', 'shared13', 'winners12',
+           'shared12', 'total_revenue', 'prize_estimative']
 
+INT_COLUMNS = ['roundno', 'winners14', 'winners13', 'winners12']
+FLOAT_COLUMNS = ['shared14', 'shared13', 'shared12', 'accumulated14',
+                 'total_revenue', 'prize_estimative']
 
-def extract_df(in_loteca_htm):
-    """Preprocess the data in the loteca file
 
-    Returns:
-        A DataFrame with all the rounds present in the Loteca file
+def _first_text(element):
+    """The first text node inside an element (the same as the '::text'
+    selector followed by `extract_first`)
+    """
+    if element.text is not None:
+        return element.text
+    for child in element:
+        if isinstance(child.tag, str):
+            text = _first_text(child)
+            if text is not None:
+                return text
+        if child.tail is not None:
+            return child.tail
+    return None
+
+
+def iter_rows(in_loteca_htm):
+    """Iterate over the rows (tr elements) of the loteca file
+
+    The file is parsed incrementally. Each row is discarded as soon as the
+    next one is requested, so the memory used doesn't grow with the file.
     """
-    # load file
+    context = etree.iterparse(in_loteca_htm, events=('end',), tag='tr',
+                              html=True, encoding='windows-1252')
+    for _, row in context:
+        yield row
+
+        # free the rows already read
+        row.clear()
+        while row.getprevious() is not None:
+            del row.getparent()[0]
+
+
+def iter_rounds(in_loteca_htm, after=None):
+    """Iterate over the rounds in the loteca file
+
+    Args:
+        in_loteca_htm: The loteca file.
+        after: If given, only rounds with a number greater than this one will
+            be yielded (the other rows are skipped before their cells are
+            read).
 
-    with open(in_loteca_htm, mode='rb') as fp:
-        body = fp.read()
-        body = body.decode('windows-1252')
-    selector = parsel.Selector(body)
+    Yields:
+        The header (a list of column names) first, then, a list with the
+        text of each cell, for each round.
+    """
+    rows = iter_rows(in_loteca_htm)
 
-    # core
-    rows = selector.css('tr')
-    header = rows[0]
-    rows = rows[1:]
-    columns = header.css('font::text').extract()
+    header = next(rows)
+    yield [text
+           for font in header.iter('font')
+           for text in [font.text] + [child.tail for child in font]
+           if text is not None]
 
-    rounds = []
     for row in rows:
-        tds = row.css('td')
+        tds = row.findall('.//td')
         td_cnt = len(tds)
         if td_cnt == 28:
             # round row
-            data = [td.css('::text').extract_first() for td in tds]
-            rounds.append(data)
+            if after is not None:
+                roundno = _read_int(_first_text(tds[0]))
+                if roundno is not None and roundno <= after:
+                    continue
+            yield [_first_text(td) for td in tds]
         elif td_cnt == 2:
             # state row
             continue
         else:
             raise ValueError("Loteca file row with different number of cells")
 
-    # create DataFrame
-    df = pd.DataFrame.from_records(rounds, columns=columns)
 
-    # remove columns
-    df = df.drop(['Cidade', 'UF'], axis=1)
-    df = df.drop(['Jogo_%s' % i for i in range(1, 15)], axis=1)
+def convert_df(df):
+    """Rename and convert the types of the columns we keep from the file
+
+    Args:
+        df: A DataFrame with the raw text of the columns in `COLUMNS`.
 
+    Returns:
+        The DataFrame with the right types, indexed by the round number.
+    """
     # rename columns
-    df.columns = ['roundno', 'date', 'winners14', 'shared14', 'accumulated',
-                  'accumulated14', 'winners13', 'shared13', 'winners12',
-                  'shared12', 'total_revenue', 'prize_estimative']
+    df.columns = COLUMNS
 
     # convert types
-    df['roundno'] = df.roundno.apply(_read_int)
     df['date'] = pd.to_datetime(df.date, dayfirst=True)
-    df['winners14'] = df.winners14.apply(_read_int)
-    df['winners13'] = df.winners13.apply(_read_int)
-    df['winners12'] = df.winners12.apply(_read_int)
-    df['shared14'] = df.shared14.apply(_read_float)
-    df['shared13'] = df.shared13.apply(_read_float)
-    df['shared12'] = df.shared12.apply(_read_float)
-    df['accumulated'] = df.accumulated.apply(lambda x: x == 'SIM')
-    df['accumulated14'] = df.accumulated14.apply(_read_float)
-    df['total_revenue'] = df.total_revenue.apply(_read_float)
-    df['prize_estimative'] = df.prize_estimative.apply(_read_float)
+    df['accumulated'] = brazilian.to_bool(df.accumulated)
+    for column in INT_COLUMNS:
+        df[column] = brazilian.to_int(df[column])
+    for column in FLOAT_COLUMNS:
+        df[column] = brazilian.to_float(df[column])
 
     # set index
     df = df.set_index('roundno')
@@ -83,28 +123,88 @@ def extract_df(in_loteca_htm):
     return df
 
 
+def extract_df(in_loteca_htm, after=None):
+    """Preprocess the data in the loteca file
+
+    The file is read row by row and the cells we are interested in go
+    straight into column lists.
+
+    Args:
+        in_loteca_htm: The loteca file.
+        after: If given, only rounds with a number greater than this one will
+            be extracted.
+
+    Returns:
+        A DataFrame with all the rounds present in the Loteca file
+    """
+    rounds = iter_rounds(in_loteca_htm, after=after)
+
+    # columns we keep (we don't need the matches or the cities)
+    header = next(rounds)
+    positions = [i for i, name in enumerate(header)
+                 if name not in ('Cidade', 'UF') and
+                 not name.startswith('Jogo_')]
+    if len(positions) != len(COLUMNS):
+        raise ValueError("Loteca file with unexpected columns")
+
+    columns = [[] for _ in positions]
+    for data in rounds:
+        for column, i in zip(columns, positions):
+            column.append(data[i])
+
+    count_rows('in', in_loteca_htm, columns[0])
+
+    # create DataFrame
+    df = pd.DataFrame(dict(zip(COLUMNS, columns)), columns=COLUMNS)
+
+    return convert_df(df)
+
+
+def extract_new_rounds(in_loteca_htm, df):
+    """Extract only the rounds that are not in the DataFrame yet
+
+    The new rounds are appended to the given DataFrame.
+    """
+    new_df = extract_df(in_loteca_htm, after=df.index.max())
+    if new_df.empty:
+        return df
+
+    # a handful of rounds may leave a column with only missing
+    # values (object dtype), so we let pandas infer the types again
+    return pd.concat([df, new_df]).infer_objects()
+
+
 # CLI
 
 @click.command()
 @click.argument('in-loteca-htm', type=click.Path(exists=True))
 @click.argument('out-loteca-rounds', type=click.Path(writable=True))
-def preprocess_file(in_loteca_htm, out_loteca_rounds):
+@click.option('--incremental', is_flag=True,
+              help='Only extract rounds not yet present in the output.')
+@profile_option
+def preprocess_file(in_loteca_htm, out_loteca_rounds, incremental):
     """Preprocess the data in the loteca file, extracting rounds.
 
+    With --incremental, the rounds already saved in 'out-loteca-rounds' are
+    kept, and only the new rounds are extracted from the file.
+
     \b
     Inputs:
         in-loteca-htm (htm): the raw loteca.htm file
 
     \b
     Outputs:
-        out-loteca-rounds (pkl): contains a DataFrame with all the loteca rounds
+        out-loteca-rounds (cols): contains a DataFrame with all the loteca rounds
     """
     # extract
-    df = extract_df(in_loteca_htm)
+    if incremental and os.path.exists(out_loteca_rounds):
+        df = load_artifact(out_loteca_rounds)
+        df = extract_new_rounds(in_loteca_htm, df)
+    else:
+        df = extract_df(in_loteca_htm)
 
     # save
-    with open(out_loteca_rounds, mode='wb') as fp:
-        pickle.dump(df, fp)
+    save_artifact(out_loteca_rounds, df)
 
 
 if __name__ == '__main__':
@@ -1,33 +1,54 @@
+import os
+
 import click
+import pandas as pd
+
+from src.artifacts import load_artifact, save_artifact
+from src.profiling import profile_option
 
-from src.util import load_pickle, save_pickle
+
+def process_matches(df):
+    """Remove the matches from rounds we are not interested in
+    """
+    # before round 366, we have no revenue information
+    return df[df.roundno >= 366]
 
 
 @click.command()
 @click.argument('in-loteca-matches', type=click.Path(exists=True))
 @click.argument('out-loteca-matches', type=click.Path(writable=True))
-def CLI(in_loteca_matches, out_loteca_matches):
+@click.option('--incremental', is_flag=True,
+              help='Only process matches from rounds not yet in the output.')
+@profile_option
+def CLI(in_loteca_matches, out_loteca_matches, incremental):
     """Process the loteca matches
 
     Right now, all this function will do is remove the matches for rounds we
     are not intereseted in.
 
+    With --incremental, the matches already saved in 'out-loteca-matches' are
+    kept, and only the matches from rounds not in the output are processed.
+
     \b
     Inputs:
-        loteca-matches (pkl): A pandas DataFrame with the preprocessed loteca
+        loteca-matches (cols): A pandas DataFrame with the preprocessed loteca
             matches.
 
     \b
     Outputs:
-        loteca-matches (pkl): A pandas DataFrame with the processed loteca
+        loteca-matches (cols): A pandas DataFrame with the processed loteca
             matches.
     """
-    df = load_pickle(in_loteca_matches)
+    df = load_artifact(in_loteca_matches)
 
-    # before round 366, we have no revenue information
-    df = df[df.roundno >= 366]
+    if incremental and os.path.exists(out_loteca_matches):
+        processed = load_artifact(out_loteca_matches)
+        new_df = df[~df.roundno.isin(processed.roundno.unique())]
+        df = pd.concat([processed, process_matches(new_df)]).sort_index()
+    else:
+        df = process_matches(df)
 
-    save_pickle(out_loteca_matches, df)
+    save_artifact(out_loteca_matches, df)
 
 
 if __name__ == '__main__':
@@ -1,7 +1,12 @@
+import os
+
 import click
 import numpy as np
 import pandas as pd
 
+from src.artifacts import load_artifact, save_artifact
+from src.profiling import profile_option
+
 
 ###############################
 # calculate distributed prizes
@@ -9,34 +14,69 @@ import pandas as pd
 CUTOFF = pd.to_datetime('2016-01-02')
 
 
+# The functions below work both on single values and on arrays (or Series)
+
+
+def _prize_share(date):
+    return np.where(date >= CUTOFF, 0.393, 0.400)
+
+
 def get_totalprize13(total_revenue, date):
-    if date >= CUTOFF:
-        return total_revenue * 0.393 * 0.7 * 0.15 / 1.045
-    else:
-        return total_revenue * 0.400 * 0.7 * 0.15 / 1.045
+    return total_revenue * _prize_share(date) * 0.7 * 0.15 / 1.045
 
 
 def get_totalprize14(total_revenue, acc, date):
-    if date >= CUTOFF:
-        return total_revenue * 0.393 * 0.7 * 0.70 / 1.045 + acc
-    else:
-        return total_revenue * 0.400 * 0.7 * 0.70 / 1.045 + acc
+    return total_revenue * _prize_share(date) * 0.7 * 0.70 / 1.045 + acc
 
 
 def get_accumulated05(total_revenue, date):
-    if date >= CUTOFF:
-        return total_revenue * 0.393 * 0.7 * 0.15 / 1.045
-    else:
-        return total_revenue * 0.400 * 0.7 * 0.15 / 1.045
+    return total_revenue * _prize_share(date) * 0.7 * 0.15 / 1.045
 
 
 ##################################
 # core
 
-def calculate_prizes(df):
+def _shift(values, n):
+    """The values `n` positions before each position (NaN when there are none)
+
+    Works along the last axis, so each row of a 2d array is shifted.
+    """
+    shifted = np.full(values.shape, np.nan)
+    shifted[..., n:] = values[..., :values.shape[-1] - n]
+    return shifted
+
+
+def _previous_rounds(index):
+    """Masks of the rounds whose previous round (i-1) and previous five rounds
+    (i-5 to i-1) are present in the (sorted) index
+    """
+    n = len(index)
+    has_last = np.zeros(n, dtype=bool)
+    has_last[1:] = index[1:] - index[:-1] == 1
+    has_last5 = np.zeros(n, dtype=bool)
+    has_last5[5:] = index[5:] - index[:-5] == 5
+    return has_last, has_last5
+
+
+def _sum_last5(values):
+    """The sum of the five values before each position (missing values count
+    as zero). The values are added in order, as `Series.sum` does.
+    """
+    values = np.where(np.isnan(values), 0.0, values)
+    total = _shift(values, 5)
+    for k in range(4, 0, -1):
+        total = total + _shift(values, k)
+    return total
+
+
+def calculate_prizes(df, start=None):
     """This algorithm will calculate the total amount accumulated and the prizes
     for each Loteca round in the dataset.
 
+    If `start` is given, only rounds starting from it are calculated. The
+    rounds before it must already carry their acc13/acc14/acc05 columns
+    (see `process_new_rounds`).
+
     Columns added:
         acc13/acc14/acc05: the amount of money this round contributes to the
             next ones (the partial amounts accumulated)
@@ -48,58 +88,73 @@ def calculate_prizes(df):
         Some of the data is not possible to retrieve. In these cases, we set a
         value of np.nan
 
+    Note:
+        Everything but the acc14 chain (each round adds to the amount
+        accumulated by the round before it) is calculated over whole arrays.
+        The chain is a plain loop over python floats, which gives exactly the
+        same values as the previous row by row implementation.
+
     Returns:
         A new DataFrame with the columns added.
     """
     df = df.copy()
 
-    # algorithm over the rows
     columns = ['acc13', 'acc14', 'acc05', 'total13', 'total14', 'totalacc']
     for column in columns:
-        df[column] = np.nan
-
-    for i in df.index:
-        # last accumulated 14 rights
-        try:
-            lastacc13 = df.loc[i - 1, 'acc13']
-        except KeyError:
-            lastacc13 = np.nan
-
-        # last accumulated 13 rights
-        try:
-            lastacc14 = df.loc[i - 1, 'acc14']
-        except KeyError:
-            lastacc14 = np.nan
-
-        # accumulated for rounds ending in 0 or 5
-        if i % 5 == 0:
-            values = df.loc[i - 5: i - 1, 'acc05']
-            if values.shape[0] == 5:
-                lastacc05 = values.sum()
-            else:
-                lastacc05 = np.nan
-        else:
-            lastacc05 = 0.0
-
-        # total accumulated (for this round)
-        totalacc = lastacc13 + lastacc14 + lastacc05
-
-        # calculate prizes and stuff
-        total_revenue = df.loc[i, 'total_revenue']
-        date = df.loc[i, 'date']
-        total13 = get_totalprize13(total_revenue, date)
-        total14 = get_totalprize14(total_revenue, totalacc, date)
-        acc13 = total13 if df.loc[i, 'winners13'] == 0 else 0.0
-        acc14 = total14 if df.loc[i, 'winners14'] == 0 else 0.0
-        acc05 = get_accumulated05(total_revenue, date)
-
-        # assign values
-        df.loc[i, 'total13'] = total13
-        df.loc[i, 'total14'] = total14
-        df.loc[i, 'totalacc'] = totalacc
-        df.loc[i, 'acc13'] = acc13
-        df.loc[i, 'acc14'] = acc14
-        df.loc[i, 'acc05'] = acc05
+        if column not in df:
+            df[column] = np.nan
+
+    if not (df.index.is_unique and df.index.is_monotonic_increasing):
+        raise ValueError("The rounds must be sorted by round number")
+
+    index = df.index.values
+    n = len(index)
+
+    # rows to calculate (the others keep their values)
+    first = 0 if start is None else np.searchsorted(index, start)
+    todo = np.arange(n) >= first
+
+    total_revenue = df.total_revenue.values
+    date = df.date
+
+    total13 = get_totalprize13(total_revenue, date)
+    acc13 = np.where(df.winners13 == 0, total13, 0.0)
+    acc13 = np.where(todo, acc13, df.acc13.values)
+    acc05 = get_accumulated05(total_revenue, date)
+    acc05 = np.where(todo, acc05, df.acc05.values)
+
+    has_last, has_last5 = _previous_rounds(index)
+
+    # last accumulated 13 rights
+    lastacc13 = np.where(has_last, _shift(acc13, 1), np.nan)
+
+    # accumulated for rounds ending in 0 or 5
+    lastacc05 = np.where(has_last5, _sum_last5(acc05), np.nan)
+    lastacc05 = np.where(index % 5 == 0, lastacc05, 0.0)
+
+    # the acc14 chain: each round takes what the round before it accumulated
+    prize14 = get_totalprize14(total_revenue, 0.0, date).tolist()
+    winners14 = (df.winners14 == 0).values.tolist()
+    acc14 = df.acc14.values.tolist()
+    totalacc = df.totalacc.values.tolist()
+    has_last_list = has_last.tolist()
+    lastacc13_list = lastacc13.tolist()
+    lastacc05_list = lastacc05.tolist()
+    for p in range(first, n):
+        lastacc14 = acc14[p - 1] if has_last_list[p] else np.nan
+        totalacc[p] = lastacc13_list[p] + lastacc14 + lastacc05_list[p]
+        acc14[p] = prize14[p] + totalacc[p] if winners14[p] else 0.0
+
+    totalacc = np.array(totalacc, dtype=float)
+    total14 = get_totalprize14(total_revenue, totalacc, date)
+
+    # assign values
+    df['total13'] = np.where(todo, total13, df.total13.values)
+    df['total14'] = np.where(todo, total14, df.total14.values)
+    df['totalacc'] = totalacc
+    df['acc13'] = acc13
+    df['acc14'] = np.array(acc14, dtype=float)
+    df['acc05'] = acc05
 
     # only keep rounds where 'totalacc' is present
     df = df[df.totalacc.notnull()]
@@ -107,6 +162,112 @@ def calculate_prizes(df):
     return df
 
 
+###############################
+# prize rule scenarios
+
+# the rules used by `calculate_prizes`
+DEFAULT_RULES = {
+    'share_before': 0.400,  # share of the revenue for prizes before cutoff
+    'share_after': 0.393,   # share of the revenue for prizes after cutoff
+    'cutoff': CUTOFF,
+    'prize_share': 0.7,
+    'share13': 0.15,        # part of the prizes paid to 13 rights
+    'share14': 0.70,        # part of the prizes paid to 14 rights
+    'share05': 0.15,        # part saved for rounds ending in 0 or 5
+    'divisor': 1.045,
+}
+
+
+def calculate_scenarios(df, scenarios):
+    """Calculate the prizes of every round under several prize rules at once
+
+    It is the same algorithm as `calculate_prizes`, but the rules are
+    parameters: each row of `scenarios` is a set of rules and all of them are
+    calculated together, as (scenario x round) arrays. The only loop is the
+    one over the rounds for the acc14 chain, and each of its steps handles all
+    the scenarios.
+
+    Args:
+        df: The rounds (as given to `calculate_prizes`).
+        scenarios: A DataFrame with one row per scenario and the keys of
+            `DEFAULT_RULES` as columns. Missing columns take the default
+            value.
+
+    Returns:
+        A dict with the arrays 'total13', 'total14' and 'totalacc', each with
+        shape (len(scenarios), len(df)). Rounds without enough information
+        are NaN (the rounds `calculate_prizes` would drop).
+    """
+    if not (df.index.is_unique and df.index.is_monotonic_increasing):
+        raise ValueError("The rounds must be sorted by round number")
+
+    rules = {}
+    for name, default in DEFAULT_RULES.items():
+        if name in scenarios:
+            values = scenarios[name].values
+        else:
+            values = np.repeat(default, len(scenarios))
+        if name == 'cutoff':
+            values = pd.to_datetime(values).values
+        rules[name] = values[:, np.newaxis]
+
+    index = df.index.values
+    total_revenue = df.total_revenue.values[np.newaxis, :]
+    date = df.date.values[np.newaxis, :]
+
+    # the same operations (in the same order) as the get_* functions
+    after = date >= rules['cutoff']
+    share = np.where(after, rules['share_after'], rules['share_before'])
+    prizes = total_revenue * share * rules['prize_share']
+    total13 = prizes * rules['share13'] / rules['divisor']
+    prize14 = prizes * rules['share14'] / rules['divisor']
+    acc05 = prizes * rules['share05'] / rules['divisor']
+
+    acc13 = np.where((df.winners13 == 0).values, total13, 0.0)
+
+    has_last, has_last5 = _previous_rounds(index)
+    lastacc13 = np.where(has_last, _shift(acc13, 1), np.nan)
+    lastacc05 = np.where(has_last5, _sum_last5(acc05), np.nan)
+    lastacc05 = np.where(index % 5 == 0, lastacc05, 0.0)
+
+    # the acc14 chain, one round at a time for all scenarios
+    winners14 = (df.winners14 == 0).values
+    totalacc = np.empty(prize14.shape)
+    acc14 = np.empty(prize14.shape)
+    nan = np.full(len(scenarios), np.nan)
+    for p in range(len(index)):
+        lastacc14 = acc14[:, p - 1] if has_last[p] else nan
+        totalacc[:, p] = lastacc13[:, p] + lastacc14 + lastacc05[:, p]
+        if winners14[p]:
+            acc14[:, p] = prize14[:, p] + totalacc[:, p]
+        else:
+            acc14[:, p] = 0.0
+
+    total14 = prize14 + totalacc
+
+    # same rounds as `calculate_prizes` keeps
+    missing = np.isnan(totalacc)
+    total13 = np.where(missing, np.nan, total13)
+
+    return {'total13': total13, 'total14': total14, 'totalacc': totalacc}
+
+
+def add_bets(df):
+    """Add the bet price and the amount of bets made in each round
+    """
+    df = df.copy()
+
+    # add the bet price to count the amount of bets made
+    df['betprice'] = 0.5
+    df.loc[df.date >= pd.to_datetime('2015-05-18'), 'betprice'] = 1.0
+
+    # calculate amount of bets
+    df['betcnt'] = df.total_revenue / df.betprice
+    df['betcnt'] = df.betcnt.apply(int)
+
+    return df
+
+
 def process_loteca_rounds(df):
     """Process the loteca rounds
 
@@ -123,13 +284,8 @@ def process_loteca_rounds(df):
     # only keep rounds that contain the revenue
     df = df[df.total_revenue.notnull()]
 
-    # add the bet price to count the amount of bets made
-    df['betprice'] = 0.5
-    df.loc[df.date >= pd.to_datetime('2015-05-18'), 'betprice'] = 1.0
-
-    # calculate amount of bets
-    df['betcnt'] = df.total_revenue / df.betprice
-    df['betcnt'] = df.betcnt.apply(int)
+    # add bet price and amount of bets
+    df = add_bets(df)
 
     # calculate the prizes
     df = calculate_prizes(df)
@@ -141,16 +297,66 @@ def process_loteca_rounds(df):
     return df
 
 
+def process_new_rounds(df, processed):
+    """Process only the rounds that come after the ones already processed
+
+    The accumulation of a round depends on the 5 rounds before it, so these
+    are taken back from `processed` (the acc14 chain is rebuilt from the
+    saved total14) instead of calculating every round again.
+
+    Args:
+        df: The preprocessed loteca rounds (all of them).
+        processed: The output of `process_loteca_rounds` for the rounds that
+            were already processed.
+
+    Returns:
+        `processed` with the new rounds appended.
+    """
+    last = processed.index.max()
+
+    # only keep rounds that contain the revenue
+    df = df[df.total_revenue.notnull()]
+    if not (df.index > last).any():
+        return processed
+
+    # new rounds, plus the ones they accumulate from
+    df = add_bets(df[df.index > last - 5])
+
+    # accumulated values of the rounds already processed
+    total13 = get_totalprize13(df.total_revenue, df.date)
+    total14 = processed.total14.reindex(df.index)
+    df['acc13'] = np.where(df.winners13 == 0, total13, 0.0)
+    df['acc14'] = np.where(df.winners14 == 0, total14, 0.0)
+    df['acc05'] = get_accumulated05(df.total_revenue, df.date)
+
+    # calculate the prizes for the new rounds
+    df = calculate_prizes(df, start=last + 1)
+    df = df.drop(['acc13', 'acc14', 'acc05'], axis=1)
+    df = df[df.index > last]
+
+    # remove rounds where we couldn't calculate the total prize or accumulated
+    df = df[df.total13.notnull() & df.total14.notnull() & df.totalacc.notnull()]
+
+    return pd.concat([processed, df])
+
+
 ##################################
 # CLI
 
 @click.command()
 @click.argument('in-lotecaf-rounds', type=click.Path(exists=True))
 @click.argument('out-lotecaf-rounds', type=click.Path(writable=True))
-def save_processed_rounds(in_lotecaf_rounds, out_lotecaf_rounds):
-    df = pd.read_pickle(in_lotecaf_rounds)
-    df = process_loteca_rounds(df)
-    df.to_pickle(out_lotecaf_rounds)
+@click.option('--incremental', is_flag=True,
+              help='Only process rounds not yet present in the output.')
+@profile_option
+def save_processed_rounds(in_lotecaf_rounds, out_lotecaf_rounds, incremental):
+    df = load_artifact(in_lotecaf_rounds)
+    if incremental and os.path.exists(out_lotecaf_rounds):
+        processed = load_artifact(out_lotecaf_rounds)
+        df = process_new_rounds(df, processed)
+    else:
+        df = process_loteca_rounds(df)
+    save_artifact(out_lotecaf_rounds, df)
 
 
 if __name__ == '__main__':
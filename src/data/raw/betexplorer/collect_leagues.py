@@ -7,6 +7,7 @@ import click
 from parsel import Selector
 
 from src.data.raw.util import requests_retry_session
+from src.profiling import count_rows, profile_option
 
 
 League = namedtuple('League', 'category, name, year, url')
@@ -76,6 +77,8 @@ def save_leagues(conn, leagues):
     cursor.close()
     conn.commit()
 
+    count_rows('out', 'betexp_leagues', leagues)
+
 
 def prepare_league_url(url, year):
     """Prepares a league URL for saving
@@ -116,6 +119,7 @@ def prepare_league_url(url, year):
 @click.argument('category')
 @click.argument('start-year', type=click.INT)
 @click.argument('out-db', type=click.Path())
+@profile_option
 def CLI(category, start_year, out_db):
     """Extracts leagues from the league pages (see example at [1])
 
@@ -5,6 +5,7 @@ import click
 from parsel import Selector
 
 from src.data.raw.util import requests_retry_session
+from src.profiling import count_rows, profile_option
 
 
 League = namedtuple('League', 'category, name, year, url')
@@ -143,10 +144,12 @@ def retrieve_and_save_matches(conn):
     """Retrieve leagues matches and save them
     """
     leagues = get_leagues(conn)
+    count_rows('in', 'betexp_leagues', leagues)
     for league in leagues:
         click.echo("Retrieving matches from {}".format(league.url))
         is_league_finished = check_finished(league)
         matches = retrieve_matches(league)
+        count_rows('out', 'betexp_matches', matches)
 
         # save
         l = league
@@ -171,6 +174,7 @@ def retrieve_and_save_matches(conn):
 
 @click.command()
 @click.argument('io-db', type=click.Path())
+@profile_option
 def CLI(io_db):
     """Collect matches from BetExplorer leagues
 
@@ -4,8 +4,9 @@ from collections import namedtuple
 import click
 from parsel import Selector
 
+from src.artifacts import load_artifact
 from src.data.raw.util import requests_retry_session
-from src.util import load_pickle
+from src.profiling import count_rows, profile_option
 
 
 Odd = namedtuple('Odd', 'match_id, date, bookmaker, odd_type, odd_target, value')
@@ -158,11 +159,13 @@ def scrap_and_save_odds(conn):
     to_scrap = cursor.fetchall()
     cursor.close()
     conn.commit()
+    count_rows('in', 'betexp_match_checklist', to_scrap)
 
     # scrap and save odds
     for match_id, match_url in to_scrap:
         click.echo("Collecting odds from {}".format(match_url))
         odds = scrap_odds(match_id, match_url)
+        count_rows('out', 'betexp_odds', odds)
         save_odds(conn, match_id, odds)
         import time; time.sleep(1)
 
@@ -170,6 +173,7 @@ def scrap_and_save_odds(conn):
 @click.command()
 @click.argument('in-betexp-matches', type=click.Path(exists=True))
 @click.argument('io-betexp-db', type=click.Path(exists=True))
+@profile_option
 def CLI(io_betexp_db, in_betexp_matches):
     """Collect odds from specified matches (BetExplorer)
 
@@ -185,7 +189,7 @@ def CLI(io_betexp_db, in_betexp_matches):
         betexp-db (sqlite3): The database to which the BetExplorer odds for the
             matches will be saved.
     """
-    matches_ids = load_pickle(in_betexp_matches)
+    matches_ids = load_artifact(in_betexp_matches)
     conn = sqlite3.connect(io_betexp_db)
 
     create_tables(conn)
@@ -1,7 +1,8 @@
 import click
 
 from src.data.raw.util import requests_retry_session
-from src.util import load_pickle, save_pickle
+from src.profiling import profile_option
+from src.util import append_pickles, iter_pickles
 
 
 FIRST_URL = r'http://loterias.caixa.gov.br/wps/portal/loterias/landing/loteca/!ut/p/a1/04_Sj9CPykssy0xPLMnMz0vMAfGjzOLNDH0MPAzcDbz8vTxNDRy9_Y2NQ13CDA3cDYEKIoEKnN0dPUzMfQwMDEwsjAw8XZw8XMwtfQ0MPM2I02-AAzgaENIfrh-FqsQ9wBmoxN_FydLAGAgNTKEK8DkRrACPGwpyQyMMMj0VAbNnwlU!/dl5/d5/L2dBISEvZ0FBIS9nQSEh/pw/Z7_HGK818G0KOCO10AFFGUTGU0004/res/id=buscaResultado/c=cacheLevelPage/=/?timestampAjax={}'
@@ -49,26 +50,25 @@ def collect_and_save_rounds(filepath):
     """
     # get rounds already collected
     try:
-        already_scraped = load_pickle(filepath)
+        already_scraped_nos = [r['concurso'] for r in iter_pickles(filepath)]
     except FileNotFoundError:
-        already_scraped = []
+        already_scraped_nos = []
 
     # determine rounds not yet present
     last_round = get_loteca_last_round()
-    already_scraped_nos = [r['concurso'] for r in already_scraped]
     rounds_to_scrap = sorted(
             set(range(1, last_round + 1)) - set(already_scraped_nos))
 
     click.echo("There are {} rounds to collect".format(len(rounds_to_scrap)))
 
-    # scrap and save
+    # scrap and save (appending to the rounds already saved)
     new_rounds = retrieve_rounds(rounds_to_scrap)
-    all_rounds = already_scraped + new_rounds
-    save_pickle(filepath, all_rounds)
+    append_pickles(filepath, new_rounds)
 
 
 @click.command()
 @click.argument('io-loteca-site', type=click.Path(writable=True))
+@profile_option
 def CLI(io_loteca_site):
     """Collect rounds data from the loteca site
 
@@ -79,13 +79,13 @@ def CLI(io_loteca_site):
 
     \b
     Inputs:
-        loteca-site (pkl): A list of dictionaries corresponding to rounds
-            already scraped.
+        loteca-site (pkl): A stream of dictionaries corresponding to rounds
+            already scraped (see `src.util.iter_pickles`).
 
     \b
     Outputs:
-        loteca-site (pkl): Same as the input. The new rounds will be saved
-            here.
+        loteca-site (pkl): Same as the input. The new rounds will be
+            appended to it, one pickle per round.
     """
     collect_and_save_rounds(io_loteca_site)
 
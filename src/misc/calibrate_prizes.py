@@ -0,0 +1,103 @@
+import click
+import numpy as np
+import pandas as pd
+
+from src.artifacts import load_artifact
+from src.data.process.loteca_rounds import (DEFAULT_RULES, add_bets,
+                                            calculate_scenarios)
+from src.profiling import profile_option
+
+
+def relative_errors(predicted, winners, shared):
+    """Mean relative error of the predicted total prizes of each scenario
+
+    The observed total prize of a round is the amount paid to each winner
+    times the amount of winners, so only rounds with winners are used.
+
+    Returns:
+        A tuple (errors, amount of rounds used), both with one value per
+        scenario.
+    """
+    observed = (shared * winners).values
+    valid = (winners > 0).values & ~np.isnan(observed)
+
+    predicted = predicted[:, valid]
+    observed = observed[valid]
+
+    errors = np.abs(predicted - observed) / observed
+    used = (~np.isnan(errors)).sum(axis=1)
+    with np.errstate(invalid='ignore'):
+        mean = np.nansum(errors, axis=1) / used
+
+    return mean, used
+
+
+def evaluate_scenarios(df, scenarios, chunk_size):
+    """Calculate the errors of each scenario against the observed prizes
+
+    The scenarios are calculated `chunk_size` at a time, so that the
+    (scenario x round) arrays fit in memory.
+    """
+    results = []
+    for start in range(0, len(scenarios), chunk_size):
+        chunk = scenarios.iloc[start:start + chunk_size]
+        prizes = calculate_scenarios(df, chunk)
+
+        result = chunk.copy()
+        result['err13'], result['rounds13'] = relative_errors(
+                prizes['total13'], df.winners13, df.shared13)
+        result['err14'], result['rounds14'] = relative_errors(
+                prizes['total14'], df.winners14, df.shared14)
+        results.append(result)
+
+    return pd.concat(results)
+
+
+@click.command()
+@click.argument('in-loteca-rounds', type=click.Path(exists=True))
+@click.argument('in-scenarios', type=click.Path(exists=True))
+@click.argument('out-errors', type=click.Path(writable=True))
+@click.option('--chunk-size', type=click.INT, default=1000,
+              help='Amount of scenarios calculated at once.')
+@profile_option
+def CLI(in_loteca_rounds, in_scenarios, out_errors, chunk_size):
+    """Calibrate the prize rules against the prizes paid
+
+    Each scenario is a set of prize rules (see `DEFAULT_RULES` in
+    src/data/process/loteca_rounds.py). The total prizes of every round are
+    calculated under each scenario and compared with the prizes actually paid
+    to the 13 and 14 rights winners.
+
+    \b
+    Inputs:
+        loteca-rounds (DataFrame): The preprocessed loteca rounds.
+        scenarios (csv): One scenario per line, with the rule names as
+            columns. Rules not given take their default value.
+
+    \b
+    Outputs:
+        errors (csv): The scenarios with their mean relative errors
+            (err13/err14) and the amount of rounds compared, best first.
+    """
+    df = load_artifact(in_loteca_rounds)
+    df = add_bets(df[df.total_revenue.notnull()])
+
+    scenarios = pd.read_csv(in_scenarios)
+    unknown = set(scenarios.columns) - set(DEFAULT_RULES)
+    if unknown:
+        raise click.BadParameter(
+                "Unknown rules: {}".format(', '.join(sorted(unknown))),
+                param_hint='in-scenarios')
+    if 'cutoff' in scenarios:
+        scenarios['cutoff'] = pd.to_datetime(scenarios.cutoff)
+
+    errors = evaluate_scenarios(df, scenarios, chunk_size)
+    errors = errors.sort_values(by=['err14', 'err13'])
+    errors.to_csv(out_errors, index=False)
+
+    click.echo("Best scenarios:")
+    click.echo(errors.head().to_string(index=False))
+
+
+if __name__ == '__main__':
+    CLI()
@@ -0,0 +1,88 @@
+import json
+import os
+import pstats
+
+import click
+
+
+def load_report(run_dir):
+    """Load the report and the cProfile stats from a profiling run
+    """
+    with open(os.path.join(run_dir, 'report.json')) as f:
+        report = json.load(f)
+    stats = pstats.Stats(os.path.join(run_dir, 'profile.prof'))
+    return report, stats
+
+
+def format_function(key):
+    filename, line, name = key
+    return '{}:{}({})'.format(os.path.basename(filename), line, name)
+
+
+def compare_stats(stats1, stats2, limit):
+    """Compare cumulative times of the functions in two cProfile runs
+
+    Returns:
+        A list of (function, cumtime1, cumtime2) tuples, sorted by the
+        absolute difference in cumulative time (biggest first).
+    """
+    # stats.stats maps (file, line, name) -> (cc, nc, tt, ct, callers)
+    s1 = stats1.stats
+    s2 = stats2.stats
+
+    rows = []
+    for key in set(s1) | set(s2):
+        ct1 = s1[key][3] if key in s1 else 0.0
+        ct2 = s2[key][3] if key in s2 else 0.0
+        rows.append((format_function(key), ct1, ct2))
+
+    rows.sort(key=lambda r: abs(r[2] - r[1]), reverse=True)
+    return rows[:limit]
+
+
+@click.command()
+@click.argument('in-run1', type=click.Path(exists=True, file_okay=False))
+@click.argument('in-run2', type=click.Path(exists=True, file_okay=False))
+@click.option('--limit', type=click.INT, default=20,
+              help='Amount of functions to show.')
+def CLI(in_run1, in_run2, limit):
+    """Compare two profiling runs
+
+    The runs are directories created by the `--profile` option of the
+    pipeline scripts.
+
+    \b
+    Inputs:
+        run1 (dir): The first (base) profiling run.
+        run2 (dir): The second profiling run.
+    """
+    report1, stats1 = load_report(in_run1)
+    report2, stats2 = load_report(in_run2)
+
+    click.echo("{:<24} {:>16} {:>16} {:>10}".format(
+        '', report1['command'], report2['command'], 'ratio'))
+
+    for metric in ['wall_time', 'cpu_time', 'peak_traced_memory', 'max_rss']:
+        v1 = report1[metric]
+        v2 = report2[metric]
+        ratio = v2 / v1 if v1 else float('nan')
+        click.echo("{:<24} {:>16.3f} {:>16.3f} {:>10.2f}".format(
+            metric, v1, v2, ratio))
+
+    for direction in ['rows_in', 'rows_out']:
+        names = sorted(set(report1[direction]) | set(report2[direction]))
+        for name in names:
+            click.echo("{:<24} {:>16} {:>16}".format(
+                '{} {}'.format(direction, os.path.basename(name)),
+                report1[direction].get(name, '-'),
+                report2[direction].get(name, '-')))
+
+    click.echo()
+    click.echo("Functions with the biggest change in cumulative time:")
+    for function, ct1, ct2 in compare_stats(stats1, stats2, limit):
+        click.echo("{:>10.3f} {:>10.3f} {:>+10.3f}  {}".format(
+            ct1, ct2, ct2 - ct1, function))
+
+
+if __name__ == '__main__':
+    CLI()
@@ -2,10 +2,13 @@ import sqlite3
 
 import click
 
+from src.profiling import profile_option
+
 
 @click.command()
 @click.argument('tables', nargs=-1)
 @click.argument('io-db', type=click.Path(exists=True))
+@profile_option
 def CLI(tables, io_db):
     """Drop a list of tables from the database
 
@@ -1,11 +1,13 @@
 import click
 
-from src.util import load_pickle, save_pickle
+from src.artifacts import load_artifact, save_artifact
+from src.profiling import profile_option
 
 
 @click.command()
 @click.argument('in-dict', type=click.Path(exists=True))
 @click.argument('out-list', type=click.Path(writable=True))
+@profile_option
 def CLI(in_dict, out_list):
     """Extracts the values from a dictionary
 
@@ -17,9 +19,9 @@ def CLI(in_dict, out_list):
     Outputs:
         out-list (pkl): The list of values from the input dictionary.
     """
-    d = load_pickle(in_dict)
+    d = load_artifact(in_dict)
     l = list(d.values())
-    save_pickle(out_list, l)
+    save_artifact(out_list, l)
 
 
 if __name__ == '__main__':
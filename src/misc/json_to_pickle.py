@@ -1,11 +1,14 @@
 import click
 
-from src.util import load_json, save_pickle
+from src.artifacts import save_artifact
+from src.profiling import profile_option
+from src.util import load_json
 
 
 @click.command()
 @click.argument('in-json', type=click.Path(exists=True))
 @click.argument('out-pickle', type=click.Path(writable=True))
+@profile_option
 def CLI(in_json, out_pickle):
     """Converts a json file to pickle
 
@@ -18,7 +21,7 @@ def CLI(in_json, out_pickle):
         out-pickle (pkl): The converted pickle file
     """
     obj = load_json(in_json)
-    save_pickle(out_pickle, obj)
+    save_artifact(out_pickle, obj)
 
 
 if __name__ == '__main__':
@@ -1,6 +1,7 @@
 import click
 
-from src.util import load_pickle, save_pickle
+from src.artifacts import load_artifact, save_artifact
+from src.profiling import profile_option
 
 
 def link_dictionaries(d1, d2):
@@ -37,6 +38,7 @@ def link_dictionaries(d1, d2):
 @click.argument('in-dict1', type=click.Path(exists=True))
 @click.argument('in-dict2', type=click.Path(exists=True))
 @click.argument('out-dict', type=click.Path(writable=True))
+@profile_option
 def CLI(in_dict1, in_dict2, out_dict):
     """Link two dictionaries into a new dictionary
 
@@ -56,11 +58,11 @@ def CLI(in_dict1, in_dict2, out_dict):
         out-dict (pkl): The resulting dictionary, combining values from dict1
             and dict2.
     """
-    dict1 = load_pickle(in_dict1)
-    dict2 = load_pickle(in_dict2)
+    dict1 = load_artifact(in_dict1)
+    dict2 = load_artifact(in_dict2)
 
     new_dict = link_dictionaries(dict1, dict2)
-    save_pickle(out_dict, new_dict)
+    save_artifact(out_dict, new_dict)
 
 
 if __name__ == '__main__':
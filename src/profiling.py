@@ -0,0 +1,152 @@
+"""Profiling for the pipeline scripts
+
+Every script CLI can be decorated with `profile_option`, which adds a
+`--profile` flag to it. When the flag is set, the script runs under cProfile
+and tracemalloc and, at the end, a report directory is written at
+'reports/profile/<script>-<timestamp>-<pid>/' containing:
+
+    profile.prof    raw cProfile stats (open with pstats or snakeviz)
+    stats.txt       the functions with the highest cumulative time
+    report.json     wall/CPU time, peak memory and rows read/written
+
+Rows are recorded by the code that reads and writes data (see `count_rows`).
+Two reports can be compared with `python -m src.misc.compare_profiles`.
+"""
+import cProfile
+import io
+import json
+import os
+import pstats
+import resource
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from functools import wraps
+
+import click
+
+
+REPORTS_DIR = os.path.join('reports', 'profile')
+
+# the run being profiled (None when not profiling)
+_run = None
+
+
+def count_rows(direction, name, obj):
+    """Record the amount of rows read ('in') or written ('out') by a script
+
+    Only does something while profiling. Objects without a length are
+    ignored. Several calls with the same name are summed.
+
+    Args:
+        direction: Either 'in' or 'out'.
+        name: What has been read or written (a file path or a table name).
+        obj: The object read or written. Its length is the amount of rows.
+    """
+    if _run is None:
+        return
+
+    try:
+        rows = len(obj)
+    except TypeError:
+        return
+
+    counts = _run['rows_' + direction]
+    counts[name] = counts.get(name, 0) + rows
+
+
+def _command_name(f):
+    module = f.__module__
+    if module == '__main__':
+        # run as `python -m src.some.module`
+        spec = getattr(sys.modules['__main__'], '__spec__', None)
+        if spec is not None:
+            module = spec.name
+        else:
+            module = os.path.splitext(os.path.basename(sys.argv[0]))[0]
+    if module.startswith('src.'):
+        module = module[len('src.'):]
+    return module
+
+
+def _write_report(run_dir, run, profiler):
+    profiler.dump_stats(os.path.join(run_dir, 'profile.prof'))
+
+    stream = io.StringIO()
+    stats = pstats.Stats(profiler, stream=stream)
+    stats.sort_stats('cumulative').print_stats(50)
+    with open(os.path.join(run_dir, 'stats.txt'), mode='w') as f:
+        f.write(stream.getvalue())
+
+    with open(os.path.join(run_dir, 'report.json'), mode='w') as f:
+        json.dump(run, f, indent=2, sort_keys=True)
+
+
+def run_profiled(f, args, kwargs):
+    """Run a function under the profilers and write its report
+    """
+    global _run
+
+    name = _command_name(f)
+    started = datetime.now()
+    # runs of the same script can start within the same second (the Makefile
+    # runs some scripts twice in a row), so the name has the microseconds
+    # and the pid, and a directory that is already there is an error
+    run_dir = '{}-{:%Y%m%d-%H%M%S-%f}-{}'.format(name, started, os.getpid())
+    run_dir = os.path.join(REPORTS_DIR, run_dir)
+    os.makedirs(REPORTS_DIR, exist_ok=True)
+    os.makedirs(run_dir)
+
+    _run = {
+        'command': name,
+        'argv': sys.argv,
+        'started': started.isoformat(),
+        'rows_in': {},
+        'rows_out': {},
+    }
+    profiler = cProfile.Profile()
+
+    tracemalloc.start()
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    try:
+        profiler.enable()
+        return f(*args, **kwargs)
+    finally:
+        profiler.disable()
+        run = _run
+        run['wall_time'] = time.perf_counter() - wall_start
+        run['cpu_time'] = time.process_time() - cpu_start
+        run['peak_traced_memory'] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        # in kilobytes on linux
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        run['max_rss'] = usage.ru_maxrss * 1024
+
+        _run = None
+        _write_report(run_dir, run, profiler)
+        click.echo("Profile report saved to {}".format(run_dir), err=True)
+
+
+def profile_option(f):
+    """Add a --profile flag to a click command
+
+    Use it as the last decorator before the function:
+
+        @click.command()
+        @click.argument('in-file')
+        @profile_option
+        def CLI(in_file):
+            ...
+    """
+    @click.option('--profile', is_flag=True,
+                  help="Write a profiling report to '{}'.".format(REPORTS_DIR))
+    @wraps(f)
+    def wrapper(*args, **kwargs):
+        if not kwargs.pop('profile', False):
+            return f(*args, **kwargs)
+        return run_profiled(f, args, kwargs)
+
+    return wrapper
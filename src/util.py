@@ -2,25 +2,77 @@ import json
 import pickle
 import re
 
+from src.artifacts import PickleFormat
+from src.profiling import count_rows
+
 
 def load_json(filepath):
     with open(filepath, mode='rb') as f:
-        return json.load(f)
+        obj = json.load(f)
+    count_rows('in', filepath, obj)
+    return obj
 
 
 def save_json(filepath, obj):
     with open(filepath, mode='wb') as f:
         json.dump(obj, f)
+    count_rows('out', filepath, obj)
 
 
 def load_pickle(filepath):
-    with open(filepath, mode='rb') as f:
-        return pickle.load(f)
+    """Load a pickle file
+
+    Files saved by `artifacts.save_artifact` are read without their header
+    (see `artifacts.PickleFormat`), plain pickle files as they are.
+    """
+    obj, _ = PickleFormat().load(filepath)
+    count_rows('in', filepath, obj)
+    return obj
 
 
 def save_pickle(filepath, obj):
     with open(filepath, mode='wb') as f:
         pickle.dump(obj, f)
+    count_rows('out', filepath, obj)
+
+
+def iter_pickles(filepath):
+    """Iterate over the objects of a pickle stream
+
+    A pickle stream is a file with several pickled objects, one after the
+    other (see `append_pickles`). A file holding a single pickled list (as
+    written by `save_pickle`) is read as a stream of its items, and objects
+    appended to it after the list are read as well.
+    """
+    with open(filepath, mode='rb') as f:
+        first = True
+        while True:
+            try:
+                obj = pickle.load(f)
+            except EOFError:
+                return
+
+            if first and isinstance(obj, list):
+                objs = obj
+            else:
+                objs = [obj]
+            first = False
+
+            count_rows('in', filepath, objs)
+            yield from objs
+
+
+def append_pickles(filepath, objs):
+    """Append objects to a pickle stream, each one pickled on its own
+    """
+    with open(filepath, mode='ab') as f:
+        for obj in objs:
+            pickle.dump(obj, f)
+            count_rows('out', filepath, [obj])
+
+
+SPLIT_RE = re.compile(r'\W+')
+STRIP_RE = re.compile(r'^\W*(.*?)\W*$')
 
 
 def re_split(string):
@@ -33,7 +85,7 @@ def re_split(string):
         A list of strings, containing words that were separated by non-word
         characters.
     """
-    return re.split(r'\W+', string)
+    return SPLIT_RE.split(string)
 
 
 def re_strip(string):
@@ -45,4 +97,4 @@ def re_strip(string):
     Returns:
         A new string, without any leading or trailing non-word characters.
     """
-    return re.search(r'^\W*(.*?)\W*$', string).group(1)
+    return STRIP_RE.search(string).group(1)